@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from file.pdf import backfill_content_store
+
+class Command(BaseCommand):
+    help = 'MEDIA_ROOT直下にファイル名で保存された以前のファイルを、内容のハッシュで保存し直します'
+
+    def handle(self, *args, **options):
+        moved, missing = backfill_content_store()
+        self.stdout.write(self.style.SUCCESS(f'{moved}件のファイルを移行しました'))
+        if missing:
+            self.stdout.write(self.style.WARNING(f'{missing}件のファイルが見つかりませんでした'))
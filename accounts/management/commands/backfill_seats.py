@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from shift.models import ShiftLessonRelation, ShiftSeat, ShiftTemplateLessonRelation, ShiftTemplateSeat
+from shift.seats import backfill_seats
+
+class Command(BaseCommand):
+    help = 'シフト・シフトテンプレートの旧形式の席を席テーブルへ移行し、設定された席数に足りない空席を作成します'
+
+    def handle(self, *args, **options):
+        targets = [
+            ('シフトテンプレート', ShiftTemplateLessonRelation, ShiftTemplateSeat, 'template_lesson'),
+            ('シフト', ShiftLessonRelation, ShiftSeat, 'lesson'),
+        ]
+        for label, relation_model, seat_model, legacy_prefix in targets:
+            created, overflow = backfill_seats(relation_model, seat_model, legacy_prefix)
+            self.stdout.write(self.style.SUCCESS(f'{label}: {created}席を作成しました'))
+            if overflow:
+                self.stdout.write(self.style.WARNING(f'{label}: 設定された席数を超える席に{overflow}件の授業が登録されています'))
@@ -0,0 +1,204 @@
+import json
+import random
+import tempfile
+import time as time_module
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from accounts.models import CustomUser
+from file.jobs import run_job
+from file.models import PdfJob
+from invoice.models import Invoice
+from students.models import Student
+from shift.models import Shift, ShiftLessonRelation
+from special_lesson.models import SpecialLesson, SpecialLessonAdmin
+from special_lesson.request_grid import provision_student_requests, provision_teacher_requests
+from regular_lesson.models import Lesson
+from teacher_shift.models import TeacherShift
+from update_grade.rollover import rollover_fiscal_year
+from year_schedule.month_schedule import get_month_boundaries, invalidate_all_month_schedules
+from utils.choices import SUBJECT_CHOICES
+from utils.helpers import generate_shifts, generate_shifts_bulk
+from utils.benchmark import QueryCounter, seed_fiscal_year
+
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+
+# 講習会の合成データ(夏期講習の期間・生徒ごとのコマ数)を作成する
+def seed_special_lesson(start_date, rng):
+    special_lesson = SpecialLesson.objects.create(
+        name='夏期講習',
+        start_date=date(start_date.year, 7, 21),
+        end_date=date(start_date.year, 8, 31),
+    )
+    dates = [special_lesson.start_date + timedelta(days=i) for i in range((special_lesson.end_date - special_lesson.start_date).days + 1)]
+    dates = [day for day in dates if day.weekday() < 5]
+
+    subject_choices = [subject[0] for subject in SUBJECT_CHOICES]
+    students = list(Student.objects.values_list('id', 'grade'))
+    SpecialLessonAdmin.objects.bulk_create([
+        SpecialLessonAdmin(student_id=student_id, grade=grade, special_lesson=special_lesson, periods=rng.randint(4, 12), subject=rng.choice(subject_choices))
+        for student_id, grade in students
+    ])
+    provision_student_requests(special_lesson, [student_id for student_id, _ in students], dates)
+    provision_teacher_requests(special_lesson, list(CustomUser.objects.filter(is_teacher=True).values_list('id', flat=True)), dates)
+    return special_lesson
+
+# 生徒ごとに授業料以外の請求(教材費)を作成する
+def seed_invoices(year, month):
+    _, end_date_of_month = get_month_boundaries(year, month)
+    Invoice.objects.bulk_create([
+        Invoice(student_id=student_id, cost_name='教材費', price=1000, date=end_date_of_month)
+        for student_id in Student.objects.values_list('id', flat=True)
+    ], batch_size=1000)
+
+# 処理ごとの実行時間とクエリ数
+class Benchmark:
+    def __init__(self):
+        self.results = {}
+
+    @contextmanager
+    def measure(self, name):
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            started = time_module.perf_counter()
+            yield
+            elapsed = time_module.perf_counter() - started
+        self.results[name] = {'seconds': round(elapsed, 4), 'queries': queries.count}
+
+    def get(self, client, name, url, expected_status, **extra):
+        with self.measure(name):
+            response = client.get(url, **extra)
+        if response.status_code != expected_status:
+            raise CommandError(f'{name}: ステータス{response.status_code}が返されました')
+
+    def run_pdf_job(self, name, kind, year, month):
+        job = PdfJob.objects.create(kind=kind, params={'year': year, 'month': month})
+        with self.measure(name):
+            job = run_job(job.id)
+        if job.status != 'done':
+            raise CommandError(f'{name}: {job.error}')
+        self.results[name]['files'] = job.total
+
+# 基準の結果よりクエリ数が増えた処理を返す(実行時間は環境によって変わるため比較しない)
+def find_regressions(results, baseline):
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is not None and result['queries'] > expected['queries']:
+            regressions.append(f"{name}: {expected['queries']} -> {result['queries']}クエリ")
+    return regressions
+
+class Command(BaseCommand):
+    help = '合成した塾のデータで主要な処理の実行時間とクエリ数を計測し、JSONで出力します(データは最後にロールバック)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=300)
+        parser.add_argument('--teachers', type=int, default=40)
+        parser.add_argument('--lessons-per-student', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--skip-pdf', action='store_true', help='請求書・給与明細のPDF作成を計測しない')
+        parser.add_argument('--output', help='結果を書き出すJSONファイル(省略時は標準出力)')
+        parser.add_argument('--baseline', help='比較する以前の結果のJSONファイル(クエリ数が増えた場合はエラー)')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)['results']
+
+        benchmark = Benchmark()
+        # PDFは一時ディレクトリに保存し、テストクライアントのホスト名を許可する
+        # キャッシュはロールバックされないため、合成データの月間予定表などが共有のキャッシュに残らないようにプロセス内のキャッシュを使う
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root, ALLOWED_HOSTS=['testserver'], CACHES=BENCHMARK_CACHES):
+            with transaction.atomic():
+                rng = random.Random(options['seed'])
+                seed_started = time_module.perf_counter()
+                start_date, _ = seed_fiscal_year(
+                    options['students'],
+                    options['teachers'],
+                    options['lessons_per_student'],
+                    options['seed'],
+                )
+                special_lesson = seed_special_lesson(start_date, rng)
+                year, month = start_date.year, start_date.month
+                seed_invoices(year, month)
+                seed_seconds = time_module.perf_counter() - seed_started
+                Shift.objects.all().delete()
+                ShiftLessonRelation.objects.all().delete()
+
+                seed = {
+                    'seconds': round(seed_seconds, 4),
+                    'students': Student.objects.count(),
+                    'teachers': CustomUser.objects.filter(is_teacher=True).count(),
+                    'lessons': Lesson.objects.count(),
+                    'teacher_shifts': TeacherShift.objects.count(),
+                    'special_lesson_admins': SpecialLessonAdmin.objects.filter(special_lesson=special_lesson).count(),
+                    'invoices': Invoice.objects.count(),
+                }
+                self.run_benchmarks(benchmark, start_date, options['skip_pdf'])
+
+                # 合成データは保存しない
+                transaction.set_rollback(True)
+
+        report = {
+            'database': connection.vendor,
+            'options': {key: options[key] for key in ('students', 'teachers', 'lessons_per_student', 'seed', 'skip_pdf')},
+            'seed': seed,
+            'results': benchmark.results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+        if baseline is not None:
+            regressions = find_regressions(benchmark.results, baseline)
+            if regressions:
+                raise CommandError('クエリ数が増えました: ' + ', '.join(regressions))
+
+    def run_benchmarks(self, benchmark, start_date, skip_pdf):
+        year, month = start_date.year, start_date.month
+        _, end_date_of_month = get_month_boundaries(year, month)
+        dates = [start_date + timedelta(days=i) for i in range((end_date_of_month - start_date).days + 1)]
+        dates = [day for day in dates if day.weekday() < 5]
+
+        # 1日分(画面からの作成)と残りの1か月分(一括作成)
+        with benchmark.measure('generate_shifts'):
+            generate_shifts(dates[0])
+        with benchmark.measure('generate_shifts_bulk'):
+            generate_shifts_bulk(dates[1:])
+
+        client = Client()
+        client.force_login(CustomUser.objects.filter(is_owner=True).first())
+
+        iso_year, iso_week, iso_day = dates[0].isocalendar()
+        detail_url = reverse('owner:shift_detail', kwargs={'year': iso_year, 'week': iso_week, 'day': iso_day})
+        benchmark.get(client, 'ShiftDetailView', detail_url, 200)
+        reload_url = reverse('owner:shift_reload', kwargs={'year': iso_year, 'week': iso_week, 'day': iso_day})
+        benchmark.get(client, 'ShiftDetailReloadView', reload_url, 302, HTTP_REFERER=detail_url)
+
+        # キャッシュがない状態とキャッシュされた状態
+        invalidate_all_month_schedules()
+        print_url = reverse('owner:print_month_schedule', kwargs={'year': year, 'month': month})
+        benchmark.get(client, 'PrintMonthScheduleView', print_url, 200)
+        benchmark.get(client, 'PrintMonthScheduleView (cached)', print_url, 200)
+
+        if not skip_pdf:
+            benchmark.run_pdf_job('InvoicePDFView (bulk)', 'invoice', year, month)
+            benchmark.run_pdf_job('SalaryPDFView (bulk)', 'salary', year, month)
+
+        # 年度末の切り替え(未処理の固定授業・固定シフトを継続する最も重い場合)
+        with benchmark.measure('rollover_fiscal_year'):
+            rollover_fiscal_year(date(start_date.year + 1, 3, 1), continue_unupgraded=True, dry_run=True)
@@ -0,0 +1,61 @@
+import time as time_module
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from shift.models import Shift, ShiftLessonRelation
+from utils.benchmark import QueryCounter, legacy_generate_shifts, seed_fiscal_year, snapshot_shifts
+from utils.helpers import bulk_create_shifts_from_templates
+
+class Command(BaseCommand):
+    help = 'generate_shiftsの一括作成と従来の処理のクエリ数と実行時間を比較します(データは最後にロールバック)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=120)
+        parser.add_argument('--teachers', type=int, default=30)
+        parser.add_argument('--lessons-per-student', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.stdout.write('合成データを作成中...')
+            start_date, end_date = seed_fiscal_year(
+                options['students'],
+                options['teachers'],
+                options['lessons_per_student'],
+                options['seed'],
+            )
+            dates = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+            dates = [date for date in dates if date.weekday() < 5]
+            Shift.objects.all().delete()
+            ShiftLessonRelation.objects.all().delete()
+
+            legacy_queries = QueryCounter()
+            with connection.execute_wrapper(legacy_queries):
+                legacy_started = time_module.perf_counter()
+                for date in dates:
+                    legacy_generate_shifts(date)
+                legacy_elapsed = time_module.perf_counter() - legacy_started
+            legacy_result = snapshot_shifts()
+
+            ShiftLessonRelation.objects.all().delete()
+
+            bulk_queries = QueryCounter()
+            with connection.execute_wrapper(bulk_queries):
+                bulk_started = time_module.perf_counter()
+                bulk_create_shifts_from_templates(dates)
+                bulk_elapsed = time_module.perf_counter() - bulk_started
+            bulk_result = snapshot_shifts()
+
+            self.stdout.write(f'対象日数: {len(dates)} / 作成シフト数: {len(bulk_result)}')
+            self.stdout.write(f'従来: {legacy_queries.count}クエリ {legacy_elapsed:.3f}秒')
+            self.stdout.write(f'一括: {bulk_queries.count}クエリ {bulk_elapsed:.3f}秒')
+
+            if legacy_result == bulk_result:
+                self.stdout.write(self.style.SUCCESS('作成結果は一致しました'))
+            else:
+                self.stdout.write(self.style.ERROR('作成結果が一致しません'))
+
+            # 合成データは保存しない
+            transaction.set_rollback(True)
@@ -6,7 +6,8 @@ from django.db import transaction
 
 from accounts.models import CustomUser, OwnerProfile, TeacherProfile, ParentProfile
 from students.models import Student
-from shift.models import ShiftTemplate, ShiftTemplateLessonRelation
+from shift.models import ShiftTemplate, ShiftTemplateLessonRelation, ShiftTemplateSeat
+from shift.seats import create_seats
 from report_card.models import ReportGrade, SEMESTER_CHOICES
 from report_card.models import SUBJECT_CHOICES as REPORT_SUBJECT_CHOICES
 from vocabulary_test.models import TestResult, CATEGORY_CHOICES, PROGRAM_CHOICES, COUNT_CHOICES
@@ -44,6 +45,7 @@ def create_owner(username, last_name, first_name):
                 )
 
                 empty_classes = ShiftTemplateLessonRelation.objects.create()
+                create_seats(ShiftTemplateSeat, [empty_classes])
                 obj.lessons = empty_classes
                 obj.save()
 
@@ -59,6 +61,7 @@ def create_owner(username, last_name, first_name):
                 )
 
                 empty_classes = ShiftTemplateLessonRelation.objects.create()
+                create_seats(ShiftTemplateSeat, [empty_classes])
                 obj.lessons = empty_classes
                 obj.save()
 
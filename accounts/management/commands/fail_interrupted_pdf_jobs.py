@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from file.jobs import fail_interrupted_jobs
+
+class Command(BaseCommand):
+    help = '再起動で中断されたPDFの一括発行ジョブ(待機中・発行中)を失敗にします(Webプロセスの起動前に実行)'
+
+    def handle(self, *args, **options):
+        failed = fail_interrupted_jobs()
+        self.stdout.write(self.style.SUCCESS(f'{failed}件の中断されたジョブを失敗にしました'))
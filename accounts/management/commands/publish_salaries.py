@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import CustomUser
+from teacher_shift.batch import publish_salary_pdfs
+from utils.helpers import get_today
+
+class Command(BaseCommand):
+    help = '指定した月の全講師の給与明細を発行し、講師ごとの処理時間を表示します(退職した講師を除く)'
+
+    def add_arguments(self, parser):
+        today = get_today()
+        parser.add_argument('--year', type=int, default=today.year)
+        parser.add_argument('--month', type=int, default=today.month)
+        parser.add_argument('--workers', type=int, default=None)
+
+    def handle(self, *args, **options):
+        teachers = list(CustomUser.objects.filter(is_teacher=True, teacher_profile__is_withdrawn=False))
+        results, timings = publish_salary_pdfs(options['year'], options['month'], get_today(), '', teachers, workers=options['workers'])
+
+        for timing in timings:
+            self.stdout.write(f"{timing['name']}: {timing['seconds']:.3f}秒")
+        self.stdout.write(self.style.SUCCESS(f'{len(results)}件の給与明細を発行しました'))
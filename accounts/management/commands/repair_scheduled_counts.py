@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from special_lesson.counters import repair_scheduled_counts
+
+class Command(BaseCommand):
+    help = '講習の登録済みの授業数(SpecialLessonAdmin.scheduled_count)を実際の授業数から再計算します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='一致しない件数のみ表示します')
+
+    def handle(self, *args, **options):
+        mismatched = repair_scheduled_counts(repair=not options['check'])
+        if options['check']:
+            self.stdout.write(f'{mismatched}件の講習の授業数が一致しません')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{mismatched}件の講習の授業数を修正しました'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from notification.counters import repair_unread_counts
+
+class Command(BaseCommand):
+    help = 'ユーザーの未読の通知数(CustomUser.unread_notification_count)を実際の通知から再計算します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='一致しない件数のみ表示します')
+
+    def handle(self, *args, **options):
+        mismatched = repair_unread_counts(repair=not options['check'])
+        if options['check']:
+            self.stdout.write(f'{mismatched}人の未読数が一致しません')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{mismatched}人の未読数を修正しました'))
@@ -17,6 +17,8 @@ class CustomUser(AbstractUser):
     is_active = models.BooleanField(default=True)  # アカウントがアクティブかどうか
     is_staff = models.BooleanField(default=False)  # スタッフ権限を持つかどうか
     is_superuser = models.BooleanField(default=False)  # スーパーユーザーかどうか
+    # 未読の通知数(notification.countersで作成・確認時に更新し、repair_unread_countsで再計算)
+    unread_notification_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         
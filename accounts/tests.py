@@ -1,3 +1,105 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from accounts.management.commands.createusers import create_owner
+from accounts.models import CustomUser
+from regular_lesson.models import Lesson
+from students.models import Student
+from year_schedule.month_schedule import MONTH_SCHEDULE_VERSION_KEY
+from utils.profiling import QueryRecorder, get_view_stats, reset_view_stats
+
+@override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_N_PLUS_ONE_THRESHOLD=2)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        reset_view_stats()
+        self.addCleanup(reset_view_stats)
+        create_owner('owner', '塾長', '太郎')
+        self.owner = CustomUser.objects.get(is_owner=True)
+
+    def test_records_view_stats_and_logs(self):
+        self.client.force_login(self.owner)
+
+        with self.assertLogs('utils.profiling', level='INFO') as logs:
+            self.client.get(reverse('owner:dashboard'))
+
+        profile = json.loads(logs.records[0].getMessage())
+        self.assertEqual((profile['view_name'], profile['status']), ('owner:dashboard', 200))
+        self.assertGreater(profile['queries'], 0)
+        [stats] = get_view_stats()
+        self.assertEqual((stats['view_name'], stats['requests'], stats['queries']), ('owner:dashboard', 1, profile['queries']))
+
+        with self.assertLogs('utils.profiling', level='INFO'):
+            response = self.client.get(reverse('owner:profiling_stats'))
+        self.assertContains(response, 'owner:dashboard')
+
+    @override_settings(PROFILING_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        self.client.force_login(self.owner)
+        self.client.get(reverse('owner:dashboard'))
+        self.assertEqual(get_view_stats(), [])
+
+    def test_repeated_queries(self):
+        students = [Student.objects.create(last_name='生徒', first_name=f'{i}', grade=7) for i in range(3)]
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for student in students:
+                Student.objects.filter(id=student.id).first()
+            # IN句の要素数が異なるだけのSQLは同じSQLとして数える
+            list(Student.objects.filter(id__in=[students[0].id]))
+            list(Student.objects.filter(id__in=[student.id for student in students]))
+
+        self.assertEqual(recorder.count, 5)
+        [(sql, count)] = recorder.repeated_queries(2)
+        self.assertEqual(count, 3)
+        self.assertIn('LIMIT', sql)
+        self.assertEqual(len(recorder.repeated_queries(1)), 2)
+
+@override_settings(PDF_WORKERS=1, PROFILING_SAMPLE_RATE=0)
+class BenchmarkCommandTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.output = os.path.join(directory.name, 'benchmark.json')
+
+    def run_benchmark(self, **options):
+        call_command('benchmark', students=3, teachers=2, lessons_per_student=1, output=self.output, **options)
+        with open(self.output) as f:
+            return json.load(f)
+
+    def test_reports_hot_paths_and_rolls_back(self):
+        cache.clear()
+        report = self.run_benchmark()
+
+        self.assertEqual(report['seed']['students'], 3)
+        self.assertEqual(report['seed']['special_lesson_admins'], 3)
+        for name in ['generate_shifts', 'generate_shifts_bulk', 'ShiftDetailView', 'ShiftDetailReloadView', 'PrintMonthScheduleView',
+                     'InvoicePDFView (bulk)', 'SalaryPDFView (bulk)', 'rollover_fiscal_year']:
+            self.assertGreater(report['results'][name]['queries'], 0, name)
+        self.assertEqual(report['results']['InvoicePDFView (bulk)']['files'], 3)
+        # 合成データは残らない
+        self.assertFalse(Student.objects.exists())
+        self.assertFalse(Lesson.objects.exists())
+        # 合成データの月間予定表はアプリのキャッシュに残らない
+        self.assertIsNone(cache.get(MONTH_SCHEDULE_VERSION_KEY))
+
+    def test_baseline_regression(self):
+        report = self.run_benchmark(skip_pdf=True)
+        self.assertNotIn('InvoicePDFView (bulk)', report['results'])
+
+        baseline = os.path.join(os.path.dirname(self.output), 'baseline.json')
+        with open(baseline, 'w') as f:
+            json.dump(report, f)
+        self.run_benchmark(skip_pdf=True, baseline=baseline)
+
+        report['results']['ShiftDetailView']['queries'] = 0
+        with open(baseline, 'w') as f:
+            json.dump(report, f)
+        with self.assertRaisesMessage(CommandError, 'ShiftDetailView: 0 ->'):
+            self.run_benchmark(skip_pdf=True, baseline=baseline)
@@ -1,6 +1,12 @@
 #!/bin/sh
 python manage.py makemigrations --noinput
-python manage.py migrate --noinput
+# 移行に失敗した場合(既存データが一意制約に違反する場合など)は起動しない
+python manage.py migrate --noinput || exit 1
+python manage.py backfill_seats
+python manage.py backfill_file_store
+python manage.py repair_scheduled_counts
+python manage.py repair_unread_counts
+python manage.py fail_interrupted_pdf_jobs
 python manage.py collectstatic --noinput
 python manage.py createusers
 
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import File
+from .models import File, PdfJob
 
 # Register your models here.
-admin.site.register(File)
\ No newline at end of file
+admin.site.register(File)
+admin.site.register(PdfJob)
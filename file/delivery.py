@@ -0,0 +1,21 @@
+import os
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.http import content_disposition_header
+
+from .storage import content_storage
+
+# ファイルのレスポンスを返す
+# FILE_DELIVERY='nginx'の場合はX-Accel-Redirectでnginxのinternalなlocationに配信を任せる(Range・ETag・Last-Modifiedもnginxが処理)
+# それ以外(開発環境)はDjangoから直接返す
+# (ファイルは内容のハッシュで保存しているため、ダウンロード時のファイル名は表示名を使う)
+def serve_file(name, display_name=''):
+    filename = display_name or os.path.basename(name)
+    if settings.FILE_DELIVERY == 'nginx':
+        response = HttpResponse(content_type='application/pdf' if name.endswith('.pdf') else 'application/octet-stream')
+        response['X-Accel-Redirect'] = quote(settings.FILE_ACCEL_REDIRECT_PREFIX + name)
+        response['Content-Disposition'] = content_disposition_header(False, filename)
+        return response
+    return FileResponse(content_storage.open(name, 'rb'), filename=filename)
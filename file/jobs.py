@@ -0,0 +1,70 @@
+import logging
+import threading
+
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import PdfJob
+
+logger = logging.getLogger(__name__)
+
+# ジョブの種類ごとの処理(job, **paramsを受け取る)
+JOB_HANDLERS = {
+    'invoice': 'invoice.batch.run_invoice_job',
+    'salary': 'teacher_shift.batch.run_salary_job',
+}
+
+# ジョブを登録し、コミット後にバックグラウンドで実行する
+def enqueue_job(kind, params):
+    job = PdfJob.objects.create(kind=kind, params=params)
+    transaction.on_commit(lambda: start_job(job.id))
+    return job
+
+def start_job(job_id):
+    threading.Thread(target=run_job_in_thread, args=(job_id,), daemon=True).start()
+
+def run_job_in_thread(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        connections.close_all()
+
+def run_job(job_id):
+    job = PdfJob.objects.get(id=job_id)
+    job.status = 'running'
+    job.save(update_fields=['status'])
+
+    try:
+        handler = import_string(JOB_HANDLERS[job.kind])
+        handler(job, **job.params)
+        job.status = 'done'
+    except Exception as e:
+        logger.exception('PDF job %s failed', job.id)
+        job.status = 'failed'
+        job.error = str(e)
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+    return job
+
+# 再起動で中断された(待機中・発行中のまま残った)ジョブを失敗にする
+# ジョブはWebプロセスのスレッドで実行されるため、起動前に残っているものは実行されない
+def fail_interrupted_jobs():
+    return PdfJob.objects.filter(status__in=['queued', 'running']).update(
+        status='failed',
+        error='サーバーの再起動により中断されました。もう一度発行してください。',
+        finished_at=timezone.now(),
+    )
+
+def set_job_total(job, total):
+    job.total = total
+    job.save(update_fields=['total'])
+
+def set_job_progress(job, done, timings=None):
+    job.done = done
+    update_fields = ['done']
+    if timings is not None:
+        job.timings = timings
+        update_fields.append('timings')
+    job.save(update_fields=update_fields)
@@ -1,21 +1,64 @@
+import os
+
 from django.db import models
 from django.utils import timezone
 from accounts.models import CustomUser
+from .storage import content_storage
 
 # Create your models here.
 class File(models.Model):
     accessible_users = models.ManyToManyField(CustomUser)
-    file = models.FileField(upload_to='', blank=True, null=True)
+    # 内容のハッシュで保存したファイル(同じ内容のFileは同じファイルを参照する)
+    file = models.FileField(upload_to='', storage=content_storage, blank=True, null=True)
+    # 画面とダウンロード時(Content-Disposition)に表示するファイル名
+    display_name = models.CharField(max_length=255, blank=True)
     date = models.DateField()
     created_at = models.DateField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['display_name', 'date'], name='file_display_name_date_idx'),
+        ]
+
     def __str__(self):
-        return f'{self.file.name}' if self.file else None
+        return self.get_display_name() if self.file else None
+
+    # 以前の保存方法のファイルはファイル名がそのまま表示名
+    def get_display_name(self):
+        return self.display_name or os.path.basename(self.file.name)
 
     def delete(self, *args, **kwargs):
-        # ファイルが存在する場合は削除する
-        if self.file:
-            storage, path = self.file.storage, self.file.path
-            # ファイルを削除
-            storage.delete(path)
-        super().delete(*args, **kwargs)
\ No newline at end of file
+        name = self.file.name if self.file else None
+        super().delete(*args, **kwargs)
+        # 他のFileから参照されていない場合のみファイルを削除する
+        if name:
+            delete_unreferenced_files([name])
+
+# 参照するFileがなくなったファイルを削除する
+def delete_unreferenced_files(names):
+    referenced = set(File.objects.filter(file__in=names).values_list('file', flat=True))
+    for name in set(names) - referenced:
+        content_storage.delete(name)
+
+# PDFの一括発行ジョブ(進捗は画面からポーリングする)
+class PdfJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', '待機中'),
+        ('running', '発行中'),
+        ('done', '完了'),
+        ('failed', '失敗'),
+    ]
+
+    kind = models.CharField(max_length=20)
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    total = models.PositiveIntegerField(default=0)
+    done = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    # 1件ごとの処理時間 [{'name': 名前, 'seconds': 秒数}]
+    timings = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f'{self.kind} {self.get_status_display()} {self.done}/{self.total}'
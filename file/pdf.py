@@ -0,0 +1,113 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import File, delete_unreferenced_files
+from .storage import content_storage
+from .render import html_to_pdf, timed_html_to_pdf
+from utils.helpers import get_today
+
+# ファイルとFileオブジェクトをまとめて保存する件数
+PDF_BATCH_SIZE = 20
+
+def get_pdf_workers():
+    return getattr(settings, 'PDF_WORKERS', None) or os.cpu_count() or 1
+
+# 複数件を変換する場合はプロセスプールで並列に変換する
+@contextmanager
+def pdf_executor(workers=None):
+    if workers is None:
+        workers = get_pdf_workers()
+    if workers <= 1:
+        yield None
+        return
+
+    # スレッドから起動されるためforkではなくspawnで子プロセスを作成する
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        yield executor
+
+def render_pdfs(html_contents, executor=None):
+    if executor is None:
+        return [html_to_pdf(html_content) for html_content in html_contents]
+    return list(executor.map(html_to_pdf, html_contents))
+
+# [(PDF, 変換にかかった秒数)]を返す
+def render_pdfs_timed(html_contents, executor=None):
+    if executor is None:
+        return [timed_html_to_pdf(html_content) for html_content in html_contents]
+    return list(executor.map(timed_html_to_pdf, html_contents))
+
+def chunks(items, size=PDF_BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+# [(表示名, PDF, 閲覧できるユーザー)]をまとめて保存する(同じ月の同じ表示名のFileは新しいPDFに置き換える)
+# PDFは内容のハッシュで保存するため、作り直しても内容が同じ場合は書き込まない
+def save_pdf_files(documents, file_date):
+    display_names = [display_name for display_name, _, _ in documents]
+    existing = {
+        file_obj.get_display_name(): file_obj
+        for file_obj in File.objects.filter(Q(display_name__in=display_names) | Q(display_name='', file__in=display_names), date=file_date)
+    }
+
+    new_files = []
+    updated_files = []
+    replaced_names = []
+    file_objs = []
+    for display_name, pdf_data, _ in documents:
+        saved_name = content_storage.save_content(pdf_data)
+
+        file_obj = existing.get(display_name)
+        if file_obj is None:
+            file_obj = File(file=saved_name, display_name=display_name, date=file_date)
+            new_files.append(file_obj)
+        else:
+            if file_obj.file.name != saved_name:
+                replaced_names.append(file_obj.file.name)
+            file_obj.file = saved_name
+            file_obj.display_name = display_name
+            file_obj.created_at = get_today()
+            updated_files.append(file_obj)
+        file_objs.append(file_obj)
+
+    File.objects.bulk_create(new_files)
+    if updated_files:
+        File.objects.bulk_update(updated_files, ['file', 'display_name', 'created_at'])
+    # 置き換えた古いPDF
+    delete_unreferenced_files(replaced_names)
+
+    # アクセス可能なユーザーを追加
+    through = File.accessible_users.through
+    through.objects.bulk_create(
+        [
+            through(file_id=file_obj.id, customuser_id=user.id)
+            for file_obj, (_, _, users) in zip(file_objs, documents)
+            for user in users
+        ],
+        ignore_conflicts=True,
+    )
+    return file_objs
+
+# 以前の保存方法(MEDIA_ROOT直下に表示名で保存)のファイルを内容のハッシュで保存し直す((移行した件数, 見つからなかった件数)を返す)
+def backfill_content_store():
+    file_objs = []
+    legacy_names = []
+    missing = 0
+    for file_obj in File.objects.filter(display_name='').exclude(file='').exclude(file=None):
+        name = file_obj.file.name
+        if not content_storage.exists(name):
+            missing += 1
+            continue
+        with content_storage.open(name, 'rb') as f:
+            file_obj.file = content_storage.save_content(f.read())
+        file_obj.display_name = os.path.basename(name)
+        file_objs.append(file_obj)
+        legacy_names.append(name)
+
+    File.objects.bulk_update(file_objs, ['file', 'display_name'], batch_size=500)
+    delete_unreferenced_files(legacy_names)
+    return len(file_objs), missing
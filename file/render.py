@@ -0,0 +1,18 @@
+import time
+from io import BytesIO
+
+from xhtml2pdf import pisa
+
+# ワーカープロセス(spawn)から読み込まれるためDjangoに依存させない
+def html_to_pdf(html_content):
+    pdf_buffer = BytesIO()
+    pisa.CreatePDF(html_content, dest=pdf_buffer)
+    pdf_data = pdf_buffer.getvalue()
+    pdf_buffer.close()
+    return pdf_data
+
+# 変換にかかった時間(秒)も返す
+def timed_html_to_pdf(html_content):
+    started = time.perf_counter()
+    pdf_data = html_to_pdf(html_content)
+    return pdf_data, time.perf_counter() - started
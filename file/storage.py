@@ -0,0 +1,50 @@
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+# 作成したPDFの保存先(MEDIA_ROOT/pdf/ハッシュの先頭2文字/次の2文字/ハッシュ.pdf)
+CONTENT_DIRECTORY = 'pdf'
+
+# 内容のハッシュから保存先の名前を決める(同じ内容は同じ名前)
+def get_content_name(data, extension='.pdf'):
+    digest = hashlib.sha256(data).hexdigest()
+    return f'{CONTENT_DIRECTORY}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+# 内容のハッシュを名前にして保存するストレージ
+# 同じ名前のファイルが既にある場合は書き込まず、新しいファイルは一時ファイルに書いてからrenameする
+# (書き込み途中のファイルをnginxが配信することはない)
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # 同じ名前は同じ内容のため上書きしてよい
+        return name
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            return name
+
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+            # mkstempは本人のみ読める権限で作成するため、nginxが読めるように変更する
+            os.chmod(temp_path, settings.FILE_UPLOAD_PERMISSIONS or 0o644)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
+
+    # 内容(bytes)を保存して名前を返す
+    def save_content(self, data, extension='.pdf'):
+        return self.save(get_content_name(data, extension), ContentFile(data))
+
+content_storage = ContentAddressedStorage()
@@ -1,3 +1,124 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import date
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from accounts.management.commands.createusers import create_owner
+from accounts.models import CustomUser
+from file.models import File, PdfJob
+from file.pdf import save_pdf_files
+from file.storage import content_storage, get_content_name
+
+MEDIA_ROOT = tempfile.mkdtemp()
+CONTENT_MEDIA_ROOT = tempfile.mkdtemp()
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class FileDetailTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        create_owner('owner', '塾長', '太郎')
+        self.owner = CustomUser.objects.get(is_owner=True)
+        self.teachers = [CustomUser.objects.create(username=f'teacher-{i}', is_teacher=True) for i in range(2)]
+        with open(os.path.join(MEDIA_ROOT, '給与明細.pdf'), 'wb') as f:
+            f.write(b'%PDF-1.4')
+        self.file = File.objects.create(file='給与明細.pdf', date=date(2024, 6, 25))
+        self.file.accessible_users.add(self.teachers[0])
+
+    def test_django_delivery(self):
+        self.client.force_login(self.teachers[0])
+        response = self.client.get(reverse('teacher:file_detail', args=[self.file.pk]))
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4')
+
+        self.client.force_login(self.teachers[1])
+        self.assertEqual(self.client.get(reverse('teacher:file_detail', args=[self.file.pk])).status_code, 404)
+
+    @override_settings(FILE_DELIVERY='nginx')
+    def test_nginx_delivery(self):
+        self.client.force_login(self.teachers[0])
+        response = self.client.get(reverse('teacher:file_detail', args=[self.file.pk]))
+
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/%E7%B5%A6%E4%B8%8E%E6%98%8E%E7%B4%B0.pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn("filename*=utf-8''", response['Content-Disposition'])
+        self.assertEqual(response.content, b'')
+
+        # 塾長は全てのファイルを確認できる
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get(reverse('owner:file_detail', args=[self.file.pk])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('owner:file_detail', args=[self.file.pk + 1])).status_code, 404)
+
+@override_settings(MEDIA_ROOT=CONTENT_MEDIA_ROOT)
+class ContentStoreTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(CONTENT_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.teacher = CustomUser.objects.create(username='teacher', is_teacher=True)
+
+    def test_sharded_names_and_dedup(self):
+        name = get_content_name(b'%PDF-a')
+        self.assertRegex(name, r'^pdf/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.pdf$')
+        self.assertEqual(name[4:6] + name[7:9], name[10:14])
+
+        # 同じ内容の別のFileは同じファイルを参照する
+        first, second = save_pdf_files([('給与明細A.pdf', b'%PDF-a', [self.teacher]), ('給与明細B.pdf', b'%PDF-a', [])], date(2024, 6, 25))
+        self.assertEqual(first.file.name, name)
+        self.assertEqual(second.file.name, name)
+        self.assertEqual(str(first), '給与明細A.pdf')
+        self.assertFalse([entry for entry in os.listdir(os.path.dirname(content_storage.path(name))) if entry.startswith('.tmp-')])
+
+        # 一方を削除してもファイルは残る
+        first.delete()
+        self.assertTrue(content_storage.exists(name))
+        second.delete()
+        self.assertFalse(content_storage.exists(name))
+
+    def test_regenerate_replaces_file(self):
+        [file_obj] = save_pdf_files([('請求書.pdf', b'%PDF-old', [self.teacher])], date(2024, 6, 25))
+        old_name = file_obj.file.name
+
+        [file_obj] = save_pdf_files([('請求書.pdf', b'%PDF-new', [self.teacher])], date(2024, 6, 25))
+
+        self.assertEqual(File.objects.get().file.name, get_content_name(b'%PDF-new'))
+        self.assertFalse(content_storage.exists(old_name))
+
+    def test_backfill_legacy_files(self):
+        with open(os.path.join(CONTENT_MEDIA_ROOT, '2024年6月_給与明細.pdf'), 'wb') as f:
+            f.write(b'%PDF-legacy')
+        File.objects.create(file='2024年6月_給与明細.pdf', date=date(2024, 6, 25))
+        File.objects.create(file='見つからない.pdf', date=date(2024, 6, 25))
+
+        call_command('backfill_file_store', stdout=open(os.devnull, 'w'))
+
+        file_obj = File.objects.get(display_name='2024年6月_給与明細.pdf')
+        self.assertEqual(file_obj.file.name, get_content_name(b'%PDF-legacy'))
+        self.assertFalse(os.path.exists(os.path.join(CONTENT_MEDIA_ROOT, '2024年6月_給与明細.pdf')))
+        # 再実行しても変わらない
+        call_command('backfill_file_store', stdout=open(os.devnull, 'w'))
+        self.assertEqual(File.objects.get(display_name='2024年6月_給与明細.pdf').file.name, file_obj.file.name)
+
+class PdfJobTests(TestCase):
+    def test_fail_interrupted_jobs(self):
+        queued = PdfJob.objects.create(kind='invoice')
+        running = PdfJob.objects.create(kind='salary', status='running')
+        done = PdfJob.objects.create(kind='invoice', status='done')
+
+        call_command('fail_interrupted_pdf_jobs', stdout=open(os.devnull, 'w'))
+
+        for job in [queued, running]:
+            job.refresh_from_db()
+            self.assertEqual(job.status, 'failed')
+            self.assertTrue(job.error)
+            self.assertIsNotNone(job.finished_at)
+        done.refresh_from_db()
+        self.assertEqual(done.status, 'done')
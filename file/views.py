@@ -1,12 +1,15 @@
+from django.db.models import Exists, OuterRef
 from django.db.models.query import QuerySet
 from django.utils.decorators import method_decorator
 from django.urls import reverse_lazy
 from django.views import View
 from django.views.generic import ListView, DeleteView
-from django.http import Http404, FileResponse
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
 
 from accounts.decorators import user_type_required
-from .models import File
+from .delivery import serve_file
+from .models import File, PdfJob
 
 @method_decorator(user_type_required(), name='dispatch')
 class OwnerFileListView(ListView):
@@ -50,14 +53,18 @@ class FileDetailView(View):
     def get(self, request, pk, file_pk=None):
         # 保護者の場合のみ
         if request.user.is_parent:
-            file_obj = File.objects.get(pk=file_pk)
+            files = File.objects.filter(pk=file_pk)
         else:
-            file_obj = File.objects.get(pk=pk)
-        
-        if not (request.user.is_owner or request.user in file_obj.accessible_users.all()):
+            files = File.objects.filter(pk=pk)
+
+        # 権限の確認とファイル名の取得を1回のクエリで行う(塾長は全てのファイル)
+        if not request.user.is_owner:
+            files = files.filter(Exists(File.accessible_users.through.objects.filter(file_id=OuterRef('pk'), customuser_id=request.user.id)))
+        file_obj = files.values_list('file', 'display_name').first()
+        if not file_obj or not file_obj[0]:
             raise Http404("このファイルへのアクセス権限がありません。")
-        
-        return FileResponse(file_obj.file)
+
+        return serve_file(*file_obj)
 
 @method_decorator(user_type_required(), name='dispatch')
 class FileDeleteView(DeleteView):
@@ -65,4 +72,18 @@ class FileDeleteView(DeleteView):
     model = File
 
     def get_success_url(self):
-        return reverse_lazy('owner:file_list')
\ No newline at end of file
+        return reverse_lazy('owner:file_list')
+
+# PDFの一括発行ジョブの進捗
+@method_decorator(user_type_required(), name='dispatch')
+class PdfJobStatusView(View):
+    def get(self, request, pk):
+        job = get_object_or_404(PdfJob, pk=pk)
+        return JsonResponse({
+            'status': job.status,
+            'status_display': job.get_status_display(),
+            'total': job.total,
+            'done': job.done,
+            'error': job.error,
+            'timings': job.timings,
+        })
@@ -0,0 +1,160 @@
+import calendar
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+from django.db.models import Count, Q
+from django.template.loader import render_to_string
+
+from .models import Invoice, PaidInvoice
+from file.jobs import set_job_total, set_job_progress
+from file.pdf import get_pdf_workers, pdf_executor, render_pdfs, save_pdf_files, chunks
+from regular_lesson.models import RegularLessonAdmin, Lesson
+from students.models import Student
+from utils.constants import price_settings
+from utils.helpers import get_fiscal_year_boundaries, is_school_day, get_today
+
+LESSON_COST_NAME = '授業料'
+
+def get_invoice_file_name(year, month, student):
+    return f'{year}年{month}月_請求書_{student.last_name}{student.first_name}様.pdf'
+
+def get_parent_user(student):
+    parents = list(student.parent.all())
+    return parents[0].user if parents else None
+
+# 対象の生徒全員の請求書の内容をまとめて計算する
+def build_invoice_contexts(year, month, billing_date, remarks, students):
+    start_date_of_month = date(year, month, 1)
+    end_date_of_month = date(year, month, calendar.monthrange(year, month)[1])
+    _, end_date = get_fiscal_year_boundaries(start_date_of_month)
+    student_ids = [student.id for student in students]
+
+    # 生徒ごと・曜日ごとの通常授業の数
+    regular_lesson_admins = RegularLessonAdmin.objects.filter(student_id__in=student_ids, end_date=end_date).order_by()
+    weekday_lessons = defaultdict(dict)
+    for student_id, day, count in regular_lesson_admins.values('student_id', 'day').annotate(count=Count('id')).values_list('student_id', 'day', 'count'):
+        weekday_lessons[student_id][day] = count
+
+    # 今月から始まったRegularLessonAdminが存在する生徒は日割りで計算
+    prorated_student_ids = set(regular_lesson_admins.filter(start_date__gte=start_date_of_month).values_list('student_id', flat=True))
+    actual_lesson_counts = dict(
+        Lesson.objects.filter(student_id__in=prorated_student_ids, date__gte=start_date_of_month, date__lte=end_date_of_month)
+        .filter(Q(is_regular=True) | Q(is_temporaly=True))
+        .order_by().values('student_id').annotate(count=Count('id')).values_list('student_id', 'count')
+    )
+
+    # 休校日を除いた曜日ごとの日数(月曜日が1)
+    day_counts = Counter(
+        current_date.isoweekday()
+        for current_date in (start_date_of_month + timedelta(days=i) for i in range(end_date_of_month.day))
+        if is_school_day(current_date)
+    )
+
+    lesson_invoices = {
+        invoice.student_id: invoice
+        for invoice in Invoice.objects.filter(student_id__in=student_ids, cost_name=LESSON_COST_NAME, date=end_date_of_month)
+    }
+    other_invoices = defaultdict(list)
+    for invoice in Invoice.objects.filter(student_id__in=student_ids, date__year=year, date__month=month).exclude(cost_name=LESSON_COST_NAME).order_by('id'):
+        other_invoices[invoice.student_id].append(invoice)
+
+    # 前月の振り込みが完了しているか
+    previous_month = start_date_of_month - timedelta(days=1)
+    parent_users = {student.id: get_parent_user(student) for student in students}
+    bank_infos = {}
+    for paid_invoice in PaidInvoice.objects.filter(
+        parent_id__in=[user.id for user in parent_users.values() if user],
+        date__year=previous_month.year,
+        date__month=previous_month.month,
+    ).order_by('id'):
+        bank_infos.setdefault(paid_invoice.parent_id, paid_invoice)
+
+    new_invoices = []
+    updated_invoices = []
+    items = []
+    for student in students:
+        lessons = weekday_lessons[student.id]
+
+        # 日割りの計算用
+        price_rate = None
+        if student.id in prorated_student_ids:
+            full_lesson_count = sum(count * day_counts[day] for day, count in lessons.items())
+            if full_lesson_count:
+                price_rate = actual_lesson_counts.get(student.id, 0) / full_lesson_count
+
+        # 週に受ける授業の回数を計算
+        lessons_per_week = min(sum(lessons.values()), 5)
+        if lessons_per_week:
+            base_price = price_settings[student.grade][lessons_per_week]
+        else:
+            base_price = 0
+
+        if not price_rate:
+            price = base_price
+        else:
+            price = base_price * price_rate
+        price = int(price)
+
+        lesson_invoice = lesson_invoices.get(student.id)
+        if lesson_invoice is None:
+            lesson_invoice = Invoice(student=student, cost_name=LESSON_COST_NAME, date=end_date_of_month, price=price)
+            new_invoices.append(lesson_invoice)
+        else:
+            lesson_invoice.price = price
+            updated_invoices.append(lesson_invoice)
+
+        invoices = [lesson_invoice] + other_invoices[student.id]
+        parent_user = parent_users[student.id]
+        context = {
+            'year': year,
+            'month': month,
+            'student': student,
+            'billing_date': billing_date,
+            'invoices': invoices,
+            'price': price,
+            'total_price': price + sum(invoice.price or 0 for invoice in other_invoices[student.id]),
+            'remarks': remarks,
+            'bank_info': bank_infos.get(parent_user.id, False) if parent_user else False,
+        }
+        items.append((student, parent_user, context))
+
+    Invoice.objects.bulk_create(new_invoices)
+    if updated_invoices:
+        Invoice.objects.bulk_update(updated_invoices, ['price'])
+
+    return items
+
+# 請求書のPDFを作成して保存する。[(生徒, PDF)]を返す
+def publish_invoice_pdfs(year, month, billing_date, remarks, students, workers=None, progress=None):
+    items = build_invoice_contexts(year, month, billing_date, remarks, students)
+    results = []
+
+    with pdf_executor(min(workers or get_pdf_workers(), len(items))) as executor:
+        for batch in chunks(items):
+            html_contents = [render_to_string('owner/invoice_pdf.html', context) for _, _, context in batch]
+            pdfs = render_pdfs(html_contents, executor)
+            save_pdf_files(
+                [
+                    (get_invoice_file_name(year, month, student), pdf_data, [parent_user] if parent_user else [])
+                    for (student, parent_user, _), pdf_data in zip(batch, pdfs)
+                ],
+                date(year, month, 1),
+            )
+            results.extend((student, pdf_data) for (student, _, _), pdf_data in zip(batch, pdfs))
+            if progress:
+                progress(len(results))
+
+    return results
+
+# 全生徒の請求書を発行するジョブ(休塾、退塾を除く)
+def run_invoice_job(job, year, month, billing_date=None, remarks=None):
+    students = list(Student.objects.filter(is_on_leave=False, is_withdrawn=False).prefetch_related('parent__user'))
+    set_job_total(job, len(students))
+    publish_invoice_pdfs(
+        year,
+        month,
+        billing_date or get_today(),
+        remarks,
+        students,
+        progress=lambda done: set_job_progress(job, done),
+    )
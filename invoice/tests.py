@@ -1,3 +1,98 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import date
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.management.commands.createusers import create_owner
+from accounts.models import CustomUser, ParentProfile
+from file.jobs import run_job
+from file.models import File, PdfJob
+from invoice.batch import build_invoice_contexts, publish_invoice_pdfs
+from invoice.models import Invoice
+from regular_lesson.models import RegularLessonAdmin
+from students.models import Student
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, PDF_WORKERS=1)
+class InvoiceBatchTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        create_owner('owner', '塾長', '太郎')
+        self.owner = CustomUser.objects.get(is_owner=True)
+
+    def create_student(self, i, days=(1, 3)):
+        student = Student.objects.create(last_name='生徒', first_name=f'{i}', grade=7)
+        parent = CustomUser.objects.create(username=f'parent-{i}', is_parent=True)
+        ParentProfile.objects.create(user=parent, current_student=student).student.add(student)
+        for day in days:
+            RegularLessonAdmin.objects.create(
+                student=student, grade=7, subject=1, day=day, time=1,
+                start_date=date(2024, 3, 1), end_date=date(2025, 2, 28),
+            )
+        return student
+
+    def get_students(self):
+        return list(Student.objects.prefetch_related('parent__user'))
+
+    def test_lesson_invoice_and_total(self):
+        student = self.create_student(0)
+        Invoice.objects.create(student=student, cost_name='教材費', price=1000, date=date(2024, 6, 10))
+
+        [(_, _, context)] = build_invoice_contexts(2024, 6, date(2024, 6, 25), '', self.get_students())
+
+        # 中1で週2コマ
+        self.assertEqual(context['price'], 14600)
+        self.assertEqual(context['total_price'], 15600)
+        self.assertEqual(Invoice.objects.get(student=student, cost_name='授業料').price, 14600)
+
+    def test_query_count_does_not_depend_on_students(self):
+        self.create_student(0)
+        with CaptureQueriesContext(connection) as queries:
+            build_invoice_contexts(2024, 6, date(2024, 6, 25), '', self.get_students())
+        single = len(queries)
+
+        for i in range(1, 6):
+            self.create_student(i)
+        with CaptureQueriesContext(connection) as queries:
+            build_invoice_contexts(2024, 7, date(2024, 7, 25), '', self.get_students())
+
+        self.assertEqual(len(queries), single)
+
+    def test_publish_files_for_parents(self):
+        students = [self.create_student(i) for i in range(3)]
+
+        results = publish_invoice_pdfs(2024, 6, date(2024, 6, 25), '', self.get_students())
+        # 2回目は同じファイルを上書きする
+        publish_invoice_pdfs(2024, 6, date(2024, 6, 25), '', self.get_students())
+
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(pdf_data.startswith(b'%PDF') for _, pdf_data in results))
+        self.assertEqual(File.objects.count(), 3)
+        for student in students:
+            file_obj = File.objects.get(display_name=f'2024年6月_請求書_{student.last_name}{student.first_name}様.pdf')
+            self.assertEqual(list(file_obj.accessible_users.all()), [student.parent.get().user])
+
+    def test_enqueue_and_run_job(self):
+        for i in range(2):
+            self.create_student(i)
+        self.client.force_login(self.owner)
+
+        response = self.client.post(reverse('owner:invoice_pdf'), {'year': 2024, 'month': 6})
+        job = PdfJob.objects.get()
+        self.assertRedirects(response, f"{reverse('owner:invoice_pdf')}?job={job.id}")
+        self.assertEqual(job.status, 'queued')
+
+        run_job(job.id)
+
+        status = self.client.get(reverse('owner:pdf_job_status', args=[job.id])).json()
+        self.assertEqual((status['status'], status['done'], status['total']), ('done', 2, 2))
+        self.assertEqual(File.objects.count(), 2)
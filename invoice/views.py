@@ -1,8 +1,6 @@
-from datetime import date, timedelta
-import os
+from datetime import date
 import calendar
 import json
-from io import BytesIO
 
 from django.http import HttpResponseRedirect, JsonResponse, HttpResponse
 from django.urls import reverse_lazy
@@ -10,26 +8,19 @@ from django.views.generic import ListView, TemplateView, View, UpdateView
 from django.utils.decorators import method_decorator
 from django.shortcuts import redirect
 from django.db.models import Q, Sum
-from django.core.files.base import ContentFile
-from django.core.exceptions import ObjectDoesNotExist
-from django.template.loader import render_to_string
 from django.contrib import messages
 from django.utils.decorators import method_decorator
-from django.conf import settings
 
 from .models import Invoice, PaidInvoice
 from .forms import InvoiceForm
+from .batch import publish_invoice_pdfs, get_invoice_file_name
 from accounts.decorators import user_type_required
 from accounts.models import CustomUser
 from students.models import Student
-from file.models import File
-from regular_lesson.models import RegularLessonAdmin, Lesson
-from year_schedule.models import Event
-from utils.choices import GRADE_CHOICES, DAY_CHOICES
-from utils.constants import price_settings
-from utils.helpers import get_fiscal_year_boundaries, get_today
-
-from xhtml2pdf import pisa
+from file.models import PdfJob
+from file.jobs import enqueue_job
+from utils.choices import GRADE_CHOICES
+from utils.helpers import get_today
 
 @method_decorator(user_type_required(), name='dispatch')
 class InvoiceListView(ListView):
@@ -176,150 +167,35 @@ class InvoicePDFView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['students'] = Student.objects.all()
+        job_id = self.request.GET.get('job')
+        if job_id:
+            context['job'] = PdfJob.objects.filter(id=job_id, kind='invoice').first()
         return context
     
     def post(self, request, *args, **kwargs):
         year = int(request.POST.get('year'))
         month = int(request.POST.get('month'))
         student_id = request.POST.get('student_id')
-        billing_date = request.POST.get('billing_date') or get_today()
+        billing_date = request.POST.get('billing_date') or None
         remarks = request.POST.get('remarks')
-        start_date_of_month = date(year, month, 1)
-        end_date_of_month = date(year, month, calendar.monthrange(year, month)[1])
-        
-        def publish_pdf(student_id):
-            student = Student.objects.get(id=student_id)
-            grade = student.grade
-            # 日割りの計算用
-            price_rate = None
-            _, end_date = get_fiscal_year_boundaries(start_date_of_month)
-
-            # 今月から始まったRegularLessonAdminが存在する場合(尚且つ終了日が年度末)
-            if RegularLessonAdmin.objects.filter(student=student, start_date__gte=start_date_of_month, end_date=end_date).exists():
-
-                # 各曜日の授業数
-                weekday_lessons = [RegularLessonAdmin.objects.filter(student=student, day=day[0], end_date=end_date).count() for day in DAY_CHOICES]
-
-                # 全て授業があった場合の授業数
-                full_lesson_count = 0
-
-                current_date = start_date_of_month
-                while current_date <= end_date_of_month:
-                    # 休校日でない場合のみ計算
-                    if not Event.objects.filter(date=current_date, is_closure=True).exists():
-                        weekday = current_date.weekday() # 0が日曜日,1が月曜日,6が土曜日
-                    
-                        # 月曜日から金曜日までのみ計算
-                        if DAY_CHOICES[0][0] <= int(weekday) <= DAY_CHOICES[-1][0]:
-                            full_lesson_count += weekday_lessons[weekday-1]
-                            
-                        current_date += timedelta(days=1)
-
-                actual_lesson_count = Lesson.objects.filter(
-                    Q(student=student, date__gte=start_date_of_month, date__lte=end_date_of_month, is_regular=True) or Q(student=student, date__gte=start_date_of_month, date__lte=end_date_of_month, is_temporaly=True)
-                ).count()
-
-                price_rate = actual_lesson_count / full_lesson_count
-
-            # 週に受ける授業の回数を計算
-            lessons_per_week = min(RegularLessonAdmin.objects.filter(student=student, end_date=end_date).count(), 5)
-            if lessons_per_week:
-                base_price = price_settings[grade][lessons_per_week]
-            else:
-                base_price = 0
-
-            if not price_rate:
-                price = base_price
-            else:
-                price = base_price * price_rate
-            
-            # 合計を計算
-            price = int(price)
-            invoices = []
-            total_price = price
-            lesson_invoice, _ = Invoice.objects.get_or_create(
-                student=student,
-                cost_name='授業料',
-                date=end_date_of_month,
-            )
-            lesson_invoice.price = price
-            lesson_invoice.save()
-            invoices.append(lesson_invoice)
-            other_invoices = Invoice.objects.filter(
-                student=student,
-                date__year=year,
-                date__month=month,
-            ).exclude(cost_name='授業料')
-            for invoice in other_invoices:
-                invoices.append(invoice)
-                total_price += invoice.price
-
-            # 振り込み完了か確認
-            parent = student.parent.all()[0].user
-            if month == 1:  # 現在が1月の場合、前の月は前年の12月
-                previous_year = year - 1
-                previous_month = 12
-            else:
-                previous_year = year
-                previous_month = month - 1
-            try:
-                # PaidInvoiceオブジェクトが存在している場合のみTrue
-                bank_info = PaidInvoice.objects.get(parent=parent, date__year=previous_year, date__month=previous_month)
-            except ObjectDoesNotExist:
-                bank_info = False
-
-            context = {
-                'year': year,
-                'month': month,
-                'student': student,
-                'billing_date': billing_date,
-                'invoices': invoices,
-                'price': price,
-                'total_price': total_price,
-                'remarks': remarks,
-                'bank_info': bank_info,
-            }
-
-            html_content = render_to_string('owner/invoice_pdf.html', context)
-            
-            pdf_buffer = BytesIO()
-            pisa.CreatePDF(html_content, dest=pdf_buffer)
-            pdf_data = pdf_buffer.getvalue()
-            pdf_buffer.close()
-
-            file_name = f'{year}年{month}月_請求書_{student.last_name}{student.first_name}様.pdf'
-            file_path = os.path.join(settings.MEDIA_ROOT, file_name)
-
-            # ファイルが存在する場合は削除
-            if os.path.exists(file_path):
-                os.remove(file_path)
-
-            file_obj, created = File.objects.get_or_create(file=file_name, date=date(year, month, 1))
-            file_obj.file.save(file_name, ContentFile(pdf_data), save=True)
-            if not created:
-                file_obj.created_at = get_today()
-                file_obj.save()
-
-            # アクセス可能なユーザーを追加
-            file_obj.accessible_users.add(student.parent.all()[0].user)
-
-            return pdf_data
 
         # 一人のみの作成
         if student_id:
-            pdf_data = publish_pdf(student_id)
-            student = Student.objects.get(id=student_id)
+            student = Student.objects.prefetch_related('parent__user').get(id=student_id)
+            [(_, pdf_data)] = publish_invoice_pdfs(year, month, billing_date or get_today(), remarks, [student], workers=1)
             response = HttpResponse(pdf_data, content_type='application/pdf')
-            response['Content-Disposition'] = f'inline; filename={year}年{month}月_請求書_{student.last_name}{student.first_name}様.pdf'
+            response['Content-Disposition'] = f'inline; filename={get_invoice_file_name(year, month, student)}'
             return response
 
-        # 全生徒の作成(休塾、退塾を除く)
+        # 全生徒の作成はバックグラウンドで実行し、画面で進捗を表示する
         else:
-            students = Student.objects.filter(is_on_leave=False, is_withdrawn=False)
-            for student in students:
-                publish_pdf(student.id)
-            messages.success(self.request, 'PDFの発行が完了しました。')
-            return HttpResponseRedirect(reverse_lazy('owner:invoice_pdf'))
+            job = enqueue_job('invoice', {
+                'year': year,
+                'month': month,
+                'billing_date': billing_date,
+                'remarks': remarks,
+            })
+            return HttpResponseRedirect(f"{reverse_lazy('owner:invoice_pdf')}?job={job.id}")
 
 @method_decorator(user_type_required(), name='dispatch')
 class PaidInvoiceListView(ListView):
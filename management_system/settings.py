@@ -91,6 +91,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'utils.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'management_system.urls'
@@ -123,6 +124,14 @@ CHANNEL_LAYERS = {
     },
 }
 
+# カレンダー・月間予定表などのキャッシュはプロセス間で共有する(チャネルレイヤーとはDBを分ける)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_URL', 'redis://redis:6379/1'),
+    }
+}
+
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
@@ -211,3 +220,40 @@ STATIC_URL = "/static/"
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = ''
+
+# PDFの一括発行に使うプロセス数(未設定の場合はCPU数)
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', 0)) or None
+
+# 計測するリクエストの割合(0で無効)と、N+1とみなす同じSQLの実行回数
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0.1))
+PROFILING_N_PLUS_ONE_THRESHOLD = int(os.environ.get('PROFILING_N_PLUS_ONE_THRESHOLD', 10))
+
+# 計測結果はutils.profilingのロガーから1リクエスト1行のJSONで出力する
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'utils.profiling': {
+            'handlers': ['console'],
+            'level': os.environ.get('PROFILING_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# シフト表の1コマ(教室×時間)あたりの席数(変更した場合はbackfill_seatsで席を作成)
+SHIFT_SEAT_COUNT = int(os.environ.get('SHIFT_SEAT_COUNT', 4))
+
+# WebSocketで受け取った通知は溜めておき、この間隔(秒)か件数ごとにまとめて保存する
+NOTIFICATION_FLUSH_INTERVAL = float(os.environ.get('NOTIFICATION_FLUSH_INTERVAL', 0.25))
+NOTIFICATION_FLUSH_SIZE = int(os.environ.get('NOTIFICATION_FLUSH_SIZE', 500))
+
+# ファイルの配信方法('nginx'の場合はX-Accel-Redirectでnginxが配信し、それ以外はDjangoから返す)
+FILE_DELIVERY = os.environ.get('FILE_DELIVERY', 'django')
+# nginxでMEDIA_ROOTを配信するinternalなlocation
+FILE_ACCEL_REDIRECT_PREFIX = os.environ.get('FILE_ACCEL_REDIRECT_PREFIX', '/protected-media/')
@@ -0,0 +1,52 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from accounts.models import CustomUser
+from .counters import count_created_notifications
+from .groups import get_role_group
+from .models import Notification
+
+# 送信先ごとの役割
+SEND_TO_ROLES = {
+    'teacher': ['teacher'],
+    'parent': ['parent'],
+    'all': ['teacher', 'parent'],
+}
+
+# 宛先のユーザーID(無効化されたアカウントには保存しない)
+def get_recipient_ids(send_to):
+    users = CustomUser.objects.filter(is_active=True)
+    if send_to == 'teacher':
+        users = users.filter(is_teacher=True)
+    elif send_to == 'parent':
+        users = users.filter(is_parent=True)
+    else:
+        users = users.exclude(is_owner=True)
+    return list(users.values_list('id', flat=True))
+
+# 役割のグループごとに1回ずつ送信する(接続中の画面に表示)
+def publish_broadcast(roles, message, is_priority, sender_id):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    for role in roles:
+        async_to_sync(channel_layer.group_send)(get_role_group(role), {
+            'type': 'broadcast',
+            'sender_id': sender_id,
+            'message': message,
+            'is_priority': is_priority,
+        })
+
+# 送信先('teacher', 'parent', 'all')の全員に通知を作成し、コミット後にWebSocketで送信する(作成した件数を返す)
+# 未読数は全員分を1回のUPDATEで増やし、画面側はbroadcastを受け取った時に未読数を1つ増やす
+def broadcast_notification(sender, send_to, message, is_priority=False):
+    recipient_ids = get_recipient_ids(send_to)
+    with transaction.atomic():
+        notifications = Notification.objects.bulk_create([
+            Notification(user_id=user_id, message=message, is_priority=is_priority, sender=sender)
+            for user_id in recipient_ids
+        ], batch_size=1000)
+        count_created_notifications(notifications)
+        transaction.on_commit(lambda: publish_broadcast(SEND_TO_ROLES[send_to], message, is_priority, sender.id))
+    return len(recipient_ids)
@@ -0,0 +1,54 @@
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from .counters import count_created_notifications, publish_unread_counts
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+# 通知をまとめて保存し、受信者の未読数を更新する
+def save_notifications(notifications):
+    with transaction.atomic():
+        notifications = Notification.objects.bulk_create(notifications, batch_size=settings.NOTIFICATION_FLUSH_SIZE)
+        count_created_notifications(notifications)
+        publish_unread_counts(notification.user_id for notification in notifications)
+    return notifications
+
+# 通知をメモリに溜めておき、一定時間ごと(または一定件数ごと)にbulk_createでまとめて保存する
+# 接続中の全員が同時に送信しても、保存と未読数の更新のクエリ数は間隔あたり数回に抑えられる
+# (プロセスが強制終了した場合、保存前の通知は失われる)
+class NotificationBuffer:
+    def __init__(self):
+        self.pending = []
+        self.flush_handle = None
+
+    async def add(self, notification):
+        self.pending.append(notification)
+        if len(self.pending) >= settings.NOTIFICATION_FLUSH_SIZE:
+            await self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(settings.NOTIFICATION_FLUSH_INTERVAL, self.schedule_flush)
+
+    def schedule_flush(self):
+        self.flush_handle = None
+        asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        # 保存中に追加された通知は次回にまわす
+        notifications, self.pending = self.pending, []
+        if not notifications:
+            return []
+        try:
+            return await sync_to_async(save_notifications)(notifications)
+        except Exception:
+            logger.exception('Failed to save %s notifications', len(notifications))
+            return []
+
+notification_buffer = NotificationBuffer()
@@ -1,37 +1,56 @@
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from asgiref.sync import sync_to_async
-from regular_lesson.models import Lesson
 from accounts.models import CustomUser
 from notification.models import Notification
+from notification.buffer import notification_buffer
+from notification.groups import get_user_group, get_role_group, get_user_role
+
+@sync_to_async
+def get_owner_id():
+    return CustomUser.objects.filter(is_owner=True).values_list('id', flat=True).first()
 
 class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        self.group_name = "notification"
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        self.user = self.scope.get('user')
+        if self.user is None or not self.user.is_authenticated:
+            await self.close()
+            return
+
+        # 本人宛てと役割(塾長・講師・保護者)宛てのグループにだけ参加する
+        self.group_names = [get_user_group(self.user.id)]
+        role = get_user_role(self.user)
+        if role is not None:
+            self.group_names.append(get_role_group(role))
+        for group_name in self.group_names:
+            await self.channel_layer.group_add(group_name, self.channel_name)
+
+        # 連絡の宛先(塾長)は接続時に1回だけ取得する
+        self.owner_id = await get_owner_id()
         await self.accept()
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        for group_name in getattr(self, 'group_names', []):
+            await self.channel_layer.group_discard(group_name, self.channel_name)
 
     async def receive(self, text_data):
         text_data_json = json.loads(text_data)
         type = text_data_json['type']
-        user_id = text_data_json['user_id']
         message = text_data_json['message']
 
-        if type == 'contact':
+        if type == 'contact' and self.owner_id is not None:
+            # 送信者は送られてきたuser_idではなくログイン中のユーザー
             await self.channel_layer.group_send(
-                self.group_name,
+                get_user_group(self.owner_id),
                 {
                     'type': 'contact',
-                    'user_id': user_id,
+                    'user_id': self.user.id,
                     'message': message,
                 }
             )
 
-            await self.create_notification(user_id, message)
-            
+            await notification_buffer.add(Notification(user_id=self.owner_id, message=message, sender_id=self.user.id))
+
     async def contact(self, event):
         user_id = event['user_id']
         message = event['message']
@@ -42,14 +61,18 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             'message': message,
         }))
 
-    @sync_to_async
-    def create_notification(self, user_id, message):
-        owner = CustomUser.objects.get(is_owner=True)
-        sender = CustomUser.objects.get(id=user_id)
-
-        # 通知の作成
-        Notification.objects.create(
-            user=owner,
-            message=message,
-            sender=sender,
-        )
\ No newline at end of file
+    # お知らせの一斉送信(役割のグループ宛て)
+    async def broadcast(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'broadcast',
+            'sender_id': event['sender_id'],
+            'message': event['message'],
+            'is_priority': event['is_priority'],
+        }))
+
+    # 本人の未読数が変わった場合
+    async def unread_count(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'unread_count',
+            'count': event['count'],
+        }))
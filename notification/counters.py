@@ -0,0 +1,63 @@
+from collections import Counter, defaultdict
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from accounts.models import CustomUser
+from .groups import get_user_group
+from .models import Notification
+
+# CustomUser.unread_notification_countをまとめて増減する({ユーザーのID: 増減数})
+def add_unread_counts(deltas):
+    # 増減数が同じユーザーは1回のUPDATEにまとめる
+    user_ids_by_delta = defaultdict(list)
+    for user_id, delta in deltas.items():
+        if user_id is not None and delta:
+            user_ids_by_delta[delta].append(user_id)
+    for delta, user_ids in user_ids_by_delta.items():
+        CustomUser.objects.filter(id__in=user_ids).update(unread_notification_count=F('unread_notification_count') + delta)
+
+# bulk_createなどシグナルが送られない処理で作成した通知を反映する
+def count_created_notifications(notifications):
+    add_unread_counts(Counter(notification.user_id for notification in notifications if not notification.is_read))
+
+# コミット後に本人の画面へ最新の未読数を送信する
+def publish_unread_counts(user_ids):
+    user_ids = set(user_ids)
+    if user_ids:
+        transaction.on_commit(lambda: send_unread_counts(user_ids))
+
+def send_unread_counts(user_ids):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    for user_id, count in CustomUser.objects.filter(id__in=user_ids).values_list('id', 'unread_notification_count'):
+        async_to_sync(channel_layer.group_send)(get_user_group(user_id), {
+            'type': 'unread_count',
+            'count': count,
+        })
+
+# 本人の未読の通知を確認済みにする(確認済みにした件数を返す)
+def mark_read(user, notification_ids):
+    with transaction.atomic():
+        count = Notification.objects.filter(user=user, id__in=notification_ids, is_read=False).update(is_read=True)
+        if count:
+            add_unread_counts({user.id: -count})
+            publish_unread_counts([user.id])
+    return count
+
+# 実際の未読数と一致しないユーザーの件数を返し、repair=Trueの場合は1回のUPDATEで再計算する
+def repair_unread_counts(repair=True):
+    actual_count = Coalesce(
+        Subquery(
+            Notification.objects.filter(user=OuterRef('pk'), is_read=False).order_by().values('user').annotate(count=Count('id')).values('count')
+        ),
+        Value(0),
+    )
+    mismatched = CustomUser.objects.annotate(actual_count=actual_count).exclude(unread_notification_count=F('actual_count')).count()
+    if repair and mismatched:
+        CustomUser.objects.update(unread_notification_count=actual_count)
+    return mismatched
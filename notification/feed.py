@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from django.db.models import Q
+
+NOTIFICATION_PAGE_SIZE = 20
+
+# 通知を(-created_at, id)の順に、前のページの最後の通知をカーソルにして取得する
+# (OFFSETを使わないため、後ろのページでも読み飛ばす行が増えない)
+def get_notification_page(queryset, cursor=None, page_size=NOTIFICATION_PAGE_SIZE):
+    queryset = queryset.order_by('-created_at', 'id')
+    if cursor is not None:
+        created_at, id = cursor
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__gt=id))
+
+    notifications = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(notifications) > page_size:
+        notifications = notifications[:page_size]
+        next_cursor = encode_cursor(notifications[-1])
+    return notifications, next_cursor
+
+def encode_cursor(notification):
+    return f'{notification.created_at.isoformat()}_{notification.id}'
+
+# 不正なカーソルは先頭のページとして扱う
+def decode_cursor(value):
+    if not value:
+        return None
+    try:
+        created_at, id = value.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(id)
+    except ValueError:
+        return None
+
+def serialize_notification(notification):
+    return {
+        'id': notification.id,
+        'message': notification.message,
+        'is_priority': notification.is_priority,
+        'is_read': notification.is_read,
+        'created_at': notification.created_at.isoformat(),
+    }
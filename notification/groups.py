@@ -0,0 +1,17 @@
+# WebSocketのグループ名(ユーザーごと・役割ごと)
+ROLES = ['owner', 'teacher', 'parent']
+
+def get_user_group(user_id):
+    return f'notification.user.{user_id}'
+
+def get_role_group(role):
+    return f'notification.role.{role}'
+
+def get_user_role(user):
+    if user.is_owner:
+        return 'owner'
+    if user.is_teacher:
+        return 'teacher'
+    if user.is_parent:
+        return 'parent'
+    return None
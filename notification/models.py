@@ -13,6 +13,10 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # 本人の通知のカーソルによるページ分割(feed.get_notification_page)
+            models.Index(fields=['user', '-created_at', 'id'], name='notification_user_created_idx'),
+        ]
 
     def __str__(self):
         return f'{self.message}'
\ No newline at end of file
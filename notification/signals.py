@@ -0,0 +1,18 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .counters import add_unread_counts, publish_unread_counts
+from .models import Notification
+
+# 未読の通知が作成・削除された場合は受信者の未読数を更新する(確認済みにする処理はcounters.mark_readを使う)
+@receiver(post_save, sender=Notification)
+def increment_unread_count(sender, instance, created, **kwargs):
+    if created and not instance.is_read:
+        add_unread_counts({instance.user_id: 1})
+        publish_unread_counts([instance.user_id])
+
+@receiver(post_delete, sender=Notification)
+def decrement_unread_count(sender, instance, **kwargs):
+    if not instance.is_read:
+        add_unread_counts({instance.user_id: -1})
+        publish_unread_counts([instance.user_id])
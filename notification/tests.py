@@ -1,3 +1,172 @@
-from django.test import TestCase
+import asyncio
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.urls import reverse
+
+from accounts.management.commands.createusers import create_owner
+from accounts.models import CustomUser
+from notification.broadcast import broadcast_notification
+from notification.counters import mark_read, repair_unread_counts
+from notification.feed import get_notification_page
+from notification.buffer import notification_buffer
+from notification.consumers import NotificationConsumer
+from notification.models import Notification
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    NOTIFICATION_FLUSH_INTERVAL=0.05,
+    NOTIFICATION_FLUSH_SIZE=500,
+)
+class NotificationConsumerTests(TestCase):
+    def setUp(self):
+        notification_buffer.pending = []
+        notification_buffer.flush_handle = None
+        self.owner = CustomUser.objects.create(username='owner', is_owner=True)
+        self.parents = [CustomUser.objects.create(username=f'parent-{i}', is_parent=True) for i in range(2)]
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(NotificationConsumer.as_asgi(), '/ws/notifications/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_contact_is_delivered_only_to_owner(self):
+        owner = await self.connect(self.owner)
+        sender = await self.connect(self.parents[0])
+        other_parent = await self.connect(self.parents[1])
+
+        # 送られてきたuser_idは使わない
+        await sender.send_json_to({'type': 'contact', 'user_id': self.parents[1].id, 'message': '欠席します'})
+
+        self.assertEqual(await owner.receive_json_from(), {'type': 'message', 'user_id': self.parents[0].id, 'message': '欠席します'})
+        self.assertTrue(await other_parent.receive_nothing())
+        self.assertTrue(await sender.receive_nothing())
+
+        await asyncio.sleep(0.1)
+        notification = await sync_to_async(Notification.objects.get)()
+        self.assertEqual((notification.user_id, notification.sender_id), (self.owner.id, self.parents[0].id))
+
+        for communicator in [owner, sender, other_parent]:
+            await communicator.disconnect()
+
+    async def test_anonymous_is_rejected(self):
+        communicator = WebsocketCommunicator(NotificationConsumer.as_asgi(), '/ws/notifications/')
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+    @override_settings(NOTIFICATION_FLUSH_SIZE=20)
+    def test_buffer_saves_in_one_query(self):
+        async def add_notifications():
+            for i in range(20):
+                await notification_buffer.add(Notification(user=self.owner, message=f'{i}', sender=self.parents[0]))
+
+        # 件数が上限に達した時点でまとめて保存する(SAVEPOINT・INSERT・未読数のUPDATE・RELEASE)
+        with self.assertNumQueries(4):
+            async_to_sync(add_notifications)()
+        self.assertEqual(Notification.objects.count(), 20)
+        self.assertEqual(notification_buffer.pending, [])
+        self.owner.refresh_from_db()
+        self.assertEqual(self.owner.unread_notification_count, 20)
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class BroadcastTests(TestCase):
+    def setUp(self):
+        create_owner('owner', '塾長', '太郎')
+        self.owner = CustomUser.objects.get(is_owner=True)
+        self.teachers = [CustomUser.objects.create(username=f'teacher-{i}', is_teacher=True) for i in range(2)]
+        self.parents = [CustomUser.objects.create(username=f'parent-{i}', is_parent=True) for i in range(3)]
+
+    def test_creates_rows_in_one_insert_and_publishes_per_role(self):
+        channel_layer = get_channel_layer()
+        async_to_sync(channel_layer.group_add)('notification.role.teacher', 'teacher-channel')
+        async_to_sync(channel_layer.group_add)('notification.role.parent', 'parent-channel')
+
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(5):
+            # 送信先の取得・SAVEPOINT・INSERT・未読数のUPDATE・RELEASE
+            count = broadcast_notification(self.owner, 'all', '台風のため休校します', is_priority=True)
+
+        self.assertEqual(count, 5)
+        self.assertEqual(set(CustomUser.objects.filter(is_parent=True).values_list('unread_notification_count', flat=True)), {1})
+        self.assertEqual(set(Notification.objects.values_list('user_id', flat=True)), {user.id for user in self.teachers + self.parents})
+        for channel in ['teacher-channel', 'parent-channel']:
+            event = async_to_sync(channel_layer.receive)(channel)
+            self.assertEqual((event['type'], event['message'], event['is_priority']), ('broadcast', '台風のため休校します', True))
+
+    def test_create_view(self):
+        self.client.force_login(self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('owner:notification_create'), {'send_to': 'teacher', 'message': '研修のお知らせ'})
+
+        self.assertRedirects(response, reverse('owner:dashboard'))
+        self.assertEqual(set(Notification.objects.values_list('user_id', flat=True)), {teacher.id for teacher in self.teachers})
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class UnreadCountTests(TestCase):
+    def setUp(self):
+        create_owner('owner', '塾長', '太郎')
+        self.owner = CustomUser.objects.get(is_owner=True)
+
+    def assertUnreadCount(self, count):
+        self.owner.refresh_from_db()
+        self.assertEqual(self.owner.unread_notification_count, count)
+
+    def test_create_mark_read_and_delete(self):
+        notifications = [Notification.objects.create(user=self.owner, message=f'{i}') for i in range(3)]
+        self.assertUnreadCount(3)
+
+        channel_layer = get_channel_layer()
+        async_to_sync(channel_layer.group_add)(f'notification.user.{self.owner.id}', 'owner-channel')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(mark_read(self.owner, [notifications[0].id]), 1)
+        self.assertEqual(async_to_sync(channel_layer.receive)('owner-channel'), {'type': 'unread_count', 'count': 2})
+
+        # 確認済みの通知はもう一度数えない
+        self.assertEqual(mark_read(self.owner, [notifications[0].id]), 0)
+        Notification.objects.filter(id=notifications[0].id).delete()
+        self.assertUnreadCount(2)
+        Notification.objects.filter(id=notifications[1].id).delete()
+        self.assertUnreadCount(1)
+
+    def test_repair(self):
+        Notification.objects.create(user=self.owner, message='a')
+        CustomUser.objects.filter(id=self.owner.id).update(unread_notification_count=5)
+
+        self.assertEqual(repair_unread_counts(repair=False), 1)
+        self.assertEqual(repair_unread_counts(), 1)
+        self.assertUnreadCount(1)
+        self.assertEqual(repair_unread_counts(), 0)
+
+    def test_keyset_pages(self):
+        # 作成日時が同じ通知はidの順に並べる
+        created_at = timezone.now()
+        Notification.objects.bulk_create([Notification(user=self.owner, message=f'{i}') for i in range(5)])
+        Notification.objects.update(created_at=created_at)
+        Notification.objects.create(user=self.owner, message='new')
+
+        first, cursor = get_notification_page(Notification.objects.filter(user=self.owner), page_size=4)
+        second, last_cursor = get_notification_page(Notification.objects.filter(user=self.owner), (first[-1].created_at, first[-1].id), page_size=4)
+
+        self.assertEqual([n.message for n in first + second], ['new', '0', '1', '2', '3', '4'])
+        self.assertIsNotNone(cursor)
+        self.assertIsNone(last_cursor)
+
+    def test_dashboard_and_feed(self):
+        for i in range(25):
+            Notification.objects.create(user=self.owner, message=f'{i}')
+        self.client.force_login(self.owner)
+
+        response = self.client.get(reverse('owner:dashboard'))
+        self.assertContains(response, '<span class="unread-notification-count">25</span>', html=True)
+
+        data = self.client.get(reverse('owner:notification_feed')).json()
+        self.assertEqual((len(data['notifications']), data['unread_count']), (20, 25))
+        data = self.client.get(reverse('owner:notification_feed'), {'cursor': data['next_cursor']}).json()
+        self.assertEqual((len(data['notifications']), data['next_cursor']), (5, None))
+
+        self.client.post(reverse('owner:dashboard'), {'pk': data['notifications'][0]['id']})
+        self.assertUnreadCount(24)
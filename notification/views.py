@@ -1,14 +1,18 @@
 import json
 
+from django.contrib import messages
+from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
-from django.urls import reverse
-from django.views.generic import ListView, View
+from django.urls import reverse, reverse_lazy
+from django.views.generic import FormView, ListView, View
 from django.utils.decorators import method_decorator
 
 from accounts.decorators import user_type_required
+from .broadcast import broadcast_notification
+from .counters import mark_read
+from .feed import decode_cursor, get_notification_page, serialize_notification
 from .forms import NotificationForm
 from .models import Notification
-from accounts.models import CustomUser
 
 @method_decorator(user_type_required(), name='dispatch')
 class NotificationListView(ListView):
@@ -20,21 +24,27 @@ class NotificationListView(ListView):
         return [f'{user_type}/notification_list.html']
     
     def get_queryset(self):
-        queryset = Notification.objects.filter(is_read=False, user=self.request.user)
+        queryset = Notification.objects.filter(user=self.request.user)
 
-        is_read = self.request.GET.get('is_read')
-        if is_read == 'true':
+        # 確認済みを選択した場合以外は未読の通知
+        if self.request.GET.get('is_read') == 'true':
             queryset = queryset.filter(is_read=True)
-        elif is_read == 'false':
+        else:
             queryset = queryset.filter(is_read=False)
 
-        return queryset.filter(user=self.request.user)
+        notifications, self.next_cursor = get_notification_page(queryset, decode_cursor(self.request.GET.get('cursor')))
+        return notifications
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['next_cursor'] = self.next_cursor
+        context['is_read'] = self.request.GET.get('is_read', 'false')
+        context['unread_count'] = self.request.user.unread_notification_count
+        return context
     
     def post(self, request, *args, **kwargs):
         notification_id = request.POST.get('notification_id')
-        notification = Notification.objects.get(id=notification_id)
-        notification.is_read = True
-        notification.save()
+        mark_read(request.user, [notification_id])
         
         user_type = 'owner' if self.request.user.is_owner else ('teacher' if self.request.user.is_teacher else 'parent')
         if user_type == 'parent':
@@ -42,31 +52,36 @@ class NotificationListView(ListView):
         elif user_type == 'teacher':
             return redirect(reverse('teacher:notification_list'))
 
-# 未使用
-def create_notification(request):
-    if request.method == 'POST':
-        form = NotificationForm(request.POST)
-        if form.is_valid():
-            send_to = form.cleaned_data['send_to']
-            message = form.cleaned_data['message']
-            is_priority = form.cleaned_data['is_priority']
-            
-            if send_to == 'teacher':
-                users = CustomUser.objects.filter(is_teacher=True)
-                
-            elif send_to == 'parent':
-                users = CustomUser.objects.filter(is_parent=True)
-            else:
-                users = CustomUser.objects.exclude(is_owner=True)
-            
-            for user in users:
-                notification = Notification(user=user, message=message, is_priority=is_priority, sender=request.user)
-                notification.save()
-            
-            return redirect('owner:notification_list')  # 通知一覧ページにリダイレクト
-    else:
-        form = NotificationForm()
-    return render(request, 'owner/notification_create.html', {'form': form})
+# 本人の通知を新しい順に1ページずつ返す(ホーム画面から読み込む)
+@method_decorator(user_type_required(), name='dispatch')
+class NotificationFeedView(View):
+    def get(self, request, *args, **kwargs):
+        notifications, next_cursor = get_notification_page(
+            Notification.objects.filter(user=request.user),
+            decode_cursor(request.GET.get('cursor')),
+        )
+        return JsonResponse({
+            'notifications': [serialize_notification(notification) for notification in notifications],
+            'next_cursor': next_cursor,
+            'unread_count': request.user.unread_notification_count,
+        })
+
+# お知らせの一斉送信(送信先の全員の通知をまとめて作成し、接続中の画面にも表示する)
+@method_decorator(user_type_required(), name='dispatch')
+class NotificationCreateView(FormView):
+    template_name = 'owner/notification_create.html'
+    form_class = NotificationForm
+    success_url = reverse_lazy('owner:dashboard')
+
+    def form_valid(self, form):
+        count = broadcast_notification(
+            self.request.user,
+            form.cleaned_data['send_to'],
+            form.cleaned_data['message'],
+            form.cleaned_data['is_priority'],
+        )
+        messages.success(self.request, f'{count}人に送信しました')
+        return super().form_valid(form)
 
 # 未使用
 def notification_list(request):
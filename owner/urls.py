@@ -1,10 +1,10 @@
 from django.urls import path
-from .views import OwnerDashboardView
+from .views import OwnerDashboardView, ProfilingStatsView
 from accounts.views import CustomUserActivateView, CustomUserDeleteView, ChangePasswordView, CustomUserProfileView
 from students.views import StudentNotableDeleteView, StudentNotableUpdateView, StudentNotableCreateView, StudentStatusUpdateView, StudentSelectView, OwnerStudentListView, OwnerStudentDetailView, OwnerStudentDetailUpdateView
 from report_card.views import ReportCardDetailView, ReportCardUpdateView, BatchReportCardSelectView, BatchReportCardUpdateView
 from regular_lesson.views import RegularLessonListView, RegularLessonCreateView, RegularLessonDeleteView, RegularLessonUpdateView, RegularLessonCancelView
-from special_lesson.views import SpecialLessonCreateView, SpecialLessonListView, SpecialLessonDetailView, SpecialLessonAdminCreateView, SpecialLessonDeleteView, SpecialLessonAdminUpdateView, SpecialLessonAdminDeleteView, SpecialLessonPrintView
+from special_lesson.views import SpecialLessonCreateView, SpecialLessonListView, SpecialLessonDetailView, SpecialLessonAdminCreateView, SpecialLessonDeleteView, SpecialLessonAdminUpdateView, SpecialLessonAdminDeleteView, SpecialLessonPrintView, SpecialLessonSolveView, SpecialLessonDraftView, SpecialLessonDraftCommitView
 from shift.views import ShiftSelectView, ShiftTemplateView, ShiftTemplateUpdateView, ShiftDetailDisplayView, ShiftDetailView, ShiftDetailUpdateView, ShiftDetailReloadView, ShiftLessonCreateView, ShiftLessonDeleteView, ShiftTeacherShiftCreateView, ShiftTeacherShiftDeleteView, ShiftDeleteView
 from report.views import OwnerSubmitReportListView, SubmitReportUpdateView, SubmitReportDeleteView, ReportListView
 from vocabulary_test.views import VocabularyTestDetailView, VocabularyTestUpdateView
@@ -12,14 +12,17 @@ from test_result.views import AverageScoreListView, AverageScoreCreateView, Test
 from teacher_shift.views import FixedShiftListView, FixedShiftCreateView, SalaryPDFView, FixedShiftDeleteView, FixedShiftUpdateView, FixedShiftCancelView, SalaryCreateView, SalaryListView, SalaryUpdateView, SalaryDeleteView
 from invoice.views import InvoicePDFView, InvoiceListView, InvoiceDeleteView, InvoiceUpdateView, PaidInvoiceListView, InvoiceCreateView
 from year_schedule.views import OwnerYearScheduleView, EventCreateView, EventDeleteView, PrintMonthScheduleView, PrintSelectView
-from file.views import OwnerFileListView, FileDetailView, FileDeleteView
+from file.views import OwnerFileListView, FileDetailView, FileDeleteView, PdfJobStatusView
 from update_grade.views import UpdateStudentListView, UpdateStudentToMiddleView, UpdateStudentToHighView, UpdateStudentToGradView, UpdateShiftTemplateView, UpdateRegularLessonListView, UpdateFixedShiftListView, UpdateRegularLessonContinueView, UpdateFixedShiftDeleteView, UpdateFixedShiftUpdateView, UpdateFixedShiftContinueView, UpdateRegularLessonDeleteView, UpdateRegularLessonUpdateView
 from teacher.views import TeacherListView, TeacherStatusUpdateView
+from notification.views import NotificationCreateView, NotificationFeedView
 
 app_name = 'owner'
 
 urlpatterns = [
     path('', OwnerDashboardView.as_view(), name='dashboard'),
+    path('notification/create/', NotificationCreateView.as_view(), name='notification_create'),
+    path('notification/feed/', NotificationFeedView.as_view(), name='notification_feed'),
 
     path('account/', CustomUserProfileView.as_view(), name='account_profile'),
     path('account/change_password/', ChangePasswordView.as_view(), name='account_change_password'),
@@ -68,6 +71,9 @@ urlpatterns = [
     path('special/create/', SpecialLessonCreateView.as_view(), name='special_create'),
     path('special/<int:pk>/', SpecialLessonDetailView.as_view(), name='special_detail'),
     path('special/<int:pk>/print/', SpecialLessonPrintView.as_view(), name='special_print'),
+    path('special/<int:pk>/solve/', SpecialLessonSolveView.as_view(), name='special_solve'),
+    path('special/draft/<int:pk>/', SpecialLessonDraftView.as_view(), name='special_draft'),
+    path('special/draft/<int:pk>/commit/', SpecialLessonDraftCommitView.as_view(), name='special_draft_commit'),
     path('special/<int:pk>/delete/', SpecialLessonDeleteView.as_view(), name='special_delete'),
     path('special/admin/<int:pk>/update/', SpecialLessonAdminUpdateView.as_view(), name='special_admin_edit'),
     path('special/admin/<int:pk>/create/', SpecialLessonAdminCreateView.as_view(), name='special_admin_create'),
@@ -112,6 +118,9 @@ urlpatterns = [
     path('file/', OwnerFileListView.as_view(), name='file_list'),
     path('file/<int:pk>', FileDetailView.as_view(), name='file_detail'),
     path('file/<int:pk>/delete', FileDeleteView.as_view(), name='file_delete'),
+    path('file/job/<int:pk>/', PdfJobStatusView.as_view(), name='pdf_job_status'),
+
+    path('stats/', ProfilingStatsView.as_view(), name='profiling_stats'),
 
     path('year_schedule/', OwnerYearScheduleView.as_view(), name='year_schedule_calendar'),
     path('year_schedule/add/', EventCreateView.as_view(), name='year_schedule_add'),
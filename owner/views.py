@@ -1,37 +1,47 @@
-from datetime import timedelta
 import os
 
+from django.conf import settings
 from django.utils.decorators import method_decorator
-from django.views.generic import ListView, DetailView, FormView
+from django.views.generic import DetailView, FormView, TemplateView
 from django.urls import reverse_lazy
 from django.http import HttpResponseRedirect
 
 from accounts.decorators import user_type_required
 from accounts.models import CustomUser
-from notification.models import Notification
+from notification.counters import mark_read
 from students.models import Student, StudentNotable
 from utils.choices import GRADE_CHOICES
-from utils.helpers import get_today
+from utils.profiling import get_view_stats, reset_view_stats
 
+# 通知は未読数のみ表示し、本文は画面から通知の一覧(notification_feed)を読み込む
 @method_decorator(user_type_required(), name='dispatch')
-class OwnerDashboardView(ListView):
+class OwnerDashboardView(TemplateView):
     template_name = 'owner/dashboard.html'
-    model = Notification
-    context_object_name = 'notifications'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data()
+        context['unread_count'] = self.request.user.unread_notification_count
         context['customusers'] = CustomUser.objects.filter(is_active=False)
         context['HOST_IP'] = os.environ.get('HOST_IP')
         return context
 
-    def get_queryset(self):
-        # 過去30日の通知を表示
-        return Notification.objects.filter(user=self.request.user, created_at__gte=(get_today() - timedelta(days=30)))
+    def post(self, request, *args, **kwargs):
+        mark_read(request.user, [request.POST.get('pk')])
+        return HttpResponseRedirect(reverse_lazy('owner:dashboard'))
+
+# 画面ごとの処理時間とSQLの集計(計測対象のリクエストのみ)
+@method_decorator(user_type_required(), name='dispatch')
+class ProfilingStatsView(TemplateView):
+    template_name = 'owner/profiling_stats.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['view_stats'] = get_view_stats()
+        context['sample_rate'] = settings.PROFILING_SAMPLE_RATE
+        context['n_plus_one_threshold'] = settings.PROFILING_N_PLUS_ONE_THRESHOLD
+        return context
 
     def post(self, request, *args, **kwargs):
-        pk = request.POST.get('pk')
-        notification = Notification.objects.get(pk=pk)
-        notification.is_read = True
-        notification.save()
-        return HttpResponseRedirect(reverse_lazy('owner:dashboard'))
\ No newline at end of file
+        reset_view_stats()
+        return HttpResponseRedirect(reverse_lazy('owner:profiling_stats'))
+
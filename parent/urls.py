@@ -6,9 +6,9 @@ from report.views import ReportListView
 from vocabulary_test.views import VocabularyTestDetailView
 from test_result.views import TestResultDetailView
 from regular_lesson.views import ParentLessonListView
-from notification.views import NotificationListView
+from notification.views import NotificationListView, NotificationFeedView
 from special_lesson.views import SpecialLessonListView, SpecialLessonStudentRequestFormView
-from year_schedule.views import ParentYearScheduleView
+from year_schedule.views import ParentYearScheduleView, ParentCalendarFeedView
 from file.views import FileDetailView, FileListView
 from accounts.views import CustomUserProfileView, ChangePasswordView
 
@@ -31,10 +31,12 @@ urlpatterns = [
     path('switch_student/', SwitchStudentView.as_view(), name='switch_student'),
 
     path('notification/', NotificationListView.as_view(), name='notification_list'),
+    path('notification/feed/', NotificationFeedView.as_view(), name='notification_feed'),
 
     path('lesson/', ParentLessonListView.as_view(), name='schedule_list'),
 
     path('year_schedule/', ParentYearScheduleView.as_view(), name='dashboard'),
+    path('year_schedule/feed/', ParentCalendarFeedView.as_view(), name='calendar_feed'),
 
     path('special/', SpecialLessonListView.as_view(), name='special_lesson_list'),
     path('special/<int:special_lesson_pk>/', SpecialLessonStudentRequestFormView.as_view(), name='special_lesson_request'),
@@ -38,5 +38,13 @@ class Lesson(models.Model):
 
     class Meta:
         ordering = ('date',)
+        indexes = [
+            # シフト作成時の日付ごとの通常授業・講習授業
+            models.Index(fields=['date', 'is_regular', 'regular'], name='lesson_date_regular_idx'),
+            # 生徒ごとの予定表
+            models.Index(fields=['student', 'date'], name='lesson_student_date_idx'),
+            # 振替待ちの欠席(件数が少ないため部分インデックス)
+            models.Index(fields=['date'], condition=models.Q(is_absence=True, is_unauthorized_absence=False, is_rescheduled=False), name='lesson_pending_transfer_idx'),
+        ]
     
     
\ No newline at end of file
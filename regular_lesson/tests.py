@@ -1,3 +1,65 @@
+from datetime import date
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from accounts.management.commands.createusers import create_owner
+from regular_lesson.models import RegularLessonAdmin, Lesson
+from shift.models import ShiftTemplate
+from students.models import Student
+from year_schedule.models import Event
+from utils.helpers import generate_regular_lessons, get_weekly_dates, invalidate_clousure_dates
+
+class GenerateRegularLessonsTests(TestCase):
+    def setUp(self):
+        invalidate_clousure_dates()
+        self.addCleanup(invalidate_clousure_dates)
+        create_owner('owner', '塾長', '太郎')
+        self.student = Student.objects.create(last_name='生徒', first_name='一郎', grade=7)
+        self.start_date = date(2024, 3, 1)
+        self.end_date = date(2025, 2, 28)
+
+    def create_admin(self):
+        return RegularLessonAdmin.objects.create(
+            student=self.student,
+            grade=7,
+            subject=1,
+            day=2,
+            time=3,
+            start_date=self.start_date,
+            end_date=self.end_date,
+        )
+
+    def test_weekly_dates(self):
+        # 2024/3/1は金曜日なので最初の火曜日は3/5
+        dates = get_weekly_dates(2, self.start_date, self.end_date, {date(2024, 3, 12)})
+        self.assertEqual(dates[0], date(2024, 3, 5))
+        self.assertNotIn(date(2024, 3, 12), dates)
+        self.assertTrue(all(d.weekday() == 1 for d in dates))
+        self.assertEqual(dates[-1], date(2025, 2, 25))
+
+    def test_lessons_skip_closure_and_fill_template(self):
+        Event.objects.create(title='休校', date=date(2024, 3, 12), is_closure=True)
+        admin = self.create_admin()
+
+        with CaptureQueriesContext(connection) as queries:
+            generate_regular_lessons(admin, 2, 3, self.start_date, self.end_date)
+
+        lesson_dates = list(Lesson.objects.filter(regular=admin).values_list('date', flat=True))
+        self.assertEqual(len(lesson_dates), 51)
+        self.assertNotIn(date(2024, 3, 12), lesson_dates)
+        template = ShiftTemplate.objects.get(day=2, time=3, room=1, is_next_year=False)
+        self.assertEqual(template.lessons.seat_lessons[0], admin)
+        # 休校日、授業の一括作成、テンプレート取得、テンプレート更新
+        self.assertLessEqual(len(queries), 5)
+
+    def test_next_free_seat(self):
+        admins = [self.create_admin() for _ in range(5)]
+        for admin in admins:
+            generate_regular_lessons(admin, 2, 3, self.start_date, self.end_date)
 
-# Create your tests here.
+        room1 = ShiftTemplate.objects.get(day=2, time=3, room=1, is_next_year=False)
+        room2 = ShiftTemplate.objects.get(day=2, time=3, room=2, is_next_year=False)
+        self.assertEqual(room1.lessons.seat_lessons[3], admins[3])
+        self.assertEqual(room2.lessons.seat_lessons[0], admins[4])
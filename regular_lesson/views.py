@@ -5,7 +5,6 @@ from django.urls import reverse_lazy
 from django.http import JsonResponse, HttpResponseRedirect
 from django.views.generic import ListView, DeleteView, View, TemplateView
 from django.views.generic.edit import CreateView
-from django.db.models import Q
 from django.utils.decorators import method_decorator
 from collections import defaultdict
 from django.contrib import messages
@@ -13,7 +12,7 @@ from django.contrib import messages
 from accounts.decorators import user_type_required
 from .models import RegularLessonAdmin, Lesson
 from students.models import Student
-from shift.models import ShiftTemplateLessonRelation
+from shift.models import ShiftTemplateSeat
 from .forms import RegularLessonAdminCreateForm
 from utils.choices import TIME_CHOICES, SUBJECT_CHOICES, DAY_CHOICES, GRADE_CHOICES
 from utils.mixins import FiscalYearMixin
@@ -157,21 +156,7 @@ class RegularLessonUpdateView(FiscalYearMixin, View):
         Lesson.objects.filter(date__gte=today, date__lte=end_date, regular=obj).delete()
 
         # シフトテンプレートを削除
-        shift_lesson_relation = ShiftTemplateLessonRelation.objects.get(
-            Q(template_lesson1=obj) | Q(template_lesson2=obj) |
-            Q(template_lesson3=obj) | Q(template_lesson4=obj)
-        )
-
-        if shift_lesson_relation.template_lesson1 == obj:
-            shift_lesson_relation.template_lesson1 = None
-        if shift_lesson_relation.template_lesson2 == obj:
-            shift_lesson_relation.template_lesson2 = None
-        if shift_lesson_relation.template_lesson3 == obj:
-            shift_lesson_relation.template_lesson3 = None
-        if shift_lesson_relation.template_lesson4 == obj:
-            shift_lesson_relation.template_lesson4 = None
-
-        shift_lesson_relation.save()
+        ShiftTemplateSeat.objects.filter(lesson=obj).update(lesson=None)
 
         # RegularLessonAdminを前日で終了
         obj.end_date = today
@@ -207,21 +192,7 @@ class RegularLessonCancelView(View):
         Lesson.objects.filter(date__gte=today, date__lte=end_date, regular=obj).delete()
 
         # シフトテンプレートを削除
-        shift_lesson_relation = ShiftTemplateLessonRelation.objects.get(
-            Q(template_lesson1=obj) | Q(template_lesson2=obj) |
-            Q(template_lesson3=obj) | Q(template_lesson4=obj)
-        )
-
-        if shift_lesson_relation.template_lesson1 == obj:
-            shift_lesson_relation.template_lesson1 = None
-        if shift_lesson_relation.template_lesson2 == obj:
-            shift_lesson_relation.template_lesson2 = None
-        if shift_lesson_relation.template_lesson3 == obj:
-            shift_lesson_relation.template_lesson3 = None
-        if shift_lesson_relation.template_lesson4 == obj:
-            shift_lesson_relation.template_lesson4 = None
-
-        shift_lesson_relation.save()
+        ShiftTemplateSeat.objects.filter(lesson=obj).update(lesson=None)
 
         # RegularLessonAdminを前日で終了
         obj.end_date = today
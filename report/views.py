@@ -11,7 +11,7 @@ from django.db.models import Q
 from .forms import ReportForm, TestResultForm
 from .models import Report
 from accounts.decorators import user_type_required
-from shift.models import Shift
+from shift.models import SEAT_NUMBERS
 from students.models import Student
 from regular_lesson.models import Lesson
 from utils.choices import GRADE_CHOICES
@@ -93,30 +93,17 @@ class TeacherSubmitReportListView(TemplateView):
         teacher = self.request.user
         # 一時的に変更
         today = get_today()
-        shifts = Shift.objects.filter(teacher_shift__teacher=teacher, date=today) 
-        for shift in shifts:
-            lessons = shift.lessons
-            if lessons:
-                if lessons.lesson1:
-                    if lessons.lesson1.is_reported:
-                        reported_lessons.append(lessons.lesson1)
-                    else:
-                        unreported_lessons.append(lessons.lesson1)
-                if lessons.lesson2:
-                    if lessons.lesson2.is_reported:
-                        reported_lessons.append(lessons.lesson2)
-                    else:
-                        unreported_lessons.append(lessons.lesson2)
-                if lessons.lesson3:
-                    if lessons.lesson3.is_reported:
-                        reported_lessons.append(lessons.lesson3)
-                    else:
-                        unreported_lessons.append(lessons.lesson3)
-                if lessons.lesson4:
-                    if lessons.lesson4.is_reported:
-                        reported_lessons.append(lessons.lesson4)
-                    else:
-                        unreported_lessons.append(lessons.lesson4)
+        # 今日の担当シフトの席に登録されている授業を1クエリで取得
+        lessons = Lesson.objects.filter(
+            seats__relation__lessons__teacher_shift__teacher=teacher,
+            seats__relation__lessons__date=today,
+            seats__seat_no__in=SEAT_NUMBERS,
+        ).select_related('student').order_by('seats__relation__lessons__time', 'seats__relation__lessons__room', 'seats__seat_no')
+        for lesson in lessons:
+            if lesson.is_reported:
+                reported_lessons.append(lesson)
+            else:
+                unreported_lessons.append(lesson)
         context['lessons'] = unreported_lessons
         context['reported_lessons'] = reported_lessons
         return context
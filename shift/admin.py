@@ -1,7 +1,9 @@
 from django.contrib import admin
-from .models import ShiftTemplateLessonRelation, ShiftTemplate, ShiftLessonRelation, Shift
+from .models import ShiftTemplateLessonRelation, ShiftTemplateSeat, ShiftTemplate, ShiftLessonRelation, ShiftSeat, Shift
 
 admin.site.register(ShiftTemplateLessonRelation)
+admin.site.register(ShiftTemplateSeat)
 admin.site.register(ShiftTemplate)
 admin.site.register(ShiftLessonRelation)
-admin.site.register(Shift)
\ No newline at end of file
+admin.site.register(ShiftSeat)
+admin.site.register(Shift)
@@ -48,9 +48,8 @@ class SpecialLessonOptionWidget(forms.Select):
         option = super().create_option(name, value, label, selected, index, subindex=subindex, attrs=attrs)
         if value:
             # 特別なオプションの値が存在する場合、その値を元にStudentのIDを取得し、data-属性に追加する
-            special_lesson = SpecialLessonAdmin.objects.get(pk=value.value)
-            student_id = special_lesson.student.id
-            option['attrs']['data-student-id'] = student_id
+            # 選択肢のインスタンスを使用して選択肢ごとのクエリを避ける
+            option['attrs']['data-student-id'] = value.instance.student_id
         else:
             option['attrs']['data-student-id'] = ''
         return option
@@ -0,0 +1,35 @@
+from collections import defaultdict
+
+from django.db.models import Prefetch
+
+from .models import SEAT_NUMBERS, Shift, ShiftSeat
+from utils.helpers import get_special_ordering
+
+# テンプレートで参照する関連をまとめて取得する(1日でも1週間でもシフトと席の2クエリ)
+SHIFT_GRID_RELATED = [
+    'teacher_shift__teacher',
+    'lessons',
+]
+
+def get_seat_prefetch():
+    return Prefetch('lessons__seats', queryset=ShiftSeat.objects.select_related('lesson__student'))
+
+# シフト表の1マス(教室×時間)
+class ShiftCell:
+    def __init__(self, shift):
+        self.shift = shift
+        self.teacher_shift = shift.teacher_shift
+        relation = shift.lessons
+        # (席番号, 授業)のリスト
+        self.lessons = list(zip(SEAT_NUMBERS, relation.seat_lessons if relation else [None] * len(SEAT_NUMBERS)))
+        self.has_lessons = any(lesson for _, lesson in self.lessons)
+
+def get_shift_grid_queryset(dates):
+    return Shift.objects.filter(date__in=dates).select_related(*SHIFT_GRID_RELATED).prefetch_related(get_seat_prefetch()).order_by('date', 'room', get_special_ordering())
+
+# 取得済みのシフトを教室×時間の行列にする
+def build_shift_grid(shifts):
+    rows = defaultdict(list)
+    for shift in shifts:
+        rows[shift.room].append(ShiftCell(shift))
+    return [{'room': room, 'cells': cells} for room, cells in rows.items()]
@@ -1,17 +1,45 @@
+from django.conf import settings
 from django.db import models
 from regular_lesson.models import Lesson, RegularLessonAdmin
 from teacher_shift.models import FixedShift, TeacherShift
 from utils.choices import DAY_CHOICES, TIME_CHOICES, ROOM_CHOICES, SPECIAL_TIME_CHOICES
 
+# 1コマあたりの席番号
+SEAT_NUMBERS = range(1, settings.SHIFT_SEAT_COUNT + 1)
+
+# 席番号順の授業のリスト(空席はNone、seatsをprefetchしている場合はクエリを発行しない)
+def get_seat_lessons(relation):
+    lessons = {seat.seat_no: seat.lesson for seat in relation.seats.all()}
+    return [lessons.get(seat_no) for seat_no in SEAT_NUMBERS]
+
 class ShiftTemplateLessonRelation(models.Model):
-    # 意味合い的にはOneToOneFieldでいいが、ドラッグ&ドロップの時に重複するためForeignKeyを設定
+    # 旧形式の席(backfill_seatsでShiftTemplateSeatへ移行した後は使用しない)
     template_lesson1 = models.ForeignKey(RegularLessonAdmin, on_delete=models.SET_NULL, blank=True, null=True, related_name='template_lesson1')
     template_lesson2 = models.ForeignKey(RegularLessonAdmin, on_delete=models.SET_NULL, blank=True, null=True, related_name='template_lesson2')
     template_lesson3 = models.ForeignKey(RegularLessonAdmin, on_delete=models.SET_NULL, blank=True, null=True, related_name='template_lesson3')
     template_lesson4 = models.ForeignKey(RegularLessonAdmin, on_delete=models.SET_NULL, blank=True, null=True, related_name='template_lesson4')
 
+    @property
+    def seat_lessons(self):
+        return get_seat_lessons(self)
+
+    def __str__(self):
+        return ' - '.join(str(lesson) for lesson in self.seat_lessons)
+
+# シフトテンプレートの席(空席はlessonがNone)
+class ShiftTemplateSeat(models.Model):
+    relation = models.ForeignKey(ShiftTemplateLessonRelation, on_delete=models.CASCADE, related_name='seats')
+    seat_no = models.PositiveSmallIntegerField()
+    # 意味合い的にはOneToOneFieldでいいが、ドラッグ&ドロップの時に重複するためForeignKeyを設定
+    lesson = models.ForeignKey(RegularLessonAdmin, on_delete=models.SET_NULL, blank=True, null=True, related_name='template_seats')
+
     def __str__(self):
-        return f'{self.template_lesson1} - {self.template_lesson2} - {self.template_lesson3} - {self.template_lesson4}'
+        return f'{self.relation_id}-{self.seat_no} {self.lesson}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['relation', 'seat_no'], name='unique_shift_template_seat'),
+        ]
 
 class ShiftTemplate(models.Model):
     fixed_shift = models.ForeignKey(FixedShift, on_delete=models.SET_NULL, blank=True, null=True)
@@ -23,6 +51,12 @@ class ShiftTemplate(models.Model):
 
     def __str__(self):
         return f'{self.fixed_shift} - {self.lessons}'
+
+    class Meta:
+        constraints = [
+            # 曜日・時間・教室ごとに今年度と来年度のテンプレートが1つずつ
+            models.UniqueConstraint(fields=['day', 'time', 'room', 'is_next_year'], name='unique_shift_template_slot'),
+        ]
     
 # 何かに使ってるはず
 RegularLessonAdmin.shift_templates = models.ManyToManyField(
@@ -32,13 +66,32 @@ RegularLessonAdmin.shift_templates = models.ManyToManyField(
 )
 
 class ShiftLessonRelation(models.Model):
+    # 旧形式の席(backfill_seatsでShiftSeatへ移行した後は使用しない)
     lesson1 = models.ForeignKey(Lesson, on_delete=models.SET_NULL, blank=True, null=True, related_name='lesson1')
     lesson2 = models.ForeignKey(Lesson, on_delete=models.SET_NULL, blank=True, null=True, related_name='lesson2')
     lesson3 = models.ForeignKey(Lesson, on_delete=models.SET_NULL, blank=True, null=True, related_name='lesson3')
     lesson4 = models.ForeignKey(Lesson, on_delete=models.SET_NULL, blank=True, null=True, related_name='lesson4')
 
+    @property
+    def seat_lessons(self):
+        return get_seat_lessons(self)
+
+    def __str__(self):
+        return ' - '.join(str(lesson) for lesson in self.seat_lessons)
+
+# シフトの席(空席はlessonがNone)
+class ShiftSeat(models.Model):
+    relation = models.ForeignKey(ShiftLessonRelation, on_delete=models.CASCADE, related_name='seats')
+    seat_no = models.PositiveSmallIntegerField()
+    lesson = models.ForeignKey(Lesson, on_delete=models.SET_NULL, blank=True, null=True, related_name='seats')
+
     def __str__(self):
-        return f'{self.lesson1} - {self.lesson2} - {self.lesson3} - {self.lesson4}'
+        return f'{self.relation_id}-{self.seat_no} {self.lesson}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['relation', 'seat_no'], name='unique_shift_seat'),
+        ]
 
 class Shift(models.Model):
     teacher_shift = models.ForeignKey(TeacherShift, on_delete=models.SET_NULL, blank=True, null=True, related_name='teacher_shift')
@@ -48,4 +101,10 @@ class Shift(models.Model):
     lessons = models.OneToOneField(ShiftLessonRelation, on_delete=models.CASCADE, blank=True, null=True, related_name='lessons')
 
     def __str__(self):
-        return f'{self.teacher_shift} - {self.date} - {self.get_time_display()} - {self.get_room_display()} - {self.lessons}'
\ No newline at end of file
+        return f'{self.teacher_shift} - {self.date} - {self.get_time_display()} - {self.get_room_display()} - {self.lessons}'
+
+    class Meta:
+        constraints = [
+            # 日付・時間・教室ごとにシフトは1つ(日付のみの検索にも使用)
+            models.UniqueConstraint(fields=['date', 'time', 'room'], name='unique_shift_slot'),
+        ]
@@ -0,0 +1,112 @@
+from collections import Counter
+
+from django.db import transaction
+
+from .models import SEAT_NUMBERS
+
+# 保存内容に矛盾がある場合は何も保存せずにエラーの一覧を返す
+class MoveConflict(Exception):
+    def __init__(self, errors):
+        super().__init__('\n'.join(errors))
+        self.errors = errors
+
+def parse_id(value):
+    return int(value) if value else None
+
+def check_duplicates(assignments, label, errors):
+    counts = Counter(value for value in assignments.values() if value is not None)
+    for value, count in counts.items():
+        if count > 1:
+            errors.append(f'{label}(ID: {value})が{count}か所に配置されています')
+
+def parse_moves(json_data, errors):
+    # {(関連ID, 席番号): 授業ID}, {シフトID: 講師ID}
+    seats = {}
+    slots = {}
+
+    for item in json_data.get('lessons', []):
+        try:
+            relation_id, seat = item['id'].split('-')
+            key = (int(relation_id), int(seat))
+            lesson_id = parse_id(item['lessonId'])
+        except (KeyError, ValueError, AttributeError, TypeError):
+            errors.append(f'授業のデータが不正です: {item}')
+            continue
+        if key[1] not in SEAT_NUMBERS:
+            errors.append(f'席番号が不正です: {item}')
+            continue
+        if key in seats and seats[key] != lesson_id:
+            errors.append(f'同じ席に異なる授業が指定されています: {item}')
+            continue
+        seats[key] = lesson_id
+
+    for item in json_data.get('teachers', []):
+        try:
+            slot_id = int(item['id'])
+            teacher_id = parse_id(item['teacherId'])
+        except (KeyError, ValueError, TypeError):
+            errors.append(f'講師のデータが不正です: {item}')
+            continue
+        if slot_id in slots and slots[slot_id] != teacher_id:
+            errors.append(f'同じシフトに異なる講師が指定されています: {item}')
+            continue
+        slots[slot_id] = teacher_id
+
+    return seats, slots
+
+def check_exists(queryset, ids, label, errors):
+    objects = queryset.in_bulk(ids)
+    for id in set(ids) - set(objects):
+        errors.append(f'{label}(ID: {id})が見つかりません')
+    return objects
+
+# 席を(関連ID, 席番号)で引けるようにする
+def load_seats(seat_model, keys, errors):
+    seat_objects = {
+        (seat.relation_id, seat.seat_no): seat
+        for seat in seat_model.objects.select_for_update().filter(relation_id__in={relation_id for relation_id, _ in keys})
+    }
+    for relation_id, seat_no in set(keys) - set(seat_objects):
+        errors.append(f'席(ID: {relation_id}-{seat_no})が見つかりません')
+    return seat_objects
+
+# ドラッグ&ドロップの編集内容をまとめて検証し、1つのトランザクションで保存する
+# seat_model: 授業の席のモデル(ShiftSeatまたはShiftTemplateSeat), slot_model: 講師を持つモデル(teacher_field)
+def apply_moves(json_data, seat_model, lesson_model, slot_model, teacher_model, teacher_field):
+    errors = []
+    seats, slots = parse_moves(json_data, errors)
+    check_duplicates(seats, '授業', errors)
+    check_duplicates(slots, '講師', errors)
+
+    with transaction.atomic():
+        seat_objects = load_seats(seat_model, seats, errors)
+        shifts = check_exists(slot_model.objects.select_for_update(), set(slots), 'シフト', errors)
+        check_exists(lesson_model.objects, {id for id in seats.values() if id is not None}, '授業', errors)
+        check_exists(teacher_model.objects, {id for id in slots.values() if id is not None}, '講師', errors)
+
+        if errors:
+            raise MoveConflict(errors)
+
+        changed_seats = []
+        changed_relations = set()
+        for key, lesson_id in seats.items():
+            seat = seat_objects[key]
+            if seat.lesson_id != lesson_id:
+                seat.lesson_id = lesson_id
+                changed_seats.append(seat)
+                changed_relations.add(seat.relation_id)
+
+        changed_shifts = []
+        for shift_id, teacher_id in slots.items():
+            shift = shifts[shift_id]
+            field = f'{teacher_field}_id'
+            if getattr(shift, field) != teacher_id:
+                setattr(shift, field, teacher_id)
+                changed_shifts.append(shift)
+
+        if changed_seats:
+            seat_model.objects.bulk_update(changed_seats, ['lesson'])
+        if changed_shifts:
+            slot_model.objects.bulk_update(changed_shifts, [teacher_field])
+
+    return len(changed_relations) + len(changed_shifts)
@@ -0,0 +1,91 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.db.models.functions import Coalesce
+
+from .models import SEAT_NUMBERS, Shift, ShiftSeat
+from regular_lesson.models import Lesson
+from teacher_shift.models import TeacherShift
+
+NO_SHIFT = 'シフトが作成されていません'
+NO_FREE_SEAT = '空いている席がありません'
+NO_FREE_ROOM = '空いている教室がありません'
+
+# シフト表に配置されていない授業(どの席からも参照されていない)
+def get_unplaced_lessons(dates):
+    placed = ShiftSeat.objects.filter(lesson=OuterRef('pk'))
+    return Lesson.objects.filter(date__in=dates, is_absence=False).filter(~Exists(placed)).select_related('student').order_by('date', 'time', 'id')
+
+# シフト表に配置されていない講師シフト
+def get_unplaced_teacher_shifts(dates):
+    placed = Shift.objects.filter(teacher_shift=OuterRef('pk'))
+    return TeacherShift.objects.filter(date__in=dates).filter(~Exists(placed)).annotate(
+        slot_time=Coalesce('time', 'fixed_shift__time')
+    ).select_related('fixed_shift__teacher', 'temporaly_shift__teacher').order_by('date', 'slot_time', 'id')
+
+class ReconcileResult:
+    def __init__(self):
+        self.placed_lessons = []
+        self.placed_teacher_shifts = []
+        # (授業または講師シフト, 理由)のリスト
+        self.unplaceable_lessons = []
+        self.unplaceable_teacher_shifts = []
+
+# 未配置の授業と講師シフトを教室番号の小さい順に空いている席へ配置する
+def reconcile_shifts(dates):
+    result = ReconcileResult()
+    unplaced_lessons = list(get_unplaced_lessons(dates))
+    unplaced_teacher_shifts = list(get_unplaced_teacher_shifts(dates))
+    if not unplaced_lessons and not unplaced_teacher_shifts:
+        return result
+
+    slots = defaultdict(list)
+    for shift in Shift.objects.filter(date__in=dates).order_by('room'):
+        slots[(shift.date, shift.time)].append(shift)
+
+    # 空席を(日付, 時間)ごとに教室順・席番号順で並べる
+    free_seats = defaultdict(list)
+    for seat in ShiftSeat.objects.filter(relation__lessons__date__in=dates, seat_no__in=SEAT_NUMBERS, lesson=None).annotate(
+        date=F('relation__lessons__date'), time=F('relation__lessons__time'),
+    ).order_by('relation__lessons__room', 'seat_no'):
+        free_seats[(seat.date, seat.time)].append(seat)
+
+    changed_seats = []
+    for lesson in unplaced_lessons:
+        if not slots.get((lesson.date, lesson.time)):
+            result.unplaceable_lessons.append((lesson, NO_SHIFT))
+            continue
+
+        seats = free_seats[(lesson.date, lesson.time)]
+        if seats:
+            seat = seats.pop(0)
+            seat.lesson = lesson
+            changed_seats.append(seat)
+            result.placed_lessons.append(lesson)
+        else:
+            result.unplaceable_lessons.append((lesson, NO_FREE_SEAT))
+
+    changed_shifts = {}
+    for teacher_shift in unplaced_teacher_shifts:
+        shifts = slots.get((teacher_shift.date, teacher_shift.slot_time))
+        if not shifts:
+            result.unplaceable_teacher_shifts.append((teacher_shift, NO_SHIFT))
+            continue
+
+        for shift in shifts:
+            if shift.teacher_shift_id is None:
+                shift.teacher_shift = teacher_shift
+                changed_shifts[shift.id] = shift
+                result.placed_teacher_shifts.append(teacher_shift)
+                break
+        else:
+            result.unplaceable_teacher_shifts.append((teacher_shift, NO_FREE_ROOM))
+
+    with transaction.atomic():
+        if changed_seats:
+            ShiftSeat.objects.bulk_update(changed_seats, ['lesson'])
+        if changed_shifts:
+            Shift.objects.bulk_update(changed_shifts.values(), ['teacher_shift'])
+
+    return result
@@ -0,0 +1,66 @@
+from django.db import transaction
+from django.db.models import Q
+
+from .models import SEAT_NUMBERS, ShiftSeat, ShiftTemplateSeat
+
+# 関連ごとに全ての席(空席を含む)をまとめて作成する
+# seat_lessons: relationsと同じ順番の{席番号: 授業ID}のリスト
+def create_seats(seat_model, relations, seat_lessons=None):
+    if seat_lessons is None:
+        seat_lessons = [{}] * len(relations)
+    return seat_model.objects.bulk_create([
+        seat_model(relation_id=relation.id, seat_no=seat_no, lesson_id=lessons.get(seat_no))
+        for relation, lessons in zip(relations, seat_lessons)
+        for seat_no in SEAT_NUMBERS
+    ], batch_size=1000)
+
+# 日付・時間が一致するシフトの空席(教室順・席番号順)
+def get_free_shift_seats(date, time):
+    return ShiftSeat.objects.filter(
+        relation__lessons__date=date,
+        relation__lessons__time=time,
+        seat_no__in=SEAT_NUMBERS,
+        lesson=None,
+    ).order_by('relation__lessons__room', 'seat_no')
+
+# 曜日・時間が一致するシフトテンプレートの空席(教室順・席番号順)
+def get_free_template_seats(day, time, is_next_year):
+    return ShiftTemplateSeat.objects.filter(
+        relation__template_lessons__day=day,
+        relation__template_lessons__time=time,
+        relation__template_lessons__is_next_year=is_next_year,
+        seat_no__in=SEAT_NUMBERS,
+        lesson=None,
+    ).order_by('relation__template_lessons__room', 'seat_no')
+
+# 最初の空席に授業を登録する(空席がない場合はFalse)
+def fill_first_free_seat(free_seats, lesson):
+    seat = free_seats.first()
+    if seat is None:
+        return False
+    seat.lesson = lesson
+    seat.save(update_fields=['lesson'])
+    return True
+
+# 旧形式の席(prefix1〜4の列)から席を作成し、設定された席数に足りない空席を追加する
+# 移行した旧形式の列は空にするため、再実行しても移行後の変更を上書きしない
+# (作成した席数, 設定された席数を超える席に登録されている授業の数)を返す
+def backfill_seats(relation_model, seat_model, legacy_prefix):
+    legacy_fields = [f'{legacy_prefix}{i}' for i in range(1, 5)]
+    existing = set(seat_model.objects.values_list('relation_id', 'seat_no'))
+    new_seats = []
+    for relation_id, *lesson_ids in relation_model.objects.values_list('id', *legacy_fields).iterator(chunk_size=2000):
+        legacy_seats = {seat_no: lesson_id for seat_no, lesson_id in enumerate(lesson_ids, start=1) if lesson_id is not None}
+        for seat_no in sorted(set(SEAT_NUMBERS) | set(legacy_seats)):
+            if (relation_id, seat_no) not in existing:
+                new_seats.append(seat_model(relation_id=relation_id, seat_no=seat_no, lesson_id=legacy_seats.get(seat_no)))
+
+    with transaction.atomic():
+        seat_model.objects.bulk_create(new_seats, batch_size=1000)
+        has_legacy = Q()
+        for field in legacy_fields:
+            has_legacy |= Q(**{f'{field}__isnull': False})
+        relation_model.objects.filter(has_legacy).update(**{field: None for field in legacy_fields})
+
+    overflow = seat_model.objects.exclude(seat_no__in=SEAT_NUMBERS).exclude(lesson=None).count()
+    return len(new_seats), overflow
@@ -1,3 +1,313 @@
+import json
+import re
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction, IntegrityError
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from utils.benchmark import legacy_generate_shifts, seed_fiscal_year, snapshot_shifts
+from accounts.models import CustomUser
+from regular_lesson.models import Lesson
+from shift.models import Shift, ShiftLessonRelation, ShiftSeat, ShiftTemplate
+from shift.reconcile import reconcile_shifts, NO_SHIFT, NO_FREE_SEAT
+from students.models import Student
+from special_lesson.models import SpecialLesson, SpecialLessonTeacherRequest
+from special_lesson.request_grid import provision_teacher_requests
+from teacher_shift.models import TeacherShift
+from year_schedule.models import Event
+from utils.helpers import bulk_create_shifts_from_templates, generate_shifts_bulk
+
+class BulkCreateShiftsTests(TestCase):
+    def setUp(self):
+        start_date, _ = seed_fiscal_year(student_count=20, teacher_count=5, lessons_per_student=2)
+        # 年度初めの2週間(平日のみ)
+        self.dates = [start_date + timedelta(days=i) for i in range(14) if (start_date + timedelta(days=i)).weekday() < 5]
+
+    def test_same_result_as_legacy(self):
+        for date in self.dates:
+            legacy_generate_shifts(date)
+        legacy_result = snapshot_shifts()
+        ShiftLessonRelation.objects.all().delete()
+
+        bulk_create_shifts_from_templates(self.dates)
+
+        self.assertTrue(legacy_result)
+        self.assertEqual(legacy_result, snapshot_shifts())
+
+    def test_query_count_does_not_depend_on_dates(self):
+        with CaptureQueriesContext(connection) as queries:
+            bulk_create_shifts_from_templates(self.dates)
+
+        # 既存シフト、テンプレートと席、固定シフト、授業とトランザクション
+        selects = [query for query in queries if not query['sql'].startswith('INSERT')]
+        self.assertLessEqual(len(selects), 7)
+        # 保存はテーブルごとのbulk_create(SQLiteでは件数に応じて分割される)
+        inserted_tables = {re.match(r'INSERT INTO "(\w+)"', query['sql']).group(1) for query in queries if query['sql'].startswith('INSERT')}
+        self.assertEqual(inserted_tables, {'shift_shiftlessonrelation', 'shift_shiftseat', 'shift_shift'})
+
+    def test_skip_dates_with_shifts(self):
+        bulk_create_shifts_from_templates(self.dates)
+        with CaptureQueriesContext(connection) as queries:
+            created = bulk_create_shifts_from_templates(self.dates)
+
+        self.assertEqual(created, [])
+        self.assertEqual(len(queries), 1)
+
+    def test_concurrent_creation_keeps_existing_shifts(self):
+        bulk_create_shifts_from_templates(self.dates[:1])
+        existing = snapshot_shifts()
+
+        # 既存シフトの確認後に別のリクエストが1日目のシフトを作成した場合
+        real_filter = Shift.objects.filter
+        calls = []
+        def filter_after_check(*args, **kwargs):
+            calls.append(kwargs)
+            return Shift.objects.none() if len(calls) == 1 else real_filter(*args, **kwargs)
+
+        with mock.patch.object(Shift.objects, 'filter', side_effect=filter_after_check):
+            created = bulk_create_shifts_from_templates(self.dates[:2])
+
+        # 2日目のみ作成し、1日目のシフト・席は重複しない
+        self.assertEqual(created, self.dates[1:2])
+        self.assertTrue(Shift.objects.filter(date=self.dates[1]).exists())
+        self.assertEqual([row for row in snapshot_shifts() if row[0] == self.dates[0]], existing)
+        # 取り消した授業・席は残らない
+        self.assertFalse(ShiftLessonRelation.objects.filter(lessons=None).exists())
+
+    def test_generate_restores_only_created_dates(self):
+        # 休校の取り消しなどでシフトを作り直す日の臨時授業
+        lesson = Lesson.objects.create(student=Student.objects.first(), grade=8, subject=1, date=self.dates[0], time=1, is_regular=False)
+
+        generate_shifts_bulk(self.dates[:1])
+        # 既存のシフトには二重に登録しない
+        generate_shifts_bulk(self.dates[:1])
+
+        self.assertEqual(ShiftSeat.objects.filter(lesson=lesson).count(), 1)
+
+class ShiftGridQueryCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        start_date, _ = seed_fiscal_year(student_count=10, teacher_count=5, lessons_per_student=2)
+        # 年度初めの翌週の月曜日
+        self.date = start_date + timedelta(days=7 - start_date.weekday())
+        self.owner = CustomUser.objects.get(is_owner=True)
+        self.teacher = CustomUser.objects.filter(is_teacher=True).first()
+        self.year, self.week, self.day = self.date.isocalendar()
+
+    def fill_seats(self):
+        # 空いている席を全て臨時授業で埋める
+        student = Student.objects.create(last_name='臨時', first_name='生徒', grade=8)
+        for seat in ShiftSeat.objects.filter(relation__lessons__date=self.date, lesson=None):
+            seat.lesson = Lesson.objects.create(student=student, grade=8, subject=1, date=self.date, time=1, is_temporaly=True)
+            seat.save()
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_shift_detail_query_count_is_constant(self):
+        self.client.force_login(self.owner)
+        url = reverse('owner:shift_detail', args=[self.year, self.week, self.day])
+        # 1回目はシフトの作成を含むため除外
+        self.client.get(url)
+        self.assertTrue(Shift.objects.filter(date=self.date).exists())
+
+        before = self.count_queries(url)
+        self.fill_seats()
+        after = self.count_queries(url)
+
+        self.assertEqual(before, after)
+        self.assertLessEqual(after, 9)
+
+    def test_shift_display_query_count_is_constant(self):
+        bulk_create_shifts_from_templates([self.date])
+        self.client.force_login(self.teacher)
+        url = reverse('teacher:shift_display', args=[self.year, self.week, self.day])
+
+        before = self.count_queries(url)
+        self.fill_seats()
+        after = self.count_queries(url)
+
+        self.assertEqual(before, after)
+        self.assertLessEqual(after, 5)
+
+class ReconcileShiftsTests(TestCase):
+    def setUp(self):
+        start_date, _ = seed_fiscal_year(student_count=5, teacher_count=2, lessons_per_student=1)
+        self.date = start_date + timedelta(days=7 - start_date.weekday())
+        bulk_create_shifts_from_templates([self.date])
+        self.student = Student.objects.create(last_name='臨時', first_name='生徒', grade=8)
+        self.teacher = CustomUser.objects.filter(is_teacher=True).first()
+
+    def create_lesson(self, time=1):
+        return Lesson.objects.create(student=self.student, grade=8, subject=1, date=self.date, time=time, is_temporaly=True)
+
+    def test_place_new_lessons_and_teacher_shifts(self):
+        lessons = [self.create_lesson() for _ in range(2)]
+        teacher_shift = TeacherShift.objects.create(teacher=self.teacher, date=self.date, time=1)
+
+        result = reconcile_shifts([self.date])
+
+        self.assertEqual(result.placed_lessons, lessons)
+        self.assertEqual(result.placed_teacher_shifts, [teacher_shift])
+        for lesson in lessons:
+            self.assertTrue(ShiftSeat.objects.filter(lesson=lesson, relation__lessons__time=1).exists())
+        self.assertEqual(Shift.objects.get(teacher_shift=teacher_shift).time, 1)
+        # 2回目は配置するものがない
+        self.assertEqual(reconcile_shifts([self.date]).placed_lessons, [])
+
+    def test_unplaceable(self):
+        free_seats = ShiftSeat.objects.filter(relation__lessons__date=self.date, relation__lessons__time=2, lesson=None).count()
+        lessons = [self.create_lesson(time=2) for _ in range(free_seats + 1)]
+        # 講習の時間にはシフトが存在しない
+        special_lesson = self.create_lesson(time=6)
+
+        result = reconcile_shifts([self.date])
+
+        self.assertEqual(len(result.placed_lessons), free_seats)
+        self.assertEqual(result.unplaceable_lessons, [(lessons[-1], NO_FREE_SEAT), (special_lesson, NO_SHIFT)])
+
+    def test_query_count_does_not_depend_on_lessons(self):
+        for time in range(1, 6):
+            self.create_lesson(time=time)
+            TeacherShift.objects.create(teacher=self.teacher, date=self.date, time=time)
+
+        with CaptureQueriesContext(connection) as queries:
+            result = reconcile_shifts([self.date])
+
+        self.assertEqual(len(result.placed_lessons), 5)
+        # 未配置の授業、講師シフト、シフト、空席、保存(2テーブル)とトランザクション
+        self.assertLessEqual(len(queries), 8)
+
+class ApplyMovesTests(TestCase):
+    def setUp(self):
+        start_date, _ = seed_fiscal_year(student_count=10, teacher_count=5, lessons_per_student=2)
+        self.date = start_date + timedelta(days=7 - start_date.weekday())
+        bulk_create_shifts_from_templates([self.date])
+        self.client.force_login(CustomUser.objects.get(is_owner=True))
+        self.url = reverse('owner:shift_update')
+
+    # シフト詳細画面の保存ボタンと同じく全てのマスを送信する
+    def get_payload(self):
+        data = {'lessons': [], 'teachers': []}
+        for shift in Shift.objects.filter(date=self.date).select_related('lessons').prefetch_related('lessons__seats'):
+            for i, lesson in enumerate(shift.lessons.seat_lessons, start=1):
+                data['lessons'].append({'id': f'{shift.lessons.id}-{i}', 'lessonId': str(lesson.id) if lesson else ''})
+            data['teachers'].append({'id': str(shift.id), 'teacherId': str(shift.teacher_shift_id) if shift.teacher_shift_id else ''})
+        return data
+
+    def post(self, data):
+        return self.client.post(self.url, json.dumps(data), content_type='application/json')
+
+    def test_swap_lessons(self):
+        data = self.get_payload()
+        filled = [item for item in data['lessons'] if item['lessonId']]
+        empty = [item for item in data['lessons'] if not item['lessonId']]
+        filled[0]['lessonId'], empty[0]['lessonId'] = '', filled[0]['lessonId']
+        before = snapshot_shifts()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(before, snapshot_shifts())
+        relation_id, seat = empty[0]['id'].split('-')
+        self.assertEqual(str(ShiftSeat.objects.get(relation_id=relation_id, seat_no=seat).lesson_id), empty[0]['lessonId'])
+        # セッション、検証(4テーブル)、保存とトランザクション
+        self.assertLessEqual(len(queries), 12)
+
+    def test_conflict_is_not_saved(self):
+        data = self.get_payload()
+        filled = [item for item in data['lessons'] if item['lessonId']]
+        empty = [item for item in data['lessons'] if not item['lessonId']]
+        # 同じ授業を2か所に配置し、存在しない講師を指定する
+        empty[0]['lessonId'] = filled[0]['lessonId']
+        empty[1]['lessonId'] = filled[1]['lessonId']
+        data['teachers'][0]['teacherId'] = '999999'
+        before = snapshot_shifts()
+
+        response = self.post(data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.json()['errors']), 3)
+        self.assertEqual(before, snapshot_shifts())
+
+# 主要なクエリの実行計画にテーブル全体のスキャンが含まれないことを確認する
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # 生徒120人・講師30人の1年度分と、年度初めの2か月分のシフト・講習の希望調査
+        start_date, end_date = seed_fiscal_year(student_count=120, teacher_count=30, lessons_per_student=3)
+        cls.start_date, cls.end_date = start_date, end_date
+        cls.dates = [start_date + timedelta(days=i) for i in range(60) if (start_date + timedelta(days=i)).weekday() < 5]
+        bulk_create_shifts_from_templates(cls.dates)
+        cls.special_lesson = SpecialLesson.objects.create(name='春期講習', start_date=cls.dates[0], end_date=cls.dates[-1])
+        provision_teacher_requests(cls.special_lesson, list(CustomUser.objects.filter(is_teacher=True).values_list('id', flat=True)), cls.dates)
+        Lesson.objects.filter(id__in=Lesson.objects.values('id')[:20]).update(is_absence=True)
+        Event.objects.bulk_create([Event(title='休校', date=start_date + timedelta(days=i), is_closure=i % 30 == 0) for i in range(0, 365, 3)])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertNoFullScan(self, queryset):
+        table = queryset.model._meta.db_table
+        plan = queryset.explain()
+        if connection.vendor == 'postgresql':
+            full_scan = re.search(rf'Seq Scan on {table}\b', plan)
+        else:
+            full_scan = re.search(rf'SCAN {table}\b(?! USING)', plan)
+        self.assertIsNone(full_scan, plan)
+
+    def test_hot_queries_use_indexes(self):
+        date = self.dates[0]
+        student_id = Lesson.objects.values_list('student_id', flat=True).first()
+        teacher_shift = TeacherShift.objects.filter(is_fixed=True).first()
+        querysets = [
+            Lesson.objects.filter(date__in=self.dates[:5], is_regular=True, is_rescheduled=False, regular__isnull=False),
+            Lesson.objects.filter(date=date, is_regular=False),
+            Lesson.objects.filter(student_id=student_id, date__gte=self.start_date, date__lte=self.end_date),
+            Lesson.objects.filter(is_absence=True, is_unauthorized_absence=False, is_rescheduled=False),
+            Shift.objects.filter(date=date, time=1, room=1),
+            Shift.objects.filter(date__in=self.dates[:5]),
+            TeacherShift.objects.filter(fixed_shift_id=teacher_shift.fixed_shift_id, date=teacher_shift.date, is_fixed=True),
+            TeacherShift.objects.filter(date=date, is_fixed=False),
+            SpecialLessonTeacherRequest.objects.filter(special_lesson=self.special_lesson, date=date, is_available=True),
+        ]
+        for queryset in querysets:
+            with self.subTest(query=str(queryset.query)):
+                self.assertNoFullScan(queryset)
+
+    def test_slot_constraints(self):
+        # テンプレートとシフトは枠ごとに1つのみ
+        template = ShiftTemplate.objects.first()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ShiftTemplate.objects.create(day=template.day, time=template.time, room=template.room, is_next_year=template.is_next_year)
+        shift = Shift.objects.first()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Shift.objects.create(date=shift.date, time=shift.time, room=shift.room)
+
+class BackfillSeatsTests(TestCase):
+    def test_legacy_columns_are_moved_once(self):
+        student = Student.objects.create(last_name='生徒', first_name='太郎', grade=8)
+        lessons = [Lesson.objects.create(student=student, grade=8, subject=1, time=1) for _ in range(2)]
+        relation = ShiftLessonRelation.objects.create(lesson1=lessons[0], lesson3=lessons[1])
+        Shift.objects.create(lessons=relation, time=1, room=1)
+
+        call_command('backfill_seats', stdout=StringIO())
+
+        relation.refresh_from_db()
+        self.assertEqual(relation.seat_lessons, [lessons[0], None, lessons[1], None])
+        self.assertIsNone(relation.lesson1_id)
 
-# Create your tests here.
+        # 移行後の変更は再実行しても上書きされない
+        ShiftSeat.objects.filter(relation=relation, seat_no=1).update(lesson=None)
+        call_command('backfill_seats', stdout=StringIO())
+        self.assertEqual(ShiftSeat.objects.filter(relation=relation).count(), 4)
+        self.assertEqual(relation.seat_lessons, [None, None, lessons[1], None])
@@ -6,21 +6,24 @@ from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseRedire
 from django.views.generic import TemplateView, ListView, View
 from django.views.generic.base import RedirectView
 from django.utils.decorators import method_decorator
-from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Count, F
+from django.db.models import F
 from django.contrib import messages
 from django.urls import reverse_lazy
 
-from .models import ShiftTemplate, ShiftTemplateLessonRelation, Shift, ShiftLessonRelation
+from .models import ShiftTemplate, ShiftTemplateSeat, Shift, ShiftSeat
 from .forms import TeacherAddForm, TransferLessonForm
+from .grid import get_shift_grid_queryset, build_shift_grid
+from .reconcile import reconcile_shifts
+from .seats import get_free_shift_seats, fill_first_free_seat
+from .moves import apply_moves, MoveConflict
 from regular_lesson.models import Lesson, RegularLessonAdmin
 from teacher_shift.models import TeacherShift, FixedShift, TemporalyShift
-from special_lesson.models import SpecialLesson, SpecialLessonTeacherRequest, SpecialLessonStudentRequest, SpecialLessonAdmin
-from year_schedule.models import Event
+from special_lesson.models import SpecialLesson, SpecialLessonAdmin
+from special_lesson.availability import get_availability
 from accounts.decorators import user_type_required
-from utils.choices import ROOM_CHOICES, TIME_CHOICES, SPECIAL_TIME_CHOICES
+from utils.choices import TIME_CHOICES, SPECIAL_TIME_CHOICES
 from utils.mixins import FiscalYearMixin
-from utils.helpers import get_today, generate_shifts, get_special_ordering, get_fiscal_year_boundaries
+from utils.helpers import get_today, generate_shifts_bulk, get_fiscal_year_boundaries, is_clousure_date
 
 @method_decorator(user_type_required(), name='dispatch')
 class ShiftSelectView(FiscalYearMixin, TemplateView):
@@ -76,7 +79,7 @@ class ShiftTemplateView(ListView):
     paginate_by = 30
 
     def get_queryset(self):
-        return ShiftTemplate.objects.filter(is_next_year=False)
+        return ShiftTemplate.objects.filter(is_next_year=False).select_related('lessons', 'fixed_shift__teacher').prefetch_related('lessons__seats__lesson__student')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -87,36 +90,13 @@ class ShiftTemplateView(ListView):
 class ShiftTemplateUpdateView(View):
     def post(self, request, *args, **kwargs):
         json_data = json.loads(request.body)
-        
-        for item in json_data['lessons']:
-            relation_id, relation_number = item['id'].split('-')
-            lesson_id = item['lessonId']
-
-            shift_relation_obj = ShiftTemplateLessonRelation.objects.prefetch_related().get(id=relation_id)
-            new_class_obj = RegularLessonAdmin.objects.get(id=lesson_id) if lesson_id else None
-
-            template_lesson_mapping = {
-                '1': 'template_lesson1',
-                '2': 'template_lesson2',
-                '3': 'template_lesson3',
-                '4': 'template_lesson4'
-            }
-
-            template_lesson_field = template_lesson_mapping.get(relation_number)
 
-            if template_lesson_field:
-                setattr(shift_relation_obj, template_lesson_field, new_class_obj)
-                shift_relation_obj.save()
-
-        for item in json_data['teachers']:
-            shift_id = item['id']
-            teacher_id = item['teacherId']
-
-            shift_obj = ShiftTemplate.objects.get(id=shift_id)
-            new_teacher_obj = FixedShift.objects.get(id=teacher_id) if teacher_id else None
-            
-            shift_obj.fixed_shift = new_teacher_obj
-            shift_obj.save()
+        try:
+            apply_moves(json_data, ShiftTemplateSeat, RegularLessonAdmin, ShiftTemplate, FixedShift, 'fixed_shift')
+        except MoveConflict as e:
+            for error in e.errors:
+                messages.error(self.request, error)
+            return JsonResponse({'success': False, 'errors': e.errors}, status=400)
 
         messages.success(self.request, "保存できました")
         return JsonResponse({'success': True})
@@ -137,7 +117,7 @@ class ShiftDetailDisplayView(ListView):
         day = self.kwargs['day']
         # グローバル変数として明記
         global_date = datetime.fromisocalendar(year, week, day).date()
-        return Shift.objects.filter(date=global_date).order_by('room', get_special_ordering())
+        return get_shift_grid_queryset([global_date])
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -178,6 +158,7 @@ class ShiftDetailDisplayView(ListView):
             context['time_choices'] = [time[1] for time in TIME_CHOICES]
 
         context['is_extend'] = is_extend
+        context['shift_grid'] = build_shift_grid(self.object_list)
 
         return context
  
@@ -197,36 +178,14 @@ class ShiftDetailView(FiscalYearMixin, ListView):
         start_of_week = datetime.fromisocalendar(year, week, 1).date()
         week_dates = [start_of_week + timedelta(days=i) for i in range(5)]
 
-        clousure_dates = [obj.date for obj in Event.objects.filter(date__gte=week_dates[0], date__lte=week_dates[-1], is_closure=True)]
-        boolean_list = []
-
-        def check_shift_existance(date):
-            # 休校日かどうか
-            if date in clousure_dates:
-                return True
-            else:
-                # シフトが存在するか
-                if Shift.objects.filter(date=date).exists():
-                    return True
-                else:
-                    return False
+        shift_dates = set(Shift.objects.filter(date__in=week_dates).values_list('date', flat=True))
 
-        for date in week_dates:
-            boolean_list.append(check_shift_existance(date))
-
-        # シフトが存在する場合その日のみのシフトを返して終了
-        if all(boolean_list):
-            return Shift.objects.filter(date=global_date).order_by('room', get_special_ordering())
-
-        # シフトが存在しない場合にまとめて作成する
-        else:
-            for index, date in enumerate(week_dates, start=0):
+        # 休校日でもなくシフトも存在しない日付のシフトをまとめて作成する
+        missing_dates = [date for date in week_dates if not is_clousure_date(date) and date not in shift_dates]
+        if missing_dates:
+            generate_shifts_bulk(missing_dates)
 
-                # シフトが存在しない日付のにmみシフトを作成
-                if not boolean_list[index]:
-                    generate_shifts(date)
-
-            return Shift.objects.filter(date=global_date).order_by('room', get_special_ordering())
+        return get_shift_grid_queryset([global_date])
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -269,31 +228,22 @@ class ShiftDetailView(FiscalYearMixin, ListView):
             times = [time[0] for time in TIME_CHOICES]
 
         transfer_lesson_form = TransferLessonForm()
-        transfer_lesson_form.fields['lesson'].queryset = Lesson.objects.filter(is_absence=True, is_unauthorized_absence=False, is_rescheduled=False)
-        json_data = {}
-
-        for time in times:
-            json_data[time] = {}
-            teacher_requests = SpecialLessonTeacherRequest.objects.filter(special_lesson=special_lesson, date=global_date, time=time, is_available=True)
-            teachers = [request.teacher.id for request in teacher_requests]
-            json_data[time]['teachers'] = teachers
-            student_requests = SpecialLessonStudentRequest.objects.filter(special_lesson=special_lesson, date=global_date, time=time, is_available=True)
-            students = [request.student.id for request in student_requests]
-            json_data[time]['students'] = students
+        transfer_lesson_form.fields['lesson'].queryset = Lesson.objects.filter(is_absence=True, is_unauthorized_absence=False, is_rescheduled=False).select_related('student')
+        # 時間ごとの出勤・受講可能な講師と生徒(講習ごと・日付ごとにキャッシュ)
+        json_data = get_availability(special_lesson, global_date, times)
 
         # 特別講習がある場合は希望調査の結果を反映
         if special_lesson:
+            # 登録済みの授業数がコマ数に達していない講習
             special_lesson_admins = SpecialLessonAdmin.objects.filter(
-                special_lesson=special_lesson
-            ).annotate(
-                lesson_count=Count('lesson')  # 'lesson'は関連するLessonモデルの関連名
-            ).filter(
-                lesson_count__lt=F('periods')  # 'periods'はSpecialLessonAdminのフィールド
-            )
+                special_lesson=special_lesson,
+                scheduled_count__lt=F('periods'),
+            ).select_related('student')
             transfer_lesson_form.fields['special_lesson'].queryset = special_lesson_admins
             transfer_lesson_form.fields['special_lesson_others'].queryset = special_lesson_admins
 
         context['json_data'] = json_data
+        context['shift_grid'] = build_shift_grid(self.object_list)
         context['special_lesson'] = special_lesson
         context['transfer_lesson_form'] = transfer_lesson_form
         context['teacher_add_form'] = TeacherAddForm()
@@ -303,38 +253,14 @@ class ShiftDetailView(FiscalYearMixin, ListView):
 class ShiftDetailUpdateView(View):
     def post(self, request, *args, **kwargs):
         json_data = json.loads(request.body)
-        
-        for item in json_data['lessons']:
-            # lessonの処理
-            relation_id, relation_number = item['id'].split('-')
-            lesson_id = item['lessonId']
-
-            shift_relation_obj = ShiftLessonRelation.objects.prefetch_related().get(id=relation_id)
-            new_class_obj = Lesson.objects.get(id=lesson_id) if lesson_id else None
-
-            lesson_mapping = {
-                '1': 'lesson1',
-                '2': 'lesson2',
-                '3': 'lesson3',
-                '4': 'lesson4'
-            }
-
-            lesson_field = lesson_mapping.get(relation_number)
-
-            if lesson_field:
-                setattr(shift_relation_obj, lesson_field, new_class_obj)
-                shift_relation_obj.save()
-
-        for item in json_data['teachers']:
-            # teacherの処理
-            shift_id = item['id']
-            teacher_id = item['teacherId']
 
-            shift_obj = Shift.objects.prefetch_related().get(id=shift_id)
-            new_teacher_obj = TeacherShift.objects.get(id=teacher_id) if teacher_id else None
+        try:
+            apply_moves(json_data, ShiftSeat, Lesson, Shift, TeacherShift, 'teacher_shift')
+        except MoveConflict as e:
+            for error in e.errors:
+                messages.error(request, error)
+            return JsonResponse({'success': False, 'errors': e.errors}, status=400)
 
-            shift_obj.teacher_shift = new_teacher_obj
-            shift_obj.save()
         messages.success(request, "編集できました")
 
         return JsonResponse({'success': True})
@@ -353,67 +279,15 @@ class ShiftDetailReloadView(RedirectView):
         week = self.kwargs['week']
         dates = self.get_week_dates(year, week)
 
-        # 新たに新規作成された授業を追加する
-        lesson_instances = Lesson.objects.filter(date__in=dates, is_absence=False)
-        for lesson_instance in lesson_instances:
-            related_shift_lesson_relations = lesson_instance.lesson1.all() | \
-                                            lesson_instance.lesson2.all() | \
-                                            lesson_instance.lesson3.all() | \
-                                            lesson_instance.lesson4.all()
-            if not related_shift_lesson_relations.exists():
-                unregisterd_lesson = lesson_instance
-                date = unregisterd_lesson.date
-                time = unregisterd_lesson.time
-                room_choices = [room[0] for room in ROOM_CHOICES]
-                lesson_added = False
-                for room in room_choices:
-                    obj = Shift.objects.get(
-                        date=date,
-                        time=time,
-                        room=room,
-                    )
-                    if not lesson_added:
-                        for i in range(1, 5):
-                            lesson = getattr(obj.lessons, f"lesson{i}")
-                            if lesson is None:
-                                setattr(obj.lessons, f"lesson{i}", unregisterd_lesson)
-                                obj.lessons.save()
-                                lesson_added = True
-                                break
-                    else:
-                        break
-        
-        # 新たに新規作成された講師シフトを追加
-        teacher_instances = TeacherShift.objects.filter(date__in=dates)
-        for teacher_instance in teacher_instances:
-            try:
-                related_teacher_relations = teacher_instance.teacher_shift
-            except ObjectDoesNotExist:
-                # 関連が存在しない場合の処理
-                related_teacher_relations = None
-                
-            if not related_teacher_relations:
-                unregisterd_teacher = teacher_instance
-                date = unregisterd_teacher.date
-                time = unregisterd_teacher.fixed_shift.time
-                room_choices = [room[0] for room in ROOM_CHOICES]
-                teacher_added = False
-                for room in room_choices:
-                    obj = Shift.objects.get(
-                        date=date,
-                        time=time,
-                        room=room,
-                    )
-                    if not teacher_added:
-                        for i in range(1, 5):
-                            if obj.teacher_shift is None:
-                                obj.teacher_shift = unregisterd_teacher
-                                obj.save()
-                                teacher_added = True
-                                break
-                    else:
-                        break
-        
+        # 新たに新規作成された授業と講師シフトを空いている席に追加する
+        result = reconcile_shifts(dates)
+        if result.placed_lessons or result.placed_teacher_shifts:
+            messages.info(request, f'授業{len(result.placed_lessons)}件、講師シフト{len(result.placed_teacher_shifts)}件を配置しました')
+        for lesson, reason in result.unplaceable_lessons:
+            messages.warning(request, f'{lesson}を配置できませんでした({reason})')
+        for teacher_shift, reason in result.unplaceable_teacher_shifts:
+            messages.warning(request, f'{teacher_shift}を配置できませんでした({reason})')
+
         return super().get(request, *args, **kwargs)
 
     def get_redirect_url(self, *args, **kwargs):
@@ -501,14 +375,7 @@ class ShiftLessonCreateView(FiscalYearMixin, View):
                 else:
                     return HttpResponseBadRequest('Referer header not found')
 
-            unregisterd_lesson = lesson
-            obj = Shift.objects.get(date=date, room=room, time=time)
-            for i in range(1, 5):
-                lesson = getattr(obj.lessons, f"lesson{i}")
-                if lesson is None:
-                    setattr(obj.lessons, f"lesson{i}", unregisterd_lesson)
-                    obj.lessons.save()
-                    break
+            fill_first_free_seat(get_free_shift_seats(date, time).filter(relation__lessons__room=room), lesson)
 
         referer = request.META.get('HTTP_REFERER')
         if referer:
@@ -544,9 +411,7 @@ class ShiftLessonDeleteView(RedirectView):
             lesson_instance.is_unauthorized_absence = True
 
         lesson_instance.save()
-        related_shift_lesson_relations = getattr(lesson_instance, f'lesson{relation_num}')
-        update_data = {f'lesson{relation_num}': None}
-        related_shift_lesson_relations.update(**update_data)
+        lesson_instance.seats.filter(seat_no=relation_num).update(lesson=None)
 
         return super().get(request, *args, **kwargs)
     
@@ -1,7 +1,8 @@
 from django.contrib import admin
-from .models import SpecialLesson, SpecialLessonStudentRequest, SpecialLessonTeacherRequest
+from .models import SpecialLesson, SpecialLessonStudentRequest, SpecialLessonTeacherRequest, SpecialLessonDraft
 
 # Register your models here.
 admin.site.register(SpecialLesson)
 admin.site.register(SpecialLessonStudentRequest)
-admin.site.register(SpecialLessonTeacherRequest)
\ No newline at end of file
+admin.site.register(SpecialLessonTeacherRequest)
+admin.site.register(SpecialLessonDraft)
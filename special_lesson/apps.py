@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SpecialLessonConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'special_lesson'
+
+    def ready(self):
+        from . import signals
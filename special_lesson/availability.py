@@ -0,0 +1,62 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
+
+from .models import SpecialLessonTeacherRequest, SpecialLessonStudentRequest
+
+# 講習の希望調査の結果(出勤・受講可能な講師と生徒)を日付ごとにキャッシュする
+AVAILABILITY_CACHE_TIMEOUT = 60 * 60 * 24
+
+def get_availability_cache_key(special_lesson_id, date):
+    return f'special_lesson_availability:{special_lesson_id}:{date.isoformat()}'
+
+# 時間ごとのIDのリストをDBでまとめる(PostgreSQL以外では同じ結果をPythonで作成)
+def group_ids_by_time(queryset, field):
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.aggregates import ArrayAgg
+        return dict(
+            queryset.order_by().values('time').annotate(ids=ArrayAgg(field, ordering=field)).values_list('time', 'ids')
+        )
+
+    grouped = defaultdict(list)
+    for time, id in queryset.order_by(field).values_list('time', field):
+        grouped[time].append(id)
+    return dict(grouped)
+
+def load_availability(special_lesson_id, date):
+    teachers = group_ids_by_time(
+        SpecialLessonTeacherRequest.objects.filter(special_lesson_id=special_lesson_id, date=date, is_available=True),
+        'teacher_id',
+    )
+    students = group_ids_by_time(
+        SpecialLessonStudentRequest.objects.filter(special_lesson_id=special_lesson_id, date=date, is_available=True),
+        'student_id',
+    )
+    return {'teachers': teachers, 'students': students}
+
+# {時間: {'teachers': [講師ID], 'students': [生徒ID]}}の形式で返す
+def get_availability(special_lesson, date, times):
+    if special_lesson is None:
+        availability = {'teachers': {}, 'students': {}}
+    else:
+        key = get_availability_cache_key(special_lesson.id, date)
+        availability = cache.get(key)
+        if availability is None:
+            availability = load_availability(special_lesson.id, date)
+            cache.set(key, availability, AVAILABILITY_CACHE_TIMEOUT)
+
+    return {
+        time: {
+            'teachers': availability['teachers'].get(time, []),
+            'students': availability['students'].get(time, []),
+        }
+        for time in times
+    }
+
+# 希望調査を変更した日付のキャッシュを削除する(日付の指定がない場合は講習期間全体)
+def invalidate_availability(special_lesson, dates=None):
+    if dates is None:
+        dates = [special_lesson.start_date + timedelta(days=i) for i in range((special_lesson.end_date - special_lesson.start_date).days + 1)]
+    cache.delete_many([get_availability_cache_key(special_lesson.id, date) for date in dates])
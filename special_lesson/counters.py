@@ -0,0 +1,34 @@
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import SpecialLessonAdmin
+
+# SpecialLessonAdmin.scheduled_countをまとめて増減する({講習のID: 増減数})
+def add_scheduled_counts(deltas):
+    # 増減数が同じ講習は1回のUPDATEにまとめる
+    admin_ids_by_delta = defaultdict(list)
+    for admin_id, delta in deltas.items():
+        if admin_id is not None and delta:
+            admin_ids_by_delta[delta].append(admin_id)
+    for delta, admin_ids in admin_ids_by_delta.items():
+        SpecialLessonAdmin.objects.filter(id__in=admin_ids).update(scheduled_count=F('scheduled_count') + delta)
+
+# bulk_createなどシグナルが送られない処理で作成した授業を反映する
+def count_created_lessons(lessons):
+    add_scheduled_counts(Counter(lesson.special_id for lesson in lessons))
+
+# 実際の授業数と一致しない講習の件数を返し、repair=Trueの場合は1回のUPDATEで再計算する
+def repair_scheduled_counts(repair=True):
+    from regular_lesson.models import Lesson
+    actual_count = Coalesce(
+        Subquery(
+            Lesson.objects.filter(special=OuterRef('pk')).order_by().values('special').annotate(count=Count('id')).values('count')
+        ),
+        Value(0),
+    )
+    mismatched = SpecialLessonAdmin.objects.annotate(actual_count=actual_count).exclude(scheduled_count=F('actual_count')).count()
+    if repair and mismatched:
+        SpecialLessonAdmin.objects.update(scheduled_count=actual_count)
+    return mismatched
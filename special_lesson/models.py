@@ -20,14 +20,20 @@ class SpecialLessonAdmin(models.Model):
     special_lesson = models.ForeignKey(SpecialLesson, on_delete=models.CASCADE, related_name='special_lesson')
     periods = models.PositiveIntegerField()
     subject = models.IntegerField(choices=SUBJECT_CHOICES)
+    # 登録済みの授業数(Lessonの作成・削除時にsignalsで更新、repair_scheduled_countsで再計算)
+    scheduled_count = models.PositiveIntegerField(default=0)
 
     def get_referencing_lesson_count(self):
         from regular_lesson.models import Lesson
         return Lesson.objects.filter(special=self).count()
 
     def __str__(self):
-        referencing_lesson_count = self.get_referencing_lesson_count()
-        return f'{self.student} {self.get_subject_display()} 選択済みコマ数 {referencing_lesson_count} / {self.periods}コマ'
+        return f'{self.student} {self.get_subject_display()} 選択済みコマ数 {self.scheduled_count} / {self.periods}コマ'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['special_lesson', 'scheduled_count', 'periods'], name='special_admin_remaining_idx'),
+        ]
     
 
 class SpecialLessonStudentRequest(models.Model):
@@ -40,6 +46,15 @@ class SpecialLessonStudentRequest(models.Model):
     def __str__(self):
         return f'{self.student}- {self.special_lesson} - {self.date} - {self.get_time_display()}'
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'special_lesson', 'date', 'time'], name='unique_special_lesson_student_request'),
+        ]
+        indexes = [
+            # 講習の日付ごとの参加可能な生徒
+            models.Index(fields=['special_lesson', 'date', 'time'], condition=models.Q(is_available=True), name='student_request_available_idx'),
+        ]
+
 class SpecialLessonTeacherRequest(models.Model):
     teacher = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     special_lesson = models.ForeignKey(SpecialLesson, on_delete=models.CASCADE)
@@ -49,3 +64,29 @@ class SpecialLessonTeacherRequest(models.Model):
 
     def __str__(self):
         return f'{self.teacher}- {self.special_lesson} - {self.date} - {self.get_time_display()}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['teacher', 'special_lesson', 'date', 'time'], name='unique_special_lesson_teacher_request'),
+        ]
+        indexes = [
+            # 講習の日付ごとの出勤可能な講師
+            models.Index(fields=['special_lesson', 'date', 'time'], condition=models.Q(is_available=True), name='teacher_request_available_idx'),
+        ]
+
+# 講習授業の自動配置の結果(塾長が確認してからまとめて登録する)
+class SpecialLessonDraft(models.Model):
+    special_lesson = models.ForeignKey(SpecialLesson, on_delete=models.CASCADE, related_name='drafts')
+    # [[SpecialLessonAdminのID, 日付, 時間, 教室]]
+    lessons = models.JSONField(default=list)
+    # [[講師のID, 日付, 時間, 教室]]
+    teacher_shifts = models.JSONField(default=list)
+    # {SpecialLessonAdminのID: 配置できなかったコマ数}
+    unplaced = models.JSONField(default=dict)
+    # 評価値と実行時間
+    stats = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    committed_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f'{self.special_lesson} {self.created_at}'
@@ -0,0 +1,74 @@
+from datetime import date as Date
+
+from django.db import transaction
+
+from .models import SpecialLessonTeacherRequest, SpecialLessonStudentRequest
+from .availability import invalidate_availability
+from utils.choices import TIME_CHOICES, SPECIAL_TIME_CHOICES
+
+# 講習の希望調査(講師・生徒 × 日付 × 時間)をまとめて作成する
+# (owner, special_lesson, date, time)の一意制約により、既に存在する行は作成されない(何度実行しても同じ結果)
+
+def get_request_times(special_lesson):
+    # 拡張の場合
+    if special_lesson.is_extend:
+        return [time[0] for time in TIME_CHOICES] + [time[0] for time in SPECIAL_TIME_CHOICES]
+    return [time[0] for time in TIME_CHOICES]
+
+def provision_requests(model, owner_field, owner_ids, special_lesson, dates):
+    times = get_request_times(special_lesson)
+    with transaction.atomic():
+        model.objects.bulk_create([
+            model(**{owner_field: owner_id}, special_lesson=special_lesson, date=date, time=time)
+            for owner_id in owner_ids
+            for date in dates
+            for time in times
+        ], batch_size=1000, ignore_conflicts=True)
+    invalidate_availability(special_lesson, dates)
+
+def provision_teacher_requests(special_lesson, teacher_ids, dates):
+    provision_requests(SpecialLessonTeacherRequest, 'teacher_id', teacher_ids, special_lesson, dates)
+
+def provision_student_requests(special_lesson, student_ids, dates):
+    provision_requests(SpecialLessonStudentRequest, 'student_id', student_ids, special_lesson, dates)
+
+# 送信された{日付: {時間: bool}}と保存済みの希望を比較し、変更された行だけを更新する(変更した件数を返す)
+def save_requests(model, owner_field, owner_id, special_lesson, json_data):
+    submitted = {
+        (Date.fromisoformat(date), int(time)): bool(value)
+        for date, times in json_data.items()
+        for time, value in times.items()
+    }
+    available_ids = []
+    unavailable_ids = []
+    changed_dates = set()
+
+    with transaction.atomic():
+        requests = model.objects.filter(
+            **{owner_field: owner_id},
+            special_lesson=special_lesson,
+            date__in={date for date, _ in submitted},
+        ).values_list('id', 'date', 'time', 'is_available')
+        for id, date, time, is_available in requests:
+            value = submitted.get((date, time))
+            if value is None or value == is_available:
+                continue
+            (available_ids if value else unavailable_ids).append(id)
+            changed_dates.add(date)
+
+        # 可・不可ごとに1回ずつ更新
+        if available_ids:
+            model.objects.filter(id__in=available_ids).update(is_available=True)
+        if unavailable_ids:
+            model.objects.filter(id__in=unavailable_ids).update(is_available=False)
+
+    # シフト詳細の希望調査の結果を更新
+    if changed_dates:
+        invalidate_availability(special_lesson, sorted(changed_dates))
+    return len(available_ids) + len(unavailable_ids)
+
+def save_teacher_requests(special_lesson, teacher_id, json_data):
+    return save_requests(SpecialLessonTeacherRequest, 'teacher_id', teacher_id, special_lesson, json_data)
+
+def save_student_requests(special_lesson, student_id, json_data):
+    return save_requests(SpecialLessonStudentRequest, 'student_id', student_id, special_lesson, json_data)
@@ -0,0 +1,16 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .counters import add_scheduled_counts
+from regular_lesson.models import Lesson
+
+# 講習の授業が作成・削除された場合は登録済みの授業数を更新する
+@receiver(post_save, sender=Lesson)
+def increment_scheduled_count(sender, instance, created, **kwargs):
+    if created and instance.special_id:
+        add_scheduled_counts({instance.special_id: 1})
+
+@receiver(post_delete, sender=Lesson)
+def decrement_scheduled_count(sender, instance, **kwargs):
+    if instance.special_id:
+        add_scheduled_counts({instance.special_id: -1})
@@ -0,0 +1,542 @@
+import math
+import time as timer
+from collections import defaultdict, deque
+from datetime import date as Date
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import SpecialLessonAdmin, SpecialLessonStudentRequest, SpecialLessonTeacherRequest, SpecialLessonDraft
+from .counters import count_created_lessons
+from regular_lesson.models import Lesson
+from shift.models import SEAT_NUMBERS, Shift, ShiftSeat
+from teacher_shift.models import TeacherShift, TemporalyShift
+from year_schedule.feeds import invalidate_calendar_feeds
+from year_schedule.month_schedule import invalidate_all_month_schedules
+from utils.helpers import get_clousure_dates, get_fiscal_year_boundaries, get_today
+
+# 講習授業の自動配置
+# 1. 最大流: 講習(残りコマ数) → 講習×日付(1日の上限) → 生徒×コマ(1) → コマ(席数) で配置できるコマ数を最大にする
+#    1日の上限は均等に割った値から始め、配置しきれない場合は1ずつ緩めて残余グラフ上で増加路を探す
+# 2. 局所探索: 配置数を変えずに同じ日・同じ科目の偏りと追加で必要な講師の数を減らす
+# 3. コマごとに講師のいる教室から席を埋め、足りない分は出勤可能な講師を割り当てて教室を開ける
+
+# 評価値の重み
+SAME_DAY_WEIGHT = 1
+SAME_SUBJECT_DAY_WEIGHT = 3
+EXTRA_TEACHER_WEIGHT = 2
+LOCAL_SEARCH_SECONDS = 5
+
+class MaxFlow:
+    def __init__(self):
+        self.graph = []
+        self.to = []
+        self.capacity = []
+
+    def add_node(self):
+        self.graph.append([])
+        return len(self.graph) - 1
+
+    def add_edge(self, source, target, capacity):
+        edge = len(self.to)
+        self.graph[source].append(edge)
+        self.to.append(target)
+        self.capacity.append(capacity)
+        self.graph[target].append(edge + 1)
+        self.to.append(source)
+        self.capacity.append(0)
+        return edge
+
+    def flow(self, edge):
+        return self.capacity[edge ^ 1]
+
+    # Dinic法
+    def max_flow(self, source, sink):
+        total = 0
+        while True:
+            level = [-1] * len(self.graph)
+            level[source] = 0
+            queue = deque([source])
+            while queue:
+                node = queue.popleft()
+                for edge in self.graph[node]:
+                    if self.capacity[edge] > 0 and level[self.to[edge]] < 0:
+                        level[self.to[edge]] = level[node] + 1
+                        queue.append(self.to[edge])
+            if level[sink] < 0:
+                return total
+
+            pointer = [0] * len(self.graph)
+
+            def augment(node, limit):
+                if node == sink:
+                    return limit
+                edges = self.graph[node]
+                while pointer[node] < len(edges):
+                    edge = edges[pointer[node]]
+                    target = self.to[edge]
+                    if self.capacity[edge] > 0 and level[target] == level[node] + 1:
+                        pushed = augment(target, min(limit, self.capacity[edge]))
+                        if pushed:
+                            self.capacity[edge] -= pushed
+                            self.capacity[edge ^ 1] += pushed
+                            return pushed
+                    pointer[node] += 1
+                return 0
+
+            while True:
+                pushed = augment(source, math.inf)
+                if not pushed:
+                    break
+                total += pushed
+
+class Room:
+    def __init__(self, shift):
+        self.room = shift.room
+        self.teacher_shift_id = shift.teacher_shift_id
+        relation = shift.lessons
+        # 空席はlesson_idで判定する(授業を読み込まない)
+        self.free_seats = [seat.seat_no for seat in sorted(relation.seats.all(), key=lambda seat: seat.seat_no) if seat.seat_no in SEAT_NUMBERS and seat.lesson_id is None] if relation else []
+
+class Slot:
+    def __init__(self, date, time):
+        self.date = date
+        self.time = time
+        self.rooms = []
+        # 出勤可能でまだシフトに入っていない講師
+        self.idle_teachers = []
+
+    # 講師のいる教室の席と、出勤可能な講師の人数分だけ開けられる教室の席
+    def prepare(self):
+        self.staffed_rooms = [room for room in self.rooms if room.teacher_shift_id and room.free_seats]
+        self.open_rooms = sorted(
+            [room for room in self.rooms if not room.teacher_shift_id and room.free_seats],
+            key=lambda room: (-len(room.free_seats), room.room),
+        )[:len(self.idle_teachers)]
+        staffed_seats = sum(len(room.free_seats) for room in self.staffed_rooms)
+        self.capacity = staffed_seats + sum(len(room.free_seats) for room in self.open_rooms)
+
+        # 授業数ごとの追加で必要な講師の人数
+        self.extra_teachers = [0] * (self.capacity + 1)
+        seats, opened = staffed_seats, 0
+        for count in range(self.capacity + 1):
+            while count > seats:
+                seats += len(self.open_rooms[opened].free_seats)
+                opened += 1
+            self.extra_teachers[count] = opened
+
+class Problem:
+    def __init__(self, special_lesson):
+        self.special_lesson = special_lesson
+        self.slots = []
+        self.slot_index = {}
+        self.admins = []
+        self.remaining = {}
+        # 生徒ごとの受講可能なコマ
+        self.student_slots = defaultdict(set)
+
+def load_problem(special_lesson):
+    problem = Problem(special_lesson)
+    start_date, end_date = special_lesson.start_date, special_lesson.end_date
+    clousure_dates = get_clousure_dates(start_date, end_date)
+
+    # 既存のシフト(休校日を除く)
+    slots = {}
+    shifts = Shift.objects.filter(date__gte=start_date, date__lte=end_date).exclude(date__in=clousure_dates).select_related('lessons').prefetch_related('lessons__seats').order_by('date', 'time', 'room')
+    for shift in shifts:
+        key = (shift.date, shift.time)
+        if key not in slots:
+            slots[key] = Slot(shift.date, shift.time)
+        slots[key].rooms.append(Room(shift))
+
+    # 出勤可能で、同じコマにシフトのない講師
+    busy_teachers = set(TeacherShift.objects.filter(date__gte=start_date, date__lte=end_date).values_list('teacher_id', 'date', 'time'))
+    teacher_requests = SpecialLessonTeacherRequest.objects.filter(
+        special_lesson=special_lesson, is_available=True, teacher__teacher_profile__is_withdrawn=False,
+    ).order_by('teacher_id').values_list('teacher_id', 'date', 'time')
+    for teacher_id, date, time in teacher_requests:
+        if (date, time) in slots and (teacher_id, date, time) not in busy_teachers:
+            slots[(date, time)].idle_teachers.append(teacher_id)
+
+    for key in sorted(slots):
+        slot = slots[key]
+        slot.prepare()
+        problem.slot_index[key] = len(problem.slots)
+        problem.slots.append(slot)
+
+    # 残りコマ数のある講習
+    admins = SpecialLessonAdmin.objects.filter(special_lesson=special_lesson, scheduled_count__lt=F('periods')).order_by('id')
+    for admin in admins:
+        problem.admins.append(admin)
+        problem.remaining[admin.id] = admin.periods - admin.scheduled_count
+    student_ids = {admin.student_id for admin in problem.admins}
+
+    # 受講可能で、同じコマに授業(振替先を含む)のない生徒
+    busy_students = set()
+    lessons = Lesson.objects.filter(student_id__in=student_ids, is_absence=False).filter(
+        Q(date__gte=start_date, date__lte=end_date) | Q(rescheduled_date__gte=start_date, rescheduled_date__lte=end_date)
+    ).values_list('student_id', 'date', 'time', 'rescheduled_date', 'rescheduled_time')
+    for student_id, date, time, rescheduled_date, rescheduled_time in lessons:
+        busy_students.add((student_id, date, time))
+        if rescheduled_date:
+            busy_students.add((student_id, rescheduled_date, rescheduled_time))
+
+    student_requests = SpecialLessonStudentRequest.objects.filter(
+        special_lesson=special_lesson, is_available=True, student_id__in=student_ids,
+    ).values_list('student_id', 'date', 'time')
+    for student_id, date, time in student_requests:
+        index = problem.slot_index.get((date, time))
+        if index is not None and problem.slots[index].capacity and (student_id, date, time) not in busy_students:
+            problem.student_slots[student_id].add(index)
+
+    return problem
+
+# 最大流で配置数が最大になるように講習をコマに割り当てる({講習のID: [コマ]})
+def assign_by_flow(problem):
+    graph = MaxFlow()
+    source, sink = graph.add_node(), graph.add_node()
+
+    slot_nodes = []
+    for slot in problem.slots:
+        node = graph.add_node()
+        graph.add_edge(node, sink, slot.capacity)
+        slot_nodes.append(node)
+
+    student_slot_nodes = {}
+    day_edges = []
+    assignment_edges = []
+    for admin in problem.admins:
+        slots_by_date = defaultdict(list)
+        for index in problem.student_slots[admin.student_id]:
+            slots_by_date[problem.slots[index].date].append(index)
+        if not slots_by_date:
+            continue
+
+        admin_node = graph.add_node()
+        graph.add_edge(source, admin_node, problem.remaining[admin.id])
+        # 1日の上限は残りコマ数を受講可能な日数で割った値から始める
+        day_limit = math.ceil(problem.remaining[admin.id] / len(slots_by_date))
+        for date, indexes in slots_by_date.items():
+            day_node = graph.add_node()
+            day_edges.append((graph.add_edge(admin_node, day_node, day_limit), len(indexes)))
+            for index in indexes:
+                key = (admin.student_id, index)
+                if key not in student_slot_nodes:
+                    student_slot_nodes[key] = graph.add_node()
+                    graph.add_edge(student_slot_nodes[key], slot_nodes[index], 1)
+                assignment_edges.append((admin.id, index, graph.add_edge(day_node, student_slot_nodes[key], 1)))
+
+    graph.max_flow(source, sink)
+    # 配置しきれない場合は1日の上限を緩める
+    while True:
+        relaxed = False
+        for edge, limit in day_edges:
+            if graph.capacity[edge] == 0 and graph.flow(edge) < limit:
+                graph.capacity[edge] += 1
+                relaxed = True
+        if not relaxed or not graph.max_flow(source, sink):
+            break
+
+    assignment = defaultdict(list)
+    for admin_id, index, edge in assignment_edges:
+        if graph.flow(edge):
+            assignment[admin_id].append(index)
+    return assignment
+
+class Schedule:
+    def __init__(self, problem, assignment):
+        self.problem = problem
+        self.student_of = {admin.id: admin.student_id for admin in problem.admins}
+        # [講習のID, コマ]のリスト
+        self.lessons = [[admin_id, index] for admin_id, indexes in assignment.items() for index in indexes]
+        self.load = [0] * len(problem.slots)
+        self.student_busy = set()
+        self.student_day = defaultdict(int)
+        self.admin_day = defaultdict(int)
+        for admin_id, index in self.lessons:
+            self.add(admin_id, index)
+
+    def date(self, index):
+        return self.problem.slots[index].date
+
+    def add(self, admin_id, index):
+        student_id = self.student_of[admin_id]
+        self.load[index] += 1
+        self.student_busy.add((student_id, index))
+        self.student_day[(student_id, self.date(index))] += 1
+        self.admin_day[(admin_id, self.date(index))] += 1
+
+    def remove(self, admin_id, index):
+        student_id = self.student_of[admin_id]
+        self.load[index] -= 1
+        self.student_busy.discard((student_id, index))
+        self.student_day[(student_id, self.date(index))] -= 1
+        self.admin_day[(admin_id, self.date(index))] -= 1
+
+    def day_cost(self, admin_id, date):
+        student_count = self.student_day[(self.student_of[admin_id], date)]
+        admin_count = self.admin_day[(admin_id, date)]
+        return SAME_DAY_WEIGHT * student_count * (student_count - 1) // 2 + SAME_SUBJECT_DAY_WEIGHT * admin_count * (admin_count - 1) // 2
+
+    def slot_cost(self, index):
+        return EXTRA_TEACHER_WEIGHT * self.problem.slots[index].extra_teachers[self.load[index]]
+
+    def cost(self):
+        day_cost = 0
+        for (student_id, _), count in self.student_day.items():
+            day_cost += SAME_DAY_WEIGHT * count * (count - 1) // 2
+        for _, count in self.admin_day.items():
+            day_cost += SAME_SUBJECT_DAY_WEIGHT * count * (count - 1) // 2
+        return day_cost + sum(self.slot_cost(index) for index in range(len(self.problem.slots)))
+
+    def local_cost(self, admin_id, source, target):
+        dates = {self.date(source), self.date(target)}
+        student_id = self.student_of[admin_id]
+        cost = self.slot_cost(source) + self.slot_cost(target)
+        for date in dates:
+            student_count = self.student_day[(student_id, date)]
+            cost += SAME_DAY_WEIGHT * student_count * (student_count - 1) // 2
+            admin_count = self.admin_day[(admin_id, date)]
+            cost += SAME_SUBJECT_DAY_WEIGHT * admin_count * (admin_count - 1) // 2
+        return cost
+
+    # 授業を別のコマに移動して評価値が下がる場合は移動する
+    def try_move(self, lesson, target):
+        admin_id, source = lesson
+        student_id = self.student_of[admin_id]
+        if target == source or (student_id, target) in self.student_busy or self.load[target] >= self.problem.slots[target].capacity:
+            return False
+
+        before = self.local_cost(admin_id, source, target)
+        self.remove(admin_id, source)
+        self.add(admin_id, target)
+        if self.local_cost(admin_id, source, target) < before:
+            lesson[1] = target
+            return True
+        self.remove(admin_id, target)
+        self.add(admin_id, source)
+        return False
+
+    # 同じ生徒の2つの授業のコマを入れ替えて評価値が下がる場合は入れ替える(科目の偏りの解消)
+    def try_swap(self, lesson, other):
+        if lesson[0] == other[0] or lesson[1] == other[1]:
+            return False
+        dates = {self.date(lesson[1]), self.date(other[1])}
+        before = sum(self.day_cost(admin_id, date) for admin_id in (lesson[0], other[0]) for date in dates)
+        self.remove(lesson[0], lesson[1])
+        self.remove(other[0], other[1])
+        self.add(lesson[0], other[1])
+        self.add(other[0], lesson[1])
+        if sum(self.day_cost(admin_id, date) for admin_id in (lesson[0], other[0]) for date in dates) < before:
+            lesson[1], other[1] = other[1], lesson[1]
+            return True
+        self.remove(lesson[0], other[1])
+        self.remove(other[0], lesson[1])
+        self.add(lesson[0], lesson[1])
+        self.add(other[0], other[1])
+        return False
+
+    def improve(self, seconds=LOCAL_SEARCH_SECONDS):
+        deadline = timer.perf_counter() + seconds
+        lessons_by_student = defaultdict(list)
+        for lesson in self.lessons:
+            lessons_by_student[self.student_of[lesson[0]]].append(lesson)
+
+        improved = True
+        while improved and timer.perf_counter() < deadline:
+            improved = False
+            for lesson in self.lessons:
+                student_id = self.student_of[lesson[0]]
+                for target in sorted(self.problem.student_slots[student_id]):
+                    if self.try_move(lesson, target):
+                        improved = True
+                        break
+                for other in lessons_by_student[student_id]:
+                    if self.try_swap(lesson, other):
+                        improved = True
+                if timer.perf_counter() >= deadline:
+                    break
+
+class Solution:
+    def __init__(self):
+        # [講習のID, 日付, 時間, 教室]
+        self.lessons = []
+        # [講師のID, 日付, 時間, 教室]
+        self.teacher_shifts = []
+        # {講習のID: 配置できなかったコマ数}
+        self.unplaced = {}
+        self.stats = {}
+
+# コマごとに講師のいる教室から席を埋め、足りない分は出勤の少ない講師から教室を開ける
+def assign_rooms(problem, schedule, solution):
+    lessons_by_slot = defaultdict(list)
+    for admin_id, index in schedule.lessons:
+        lessons_by_slot[index].append(admin_id)
+
+    teacher_load = defaultdict(int)
+    for index in sorted(lessons_by_slot):
+        slot = problem.slots[index]
+        admin_ids = sorted(lessons_by_slot[index])
+        opened = slot.extra_teachers[len(admin_ids)]
+        idle_teachers = sorted(slot.idle_teachers, key=lambda teacher_id: (teacher_load[teacher_id], teacher_id))
+        for room, teacher_id in zip(slot.open_rooms[:opened], idle_teachers):
+            teacher_load[teacher_id] += 1
+            solution.teacher_shifts.append([teacher_id, slot.date.isoformat(), slot.time, room.room])
+
+        seats = [room.room for room in slot.staffed_rooms + slot.open_rooms[:opened] for _ in room.free_seats]
+        for admin_id, room in zip(admin_ids, seats):
+            solution.lessons.append([admin_id, slot.date.isoformat(), slot.time, room])
+
+def solve(special_lesson, seconds=LOCAL_SEARCH_SECONDS):
+    started = timer.perf_counter()
+    problem = load_problem(special_lesson)
+    loaded = timer.perf_counter()
+
+    assignment = assign_by_flow(problem)
+    schedule = Schedule(problem, assignment)
+    flow_cost = schedule.cost()
+    flowed = timer.perf_counter()
+
+    schedule.improve(seconds)
+
+    solution = Solution()
+    assign_rooms(problem, schedule, solution)
+    placed = defaultdict(int)
+    for admin_id, _ in schedule.lessons:
+        placed[admin_id] += 1
+    solution.unplaced = {
+        str(admin.id): problem.remaining[admin.id] - placed[admin.id]
+        for admin in problem.admins
+        if problem.remaining[admin.id] > placed[admin.id]
+    }
+    solution.stats = {
+        'requested': sum(problem.remaining.values()),
+        'placed': len(schedule.lessons),
+        'teachers': len(solution.teacher_shifts),
+        'flow_cost': flow_cost,
+        'cost': schedule.cost(),
+        'load_seconds': round(loaded - started, 3),
+        'flow_seconds': round(flowed - loaded, 3),
+        'seconds': round(timer.perf_counter() - started, 3),
+    }
+    return solution
+
+def create_draft(special_lesson):
+    solution = solve(special_lesson)
+    return SpecialLessonDraft.objects.create(
+        special_lesson=special_lesson,
+        lessons=solution.lessons,
+        teacher_shifts=solution.teacher_shifts,
+        unplaced=solution.unplaced,
+        stats=solution.stats,
+    )
+
+class CommitResult:
+    def __init__(self):
+        self.lessons = []
+        self.teacher_shifts = []
+        # 作成後に席や教室が埋まっていた、またはコマ数を超えたため登録しなかった件数
+        self.skipped_lessons = 0
+        self.skipped_teacher_shifts = 0
+
+# 確認済みの配置案をまとめて登録する(作成後に変更された席・教室・講師・生徒の予定は飛ばす、登録済みの場合はNone)
+def commit_draft(draft):
+    result = CommitResult()
+    dates = sorted({Date.fromisoformat(row[1]) for row in draft.lessons + draft.teacher_shifts})
+    _, end_date = get_fiscal_year_boundaries(get_today())
+
+    with transaction.atomic():
+        # 同時に登録された場合に二重に登録しない
+        draft = SpecialLessonDraft.objects.select_for_update().get(pk=draft.pk)
+        if draft.committed_at:
+            return None
+
+        shifts = {
+            (shift.date, shift.time, shift.room): shift
+            for shift in Shift.objects.select_for_update().filter(date__in=dates)
+        }
+        # 空席を(日付, 時間, 教室)ごとに席番号順で並べる
+        free_seats = defaultdict(list)
+        for seat in ShiftSeat.objects.select_for_update().filter(relation__lessons__date__in=dates, seat_no__in=SEAT_NUMBERS, lesson=None).annotate(
+            date=F('relation__lessons__date'), time=F('relation__lessons__time'), room=F('relation__lessons__room'),
+        ).order_by('seat_no'):
+            free_seats[(seat.date, seat.time, seat.room)].append(seat)
+
+        # 作成後に入った講師のシフト・生徒の授業(振替先を含む)
+        busy_teachers = set(TeacherShift.objects.filter(date__in=dates).values_list('teacher_id', 'date', 'time'))
+        busy_students = set()
+        lessons = Lesson.objects.filter(is_absence=False).filter(
+            Q(date__in=dates) | Q(rescheduled_date__in=dates)
+        ).values_list('student_id', 'date', 'time', 'rescheduled_date', 'rescheduled_time')
+        for student_id, date, time, rescheduled_date, rescheduled_time in lessons:
+            busy_students.add((student_id, date, time))
+            if rescheduled_date:
+                busy_students.add((student_id, rescheduled_date, rescheduled_time))
+
+        # 講師
+        teacher_targets = []
+        for teacher_id, date, time, room in draft.teacher_shifts:
+            shift = shifts.get((Date.fromisoformat(date), time, room))
+            if shift is None or shift.teacher_shift_id is not None or (teacher_id, shift.date, shift.time) in busy_teachers:
+                result.skipped_teacher_shifts += 1
+                continue
+            busy_teachers.add((teacher_id, shift.date, shift.time))
+            teacher_targets.append((teacher_id, shift))
+        temporaly_shifts = TemporalyShift.objects.bulk_create([
+            TemporalyShift(teacher_id=teacher_id, date=shift.date, time=shift.time, is_special=True)
+            for teacher_id, shift in teacher_targets
+        ])
+        result.teacher_shifts = TeacherShift.objects.bulk_create([
+            TeacherShift(teacher_id=teacher_id, temporaly_shift=temporaly_shift, date=shift.date, time=shift.time, is_fixed=False)
+            for (teacher_id, shift), temporaly_shift in zip(teacher_targets, temporaly_shifts)
+        ])
+        for (_, shift), teacher_shift in zip(teacher_targets, result.teacher_shifts):
+            shift.teacher_shift = teacher_shift
+        Shift.objects.bulk_update([shift for _, shift in teacher_targets], ['teacher_shift'])
+
+        # 授業
+        admins = SpecialLessonAdmin.objects.select_for_update().filter(special_lesson=draft.special_lesson).in_bulk()
+        remaining = {admin.id: admin.periods - admin.scheduled_count for admin in admins.values()}
+        new_lessons = []
+        seats = []
+        for admin_id, date, time, room in draft.lessons:
+            admin = admins.get(admin_id)
+            shift = shifts.get((Date.fromisoformat(date), time, room))
+            room_seats = free_seats[(shift.date, shift.time, shift.room)] if shift else []
+            if admin is None or remaining[admin_id] <= 0 or not room_seats or (admin.student_id, shift.date, shift.time) in busy_students:
+                result.skipped_lessons += 1
+                continue
+
+            remaining[admin_id] -= 1
+            busy_students.add((admin.student_id, shift.date, shift.time))
+            seat = room_seats.pop(0)
+            # 来年度の講習の場合は過年度生でなければ学年を一つ進める
+            grade = admin.grade
+            if shift.date > end_date and grade is not None and grade != 13:
+                grade += 1
+            new_lessons.append(Lesson(
+                special=admin,
+                student_id=admin.student_id,
+                grade=grade,
+                subject=admin.subject,
+                date=shift.date,
+                time=shift.time,
+                is_regular=False,
+            ))
+            seats.append(seat)
+
+        result.lessons = Lesson.objects.bulk_create(new_lessons)
+        count_created_lessons(result.lessons)
+        for lesson, seat in zip(result.lessons, seats):
+            seat.lesson = lesson
+        ShiftSeat.objects.bulk_update(seats, ['lesson'])
+
+        draft.committed_at = timezone.now()
+        draft.save(update_fields=['committed_at'])
+
+    # bulk_createではシグナルが送られないためキャッシュを破棄する
+    invalidate_calendar_feeds('student', [lesson.student_id for lesson in result.lessons])
+    invalidate_calendar_feeds('teacher', [teacher_shift.teacher_id for teacher_shift in result.teacher_shifts])
+    invalidate_all_month_schedules()
+    return result
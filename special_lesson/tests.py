@@ -1,3 +1,271 @@
+import json
+from datetime import date
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import CustomUser, TeacherProfile
+from students.models import Student
+from special_lesson.models import SpecialLesson, SpecialLessonAdmin, SpecialLessonTeacherRequest, SpecialLessonStudentRequest
+from special_lesson.availability import get_availability
+from special_lesson.solver import solve, create_draft, commit_draft, load_problem
+from regular_lesson.models import Lesson
+from shift.models import Shift, ShiftLessonRelation, ShiftSeat
+from shift.seats import create_seats
+from teacher_shift.models import TeacherShift
+from special_lesson.request_grid import provision_teacher_requests, provision_student_requests, save_teacher_requests
+from utils.helpers import generate_shifts_bulk, invalidate_clousure_dates
+from utils.choices import TIME_CHOICES
+
+class AvailabilityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.date = date(2024, 7, 22)
+        self.times = [time[0] for time in TIME_CHOICES]
+        self.special_lesson = SpecialLesson.objects.create(name='夏期講習', start_date=self.date, end_date=date(2024, 7, 26))
+        self.teachers = [CustomUser.objects.create(username=f'teacher-{i}', is_teacher=True) for i in range(2)]
+        self.students = [Student.objects.create(last_name='生徒', first_name=f'{i}', grade=7) for i in range(2)]
+        for time in self.times:
+            for teacher in self.teachers:
+                SpecialLessonTeacherRequest.objects.create(teacher=teacher, special_lesson=self.special_lesson, date=self.date, time=time)
+            for student in self.students:
+                SpecialLessonStudentRequest.objects.create(student=student, special_lesson=self.special_lesson, date=self.date, time=time)
+        SpecialLessonTeacherRequest.objects.filter(teacher=self.teachers[1], time=1).update(is_available=False)
+
+    def test_grouped_by_time(self):
+        with CaptureQueriesContext(connection) as queries:
+            availability = get_availability(self.special_lesson, self.date, self.times)
+
+        # 講師と生徒で1クエリずつ
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(availability[1]['teachers'], [self.teachers[0].id])
+        self.assertEqual(availability[2]['teachers'], [teacher.id for teacher in self.teachers])
+        self.assertEqual(availability[5]['students'], [student.id for student in self.students])
+
+    def test_no_special_lesson(self):
+        with CaptureQueriesContext(connection) as queries:
+            availability = get_availability(None, self.date, self.times)
+
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(availability[1], {'teachers': [], 'students': []})
+
+    def test_cache_invalidated_by_request_form(self):
+        get_availability(self.special_lesson, self.date, self.times)
+        with CaptureQueriesContext(connection) as queries:
+            get_availability(self.special_lesson, self.date, self.times)
+        self.assertEqual(len(queries), 0)
+
+        self.client.force_login(self.teachers[0])
+        json_data = {self.date.strftime('%Y-%m-%d'): {'1': False}}
+        self.client.post(reverse('teacher:special_lesson_request', args=[self.special_lesson.pk]), {'json_data': json.dumps(json_data)})
+
+        availability = get_availability(self.special_lesson, self.date, self.times)
+        self.assertEqual(availability[1]['teachers'], [])
+
+class RequestGridTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        invalidate_clousure_dates()
+        self.addCleanup(invalidate_clousure_dates)
+        self.dates = [date(2024, 7, 22 + i) for i in range(5)]
+        self.special_lesson = SpecialLesson.objects.create(name='夏期講習', start_date=self.dates[0], end_date=self.dates[-1], is_extend=True)
+
+    def test_idempotent(self):
+        teacher_ids = [CustomUser.objects.create(username=f'teacher-{i}', is_teacher=True).id for i in range(3)]
+
+        provision_teacher_requests(self.special_lesson, teacher_ids, self.dates)
+        # 既存の行は作成されない
+        provision_teacher_requests(self.special_lesson, teacher_ids, self.dates)
+
+        # 拡張のため1日7コマ
+        self.assertEqual(SpecialLessonTeacherRequest.objects.count(), 3 * 5 * 7)
+
+    def test_query_count_does_not_depend_on_owners(self):
+        students = [Student.objects.create(last_name='生徒', first_name=f'{i}', grade=7) for i in range(5)]
+        with CaptureQueriesContext(connection) as queries:
+            provision_student_requests(self.special_lesson, [students[0].id], self.dates)
+        single = len(queries)
+
+        with CaptureQueriesContext(connection) as queries:
+            provision_student_requests(self.special_lesson, [student.id for student in students], self.dates)
+
+        self.assertEqual(len(queries), single)
+        self.assertEqual(SpecialLessonStudentRequest.objects.count(), 5 * 5 * 7)
+
+    def test_generate_shifts_provisions_teachers(self):
+        for i in range(2):
+            CustomUser.objects.create(username=f'teacher-{i}', is_teacher=True)
+
+        generate_shifts_bulk(self.dates[:2])
+
+        self.assertEqual(SpecialLessonTeacherRequest.objects.filter(date__in=self.dates[:2]).count(), 2 * 2 * 7)
+
+    def test_save_only_changed_requests(self):
+        teacher = CustomUser.objects.create(username='teacher', is_teacher=True)
+        provision_teacher_requests(self.special_lesson, [teacher.id], self.dates)
+        json_data = {
+            date.strftime('%Y-%m-%d'): {str(time): time != 1 for time in range(1, 8)}
+            for date in self.dates
+        }
+
+        with CaptureQueriesContext(connection) as queries:
+            changed_count = save_teacher_requests(self.special_lesson, teacher.id, json_data)
+
+        self.assertEqual(changed_count, 5)
+        # 取得1回と更新1回(+セーブポイント)
+        self.assertLessEqual(len(queries), 4)
+        self.assertEqual(SpecialLessonTeacherRequest.objects.filter(is_available=False, time=1).count(), 5)
+        # 同じ内容の再送信では更新しない
+        self.assertEqual(save_teacher_requests(self.special_lesson, teacher.id, json_data), 0)
+
+class SolverTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        invalidate_clousure_dates()
+        self.addCleanup(invalidate_clousure_dates)
+        self.dates = [date(2024, 7, 22 + i) for i in range(5)]
+        self.special_lesson = SpecialLesson.objects.create(name='夏期講習', start_date=self.dates[0], end_date=self.dates[-1])
+
+    def create_shifts(self, rooms=2, times=(1, 2, 3, 4, 5)):
+        relations = ShiftLessonRelation.objects.bulk_create([ShiftLessonRelation() for _ in self.dates for _ in times for _ in range(rooms)])
+        create_seats(ShiftSeat, relations)
+        keys = [(date, time, room) for date in self.dates for time in times for room in range(1, rooms + 1)]
+        Shift.objects.bulk_create([Shift(date=date, time=time, room=room, lessons=relation) for (date, time, room), relation in zip(keys, relations)])
+
+    def create_teachers(self, count):
+        teachers = []
+        for i in range(count):
+            teacher = CustomUser.objects.create(username=f'teacher-{i}', is_teacher=True)
+            TeacherProfile.objects.create(user=teacher)
+            teachers.append(teacher)
+        provision_teacher_requests(self.special_lesson, [teacher.id for teacher in teachers], self.dates)
+        return teachers
+
+    def create_admins(self, count, periods):
+        admins = []
+        for i in range(count):
+            student = Student.objects.create(last_name='生徒', first_name=f'{i}', grade=7)
+            admins.append(SpecialLessonAdmin.objects.create(student=student, grade=7, special_lesson=self.special_lesson, periods=periods, subject=1))
+        provision_student_requests(self.special_lesson, [admin.student_id for admin in admins], self.dates)
+        return admins
+
+    def test_places_all_lessons_spread_over_days(self):
+        self.create_shifts()
+        self.create_teachers(2)
+        self.create_admins(3, periods=5)
+
+        solution = solve(self.special_lesson, seconds=1)
+
+        self.assertEqual((solution.stats['placed'], solution.unplaced), (15, {}))
+        # 同じ科目は1日1コマ
+        self.assertEqual(len({(admin_id, lesson_date) for admin_id, lesson_date, _, _ in solution.lessons}), 15)
+        # 同じコマの生徒は同じ教室にまとめて講師を増やさない
+        self.assertEqual(solution.stats['teachers'], len({(lesson_date, time) for _, lesson_date, time, _ in solution.lessons}))
+
+    def test_room_capacity(self):
+        self.create_shifts(rooms=1, times=(1,))
+        self.create_teachers(1)
+        self.create_admins(5, periods=1)
+        SpecialLessonStudentRequest.objects.filter(date__gt=self.dates[0]).update(is_available=False)
+
+        solution = solve(self.special_lesson, seconds=1)
+
+        self.assertEqual(solution.stats['placed'], 4)
+        self.assertEqual(sum(solution.unplaced.values()), 1)
+
+    def test_load_problem_query_count_does_not_depend_on_seats(self):
+        self.create_shifts()
+        self.create_teachers(1)
+        self.create_admins(2, periods=3)
+        # 休校日はキャッシュされるため2回目から数える
+        load_problem(self.special_lesson)
+        with CaptureQueriesContext(connection) as queries:
+            load_problem(self.special_lesson)
+        empty = len(queries)
+
+        # 席を埋めても授業ごとのクエリは発行しない
+        student = Student.objects.create(last_name='生徒', first_name='固定', grade=7)
+        seats = list(ShiftSeat.objects.filter(seat_no=1).annotate(date=F('relation__lessons__date'), time=F('relation__lessons__time')))
+        lessons = Lesson.objects.bulk_create([Lesson(student=student, grade=7, subject=1, date=seat.date, time=seat.time, is_regular=True) for seat in seats])
+        for seat, lesson in zip(seats, lessons):
+            seat.lesson = lesson
+        ShiftSeat.objects.bulk_update(seats, ['lesson'])
+        with CaptureQueriesContext(connection) as queries:
+            problem = load_problem(self.special_lesson)
+
+        self.assertEqual(len(queries), empty)
+        self.assertEqual(problem.slots[0].rooms[0].free_seats, [2, 3, 4])
+
+    def test_commit_draft(self):
+        self.create_shifts()
+        self.create_teachers(1)
+        admins = self.create_admins(2, periods=3)
+
+        draft = create_draft(self.special_lesson)
+        result = commit_draft(draft)
+
+        self.assertEqual(len(result.lessons), 6)
+        self.assertEqual(Lesson.objects.filter(special__in=admins).count(), 6)
+        for shift in Shift.objects.filter(teacher_shift__isnull=False).select_related('lessons'):
+            self.assertTrue(shift.lessons.seat_lessons[0])
+        # 2回目の自動配置では残りコマ数がない
+        self.assertEqual(solve(self.special_lesson, seconds=1).stats['requested'], 0)
+        self.assertEqual([admin.scheduled_count for admin in SpecialLessonAdmin.objects.filter(id__in=[admin.id for admin in admins])], [3, 3])
+
+    def test_commit_draft_skips_conflicts_and_commits_once(self):
+        self.create_shifts()
+        self.create_teachers(1)
+        admins = {admin.id: admin for admin in self.create_admins(2, periods=3)}
+        draft = create_draft(self.special_lesson)
+
+        # 配置案の作成後に講師のシフトと生徒の授業が入った
+        teacher_id, teacher_date, teacher_time, _ = draft.teacher_shifts[0]
+        TeacherShift.objects.create(teacher_id=teacher_id, date=date.fromisoformat(teacher_date), time=teacher_time, is_fixed=False)
+        admin_id, lesson_date, lesson_time, _ = draft.lessons[0]
+        Lesson.objects.create(student=admins[admin_id].student, grade=7, subject=1, date=date.fromisoformat(lesson_date), time=lesson_time, is_regular=True)
+
+        result = commit_draft(draft)
+
+        self.assertEqual(result.skipped_teacher_shifts, 1)
+        self.assertEqual(result.skipped_lessons, 1)
+        self.assertEqual(len(result.lessons), len(draft.lessons) - 1)
+        # 登録済みの配置案は再度登録しない
+        self.assertIsNone(commit_draft(draft))
+        self.assertEqual(Lesson.objects.filter(special__in=admins.values()).count(), len(draft.lessons) - 1)
+
+class ScheduledCountTests(TestCase):
+    def setUp(self):
+        special_lesson = SpecialLesson.objects.create(name='夏期講習', start_date=date(2024, 7, 22), end_date=date(2024, 7, 26))
+        self.student = Student.objects.create(last_name='生徒', first_name='太郎', grade=7)
+        self.admin = SpecialLessonAdmin.objects.create(student=self.student, grade=7, special_lesson=special_lesson, periods=3, subject=1)
+
+    def create_lesson(self, day):
+        return Lesson.objects.create(special=self.admin, student=self.student, grade=7, subject=1, date=date(2024, 7, day), time=1, is_regular=False)
+
+    def test_signals_keep_count(self):
+        lessons = [self.create_lesson(22 + i) for i in range(3)]
+        self.admin.refresh_from_db()
+        self.assertEqual(self.admin.scheduled_count, 3)
+        self.assertFalse(SpecialLessonAdmin.objects.filter(scheduled_count__lt=F('periods')).exists())
+
+        lessons[0].delete()
+        Lesson.objects.filter(id=lessons[1].id).delete()
+        self.admin.refresh_from_db()
+        self.assertEqual(self.admin.scheduled_count, 1)
+
+    def test_repair_command(self):
+        self.create_lesson(22)
+        SpecialLessonAdmin.objects.update(scheduled_count=0)
+
+        out = StringIO()
+        call_command('repair_scheduled_counts', stdout=out)
 
-# Create your tests here.
+        self.assertIn('1件', out.getvalue())
+        self.admin.refresh_from_db()
+        self.assertEqual(self.admin.scheduled_count, self.admin.get_referencing_lesson_count())
@@ -1,7 +1,8 @@
 import json
+from collections import defaultdict
 from datetime import timedelta, datetime
 
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponseRedirect
 from django.urls import reverse_lazy
 from django.utils.decorators import method_decorator
 from django.views.generic import ListView, TemplateView, CreateView, DeleteView, View
@@ -9,14 +10,17 @@ from django.shortcuts import render
 from django.contrib import messages
 
 from accounts.decorators import user_type_required
-from .models import SpecialLesson, SpecialLessonStudentRequest, SpecialLessonAdmin, SpecialLessonTeacherRequest
+from .models import SpecialLesson, SpecialLessonStudentRequest, SpecialLessonAdmin, SpecialLessonTeacherRequest, SpecialLessonDraft
 from .forms import SpecialLessonAdminCreateForm
+from .request_grid import provision_student_requests, save_teacher_requests, save_student_requests
+from .solver import create_draft, commit_draft
+from accounts.models import CustomUser
 from shift.models import Shift
 from year_schedule.models import Event
 from regular_lesson.models import Lesson
 from students.models import Student
 from utils.choices import TIME_CHOICES, SPECIAL_TIME_CHOICES, SUBJECT_CHOICES
-from utils.helpers import generate_shifts, get_special_ordering
+from utils.helpers import generate_shifts_bulk, get_special_ordering, is_clousure_date, get_clousure_dates
 
 @method_decorator(user_type_required(), name='dispatch')
 class SpecialLessonListView(ListView):
@@ -89,13 +93,14 @@ class SpecialLessonCreateView(TemplateView):
         # 特別講習を作成
         SpecialLesson.objects.create(name=name, start_date=start_date, end_date=end_date, is_extend=is_extend)
 
-        clousure_dates = [obj.date.strftime('%Y-%m-%d') for obj in Event.objects.filter(date__gte=start_date, date__lte=end_date, is_closure=True)]
+        shift_dates = []
         for date in date_list:
-            if not date in clousure_dates:
+            if not is_clousure_date(datetime.strptime(date, '%Y-%m-%d').date()):
                 Event.objects.create(title=name, date=date, is_fixed=True)
+                shift_dates.append(datetime.strptime(date, '%Y-%m-%d').date())
 
-                date = datetime.strptime(date, '%Y-%m-%d').date()
-                generate_shifts(date)
+        # 期間中のシフトをまとめて作成
+        generate_shifts_bulk(shift_dates)
     
         messages.success(self.request, "登録できました")
         return JsonResponse({'message': 'success'})
@@ -139,7 +144,7 @@ class SpecialLessonAdminCreateView(CreateView):
         while current_date <= end_date:
             # 土曜日か日曜日でなければ日付をリストに追加
             if current_date.weekday() < 5:
-                date_list.append(current_date.strftime('%Y-%m-%d'))
+                date_list.append(current_date)
             # 日付を1日進める
             current_date += timedelta(days=1)
 
@@ -153,24 +158,10 @@ class SpecialLessonAdminCreateView(CreateView):
         special_lesson_admin.grade = student.grade
         special_lesson_admin.save()
 
-        if not SpecialLessonStudentRequest.objects.filter(student=student, special_lesson=special_lesson).exists():
-            if special_lesson.is_extend:
-                time_choices = [time[0] for time in SPECIAL_TIME_CHOICES] + [time[0] for time in TIME_CHOICES]
-            else:
-                time_choices = [time[0] for time in TIME_CHOICES]
-            start_date = special_lesson.start_date
-            end_date = special_lesson.end_date
-            date_list = self.generate_date_list(start_date, end_date)
-            clousure_dates = [obj.date.strftime('%Y-%m-%d') for obj in Event.objects.filter(date__gte=start_date, date__lte=end_date, is_closure=True)]
-            for date in date_list:
-                if not date in clousure_dates:
-                    for time in time_choices:
-                        SpecialLessonStudentRequest.objects.create(
-                            student=student,
-                            special_lesson=special_lesson,
-                            date=date,
-                            time=time,
-                        )
+        # 生徒の希望調査をまとめて作成(既に存在する場合は何もしない)
+        clousure_dates = get_clousure_dates(special_lesson.start_date, special_lesson.end_date)
+        date_list = self.generate_date_list(special_lesson.start_date, special_lesson.end_date)
+        provision_student_requests(special_lesson, [student.id], [date for date in date_list if date not in clousure_dates])
 
         return super().form_valid(form)
     
@@ -236,14 +227,10 @@ class SpecialLessonTeacherRequestFormView(TemplateView):
         pk = self.kwargs['pk']
         special_lesson = SpecialLesson.objects.get(pk=pk)
 
-        for date, times in json_data.items():
-            for time, value in times.items():
-                time = int(time)
-                special =  SpecialLessonTeacherRequest.objects.get(teacher=self.request.user, special_lesson=special_lesson, date=date, time=time)
-                special.is_available = value
-                special.save()
-        
-        messages.success(request, "保存しました")
+        # 変更された希望のみまとめて更新
+        changed_count = save_teacher_requests(special_lesson, self.request.user.id, json_data)
+
+        messages.success(request, f"保存しました(変更: {changed_count}件)")
                 
         return JsonResponse({'redirect_url': reverse_lazy('teacher:special_lesson_request', kwargs={'pk': pk})})
 
@@ -280,14 +267,10 @@ class SpecialLessonStudentRequestFormView(TemplateView):
         pk = self.kwargs['pk']
         special_lesson = SpecialLesson.objects.get(pk=special_lesson_pk)
 
-        for date, times in json_data.items():
-            for time, value in times.items():
-                time = int(time)
-                special =  SpecialLessonStudentRequest.objects.get(student=self.request.user.parent_profile.current_student, special_lesson=special_lesson, date=date, time=time)
-                special.is_available = value
-                special.save()
-        
-        messages.success(request, "保存しました")
+        # 変更された希望のみまとめて更新
+        changed_count = save_student_requests(special_lesson, self.request.user.parent_profile.current_student_id, json_data)
+
+        messages.success(request, f"保存しました(変更: {changed_count}件)")
 
         return JsonResponse({'redirect_url': reverse_lazy('parent:special_lesson_request', kwargs={'pk': pk, 'special_lesson_pk': special_lesson_pk})})
     
@@ -344,4 +327,52 @@ class SpecialLessonPrintView(TemplateView):
             })
         context['events'] = json.dumps(json_event)
         context['date_list'] = self.generate_date_list(start_date, end_date)
-        return context
\ No newline at end of file
+        return context
+
+@method_decorator(user_type_required(), name='dispatch')
+class SpecialLessonSolveView(View):
+    def post(self, request, *args, **kwargs):
+        special_lesson = SpecialLesson.objects.get(pk=self.kwargs['pk'])
+        # 残りコマ数のある講習を自動で配置した案を作成(この時点では登録しない)
+        draft = create_draft(special_lesson)
+        return HttpResponseRedirect(reverse_lazy('owner:special_draft', kwargs={'pk': draft.pk}))
+
+@method_decorator(user_type_required(), name='dispatch')
+class SpecialLessonDraftView(TemplateView):
+    template_name = 'owner/special_draft.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        draft = SpecialLessonDraft.objects.select_related('special_lesson').get(pk=self.kwargs['pk'])
+        admins = SpecialLessonAdmin.objects.filter(special_lesson=draft.special_lesson).select_related('student').in_bulk()
+        teachers = CustomUser.objects.filter(id__in={row[0] for row in draft.teacher_shifts}).in_bulk()
+        time_display = dict(SPECIAL_TIME_CHOICES + TIME_CHOICES)
+
+        # 日付・時間ごとにまとめて表示
+        slots = defaultdict(lambda: {'lessons': [], 'teachers': []})
+        for admin_id, date, time, room in draft.lessons:
+            admin = admins.get(admin_id)
+            if admin:
+                slots[(date, time)]['lessons'].append({'room': room, 'student': admin.student, 'subject': admin.get_subject_display()})
+        for teacher_id, date, time, room in draft.teacher_shifts:
+            slots[(date, time)]['teachers'].append({'room': room, 'teacher': teachers.get(teacher_id)})
+        context['slots'] = [
+            {'date': date, 'time': time_display[time], **slots[(date, time)]}
+            for date, time in sorted(slots)
+        ]
+        context['unplaced'] = [(admins[int(admin_id)], count) for admin_id, count in draft.unplaced.items() if int(admin_id) in admins]
+        context['draft'] = draft
+        return context
+
+@method_decorator(user_type_required(), name='dispatch')
+class SpecialLessonDraftCommitView(View):
+    def post(self, request, *args, **kwargs):
+        draft = SpecialLessonDraft.objects.select_related('special_lesson').get(pk=self.kwargs['pk'])
+        result = commit_draft(draft)
+        if result is None:
+            messages.error(request, 'この配置案は登録済みです。')
+        else:
+            messages.success(request, f'授業{len(result.lessons)}件、講師{len(result.teacher_shifts)}件を登録しました。')
+            if result.skipped_lessons or result.skipped_teacher_shifts:
+                messages.warning(request, f'配置案の作成後に変更された授業{result.skipped_lessons}件、講師{result.skipped_teacher_shifts}件は登録していません。')
+        return HttpResponseRedirect(reverse_lazy('owner:special_detail', kwargs={'pk': draft.special_lesson_id}))
@@ -32,42 +32,37 @@ class Student(models.Model):
     # 誕生日から学年を更新するメソッド
     def update_grade(self):
         if self.birth_date:
-            # Get today's date
-            today = date.today()
-            # Determine the current academic year
-            if today.month >= 3:
-                current_year = today.year
-            else:
-                current_year = today.year - 1
-            # Calculate the academic year the student is in based on birth date
-            if self.birth_date.month >= 4:
-                birth_year = self.birth_date.year
-            else:
-                birth_year = self.birth_date.year + 1
-            age_in_grade = current_year - birth_year - 6
-
-            # Update the grade based on age
-            if age_in_grade >= 1 and age_in_grade <= 6:
-                self.grade = age_in_grade
-                self.is_elementary_school = True
-                self.is_middle_school = False
-                self.is_high_school = False
-            elif age_in_grade >= 7 and age_in_grade <= 9:
-                self.grade = age_in_grade
-                self.is_elementary_school = False
-                self.is_middle_school = True
-                self.is_high_school = False
-            elif age_in_grade >= 10 and age_in_grade <= 12:
-                self.grade = age_in_grade
-                self.is_elementary_school = False
-                self.is_middle_school = False
-                self.is_high_school = True
-            else:
-                # Handle special cases here
-                pass
+            fields = calculate_grade_fields(self.birth_date, date.today())
+            for field, value in fields.items():
+                setattr(self, field, value)
             # Save the updated instance
             self.save()
 
+# 誕生日と基準日から学年と学校区分を計算する(対象外の年齢の場合は空の辞書)
+def calculate_grade_fields(birth_date, today):
+    # Determine the current academic year
+    if today.month >= 3:
+        current_year = today.year
+    else:
+        current_year = today.year - 1
+    # Calculate the academic year the student is in based on birth date
+    if birth_date.month >= 4:
+        birth_year = birth_date.year
+    else:
+        birth_year = birth_date.year + 1
+    age_in_grade = current_year - birth_year - 6
+
+    # Update the grade based on age
+    if age_in_grade >= 1 and age_in_grade <= 6:
+        return {'grade': age_in_grade, 'is_elementary_school': True, 'is_middle_school': False, 'is_high_school': False}
+    elif age_in_grade >= 7 and age_in_grade <= 9:
+        return {'grade': age_in_grade, 'is_elementary_school': False, 'is_middle_school': True, 'is_high_school': False}
+    elif age_in_grade >= 10 and age_in_grade <= 12:
+        return {'grade': age_in_grade, 'is_elementary_school': False, 'is_middle_school': False, 'is_high_school': True}
+    else:
+        # Handle special cases here
+        return {}
+
 class StudentNotable(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     notable = models.TextField()
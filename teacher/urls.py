@@ -8,13 +8,16 @@ from test_result.views import TestResultDetailView
 from special_lesson.views import SpecialLessonListView, SpecialLessonTeacherRequestFormView
 from shift.views import ShiftDetailDisplayView, ShiftSelectView
 from file.views import FileListView, FileDetailView
-from year_schedule.views import  TeacherYearScheduleView
+from year_schedule.views import  TeacherYearScheduleView, TeacherCalendarFeedView
 from accounts.views import ChangePasswordView, CustomUserProfileView
+from notification.views import NotificationFeedView
 
 app_name = 'teacher'
 
 urlpatterns = [
     path('', TeacherYearScheduleView.as_view(), name='dashboard'),
+    path('calendar_feed/', TeacherCalendarFeedView.as_view(), name='calendar_feed'),
+    path('notification/feed/', NotificationFeedView.as_view(), name='notification_feed'),
 
     path('account/', CustomUserProfileView.as_view(), name='account_profile'),
     path('account/change_password/', ChangePasswordView.as_view(), name='account_change_password'),
@@ -4,7 +4,6 @@ from django.urls import reverse_lazy
 
 from accounts.decorators import user_type_required
 from students.models import Student
-from notification.models import Notification
 from utils.choices import GRADE_CHOICES
 from accounts.models import CustomUser
 from accounts.forms import TeacherStatusForm
@@ -16,8 +15,8 @@ class TeacherDashboardView(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        notifications = Notification.objects.filter(user=self.request.user)  # すべての通知を取得
-        context['notifications'] = notifications  # テンプレートコンテキストに通知データを追加
+        # 通知の本文は画面から通知の一覧(notification_feed)を1ページずつ読み込む
+        context['unread_count'] = self.request.user.unread_notification_count
         return context
     
 
@@ -0,0 +1,113 @@
+import calendar
+import logging
+import time
+from collections import defaultdict
+from datetime import date
+
+from django.db.models import Count
+from django.template.loader import render_to_string
+
+from .models import TeacherShift, Salary
+from accounts.models import CustomUser
+from file.jobs import set_job_total, set_job_progress
+from file.pdf import get_pdf_workers, pdf_executor, render_pdfs_timed, save_pdf_files, chunks
+from utils.constants import hourly_teaching_allowance
+from utils.helpers import get_today
+
+logger = logging.getLogger(__name__)
+
+# 授業手当のcost_name
+LESSON_COST_NAME = 0
+
+def get_salary_file_name(year, month, teacher):
+    return f'{year}年{month}月_給与明細_{teacher.last_name}{teacher.first_name}様.pdf'
+
+# 対象の講師全員の給与明細の内容をまとめて計算する
+def build_salary_contexts(year, month, billing_date, remarks, teachers):
+    start_date_of_month = date(year, month, 1)
+    end_date_of_month = date(year, month, calendar.monthrange(year, month)[1])
+    teacher_ids = [teacher.id for teacher in teachers]
+
+    # 講師ごとの今月の授業数
+    lesson_counts = dict(
+        TeacherShift.objects.filter(teacher_id__in=teacher_ids, date__gte=start_date_of_month, date__lte=end_date_of_month)
+        .order_by().values('teacher_id').annotate(count=Count('id')).values_list('teacher_id', 'count')
+    )
+
+    class_salaries = {
+        salary.teacher_id: salary
+        for salary in Salary.objects.filter(teacher_id__in=teacher_ids, cost_name=LESSON_COST_NAME, date=end_date_of_month)
+    }
+    other_salaries = defaultdict(list)
+    for salary in Salary.objects.filter(teacher_id__in=teacher_ids, date__year=year, date__month=month).exclude(cost_name=LESSON_COST_NAME).order_by('id'):
+        other_salaries[salary.teacher_id].append(salary)
+
+    new_salaries = []
+    updated_salaries = []
+    items = []
+    for teacher in teachers:
+        price = int(lesson_counts.get(teacher.id, 0) * hourly_teaching_allowance)
+
+        class_salary = class_salaries.get(teacher.id)
+        if class_salary is None:
+            class_salary = Salary(teacher=teacher, cost_name=LESSON_COST_NAME, date=end_date_of_month, price=price)
+            new_salaries.append(class_salary)
+        else:
+            class_salary.price = price
+            updated_salaries.append(class_salary)
+
+        context = {
+            'year': year,
+            'month': month,
+            'teacher': teacher,
+            'billing_date': billing_date,
+            'salaries': [class_salary] + other_salaries[teacher.id],
+            'total_salary': price + sum(salary.price or 0 for salary in other_salaries[teacher.id]),
+            'remarks': remarks,
+        }
+        items.append((teacher, context))
+
+    Salary.objects.bulk_create(new_salaries)
+    if updated_salaries:
+        Salary.objects.bulk_update(updated_salaries, ['price'])
+
+    return items
+
+# 給与明細のPDFを作成して保存する。[(講師, PDF)]を返す
+def publish_salary_pdfs(year, month, billing_date, remarks, teachers, workers=None, progress=None):
+    items = build_salary_contexts(year, month, billing_date, remarks, teachers)
+    results = []
+    timings = []
+
+    with pdf_executor(min(workers or get_pdf_workers(), len(items))) as executor:
+        for batch in chunks(items):
+            started = time.perf_counter()
+            html_contents = [render_to_string('owner/salary_pdf.html', context) for _, context in batch]
+            rendered = render_pdfs_timed(html_contents, executor)
+            save_pdf_files(
+                [(get_salary_file_name(year, month, teacher), pdf_data, [teacher]) for (teacher, _), (pdf_data, _) in zip(batch, rendered)],
+                date(year, month, 1),
+            )
+            logger.info('salary batch %s/%s: %.3fs', len(results) + len(batch), len(items), time.perf_counter() - started)
+
+            for (teacher, _), (pdf_data, seconds) in zip(batch, rendered):
+                results.append((teacher, pdf_data))
+                timings.append({'name': f'{teacher.last_name}{teacher.first_name}', 'seconds': round(seconds, 3)})
+                logger.info('salary pdf %s: %.3fs', teacher.id, seconds)
+            if progress:
+                progress(len(results), timings)
+
+    return results, timings
+
+# 全講師の給与明細を発行するジョブ(退職した講師を除く)
+def run_salary_job(job, year, month, billing_date=None, remarks=None):
+    teachers = list(CustomUser.objects.filter(is_teacher=True, teacher_profile__is_withdrawn=False))
+    set_job_total(job, len(teachers))
+    publish_salary_pdfs(
+        year,
+        month,
+        billing_date or get_today(),
+        remarks,
+        teachers,
+        progress=lambda done, timings: set_job_progress(job, done, timings),
+    )
@@ -38,6 +38,14 @@ class TeacherShift(models.Model):
             return f'{self.fixed_shift} - {self.date}'
         else:
             return f'{self.temporaly_shift} - {self.date}'
+
+    class Meta:
+        indexes = [
+            # 日付ごとの出勤(固定・臨時)
+            models.Index(fields=['date', 'is_fixed'], name='teacher_shift_date_idx'),
+            # 固定シフトと日付からの出勤
+            models.Index(fields=['fixed_shift', 'date'], condition=models.Q(is_fixed=True), name='teacher_shift_fixed_date_idx'),
+        ]
         
 class Salary(models.Model):
     teacher = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
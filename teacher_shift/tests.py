@@ -1,3 +1,73 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import date
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.management.commands.createusers import create_owner
+from accounts.models import CustomUser, TeacherProfile
+from file.jobs import run_job
+from file.models import File, PdfJob
+from teacher_shift.batch import build_salary_contexts
+from teacher_shift.models import TeacherShift, Salary
+from utils.constants import hourly_teaching_allowance
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, PDF_WORKERS=1)
+class SalaryBatchTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        create_owner('owner', '塾長', '太郎')
+        self.owner = CustomUser.objects.get(is_owner=True)
+
+    def create_teacher(self, i, shift_count=3):
+        teacher = CustomUser.objects.create(username=f'teacher-{i}', last_name='講師', first_name=f'{i}', is_teacher=True)
+        TeacherProfile.objects.create(user=teacher)
+        TeacherShift.objects.bulk_create([TeacherShift(teacher=teacher, date=date(2024, 6, day + 1), time=1) for day in range(shift_count)])
+        return teacher
+
+    def test_lesson_salary_and_total(self):
+        teacher = self.create_teacher(0, shift_count=4)
+        Salary.objects.create(teacher=teacher, cost_name=1, price=500, date=date(2024, 6, 10))
+
+        [(_, context)] = build_salary_contexts(2024, 6, date(2024, 6, 25), '', [teacher])
+
+        self.assertEqual(context['total_salary'], 4 * hourly_teaching_allowance + 500)
+        self.assertEqual(Salary.objects.get(teacher=teacher, cost_name=0).price, 4 * hourly_teaching_allowance)
+
+    def test_query_count_does_not_depend_on_teachers(self):
+        teachers = [self.create_teacher(0)]
+        with CaptureQueriesContext(connection) as queries:
+            build_salary_contexts(2024, 6, date(2024, 6, 25), '', teachers)
+        single = len(queries)
+
+        teachers += [self.create_teacher(i) for i in range(1, 6)]
+        with CaptureQueriesContext(connection) as queries:
+            build_salary_contexts(2024, 7, date(2024, 7, 25), '', teachers)
+
+        self.assertEqual(len(queries), single)
+
+    def test_enqueue_and_run_job(self):
+        teachers = [self.create_teacher(i) for i in range(2)]
+        self.client.force_login(self.owner)
+
+        response = self.client.post(reverse('owner:salary_show'), {'year': 2024, 'month': 6})
+        job = PdfJob.objects.get()
+        self.assertRedirects(response, f"{reverse('owner:salary_show')}?job={job.id}")
+
+        run_job(job.id)
+
+        status = self.client.get(reverse('owner:pdf_job_status', args=[job.id])).json()
+        self.assertEqual((status['status'], status['done'], status['total']), ('done', 2, 2))
+        self.assertEqual([timing['name'] for timing in status['timings']], ['講師0', '講師1'])
+        for teacher in teachers:
+            file_obj = File.objects.get(display_name=f'2024年6月_給与明細_講師{teacher.first_name}様.pdf')
+            self.assertEqual(list(file_obj.accessible_users.all()), [teacher])
@@ -2,7 +2,6 @@ from datetime import timedelta, datetime, date, time
 from collections import defaultdict
 import json
 import calendar
-import os
 
 from django.http import HttpResponse, JsonResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render
@@ -12,9 +11,6 @@ from django.views.generic import ListView, CreateView, FormView, TemplateView, D
 from django.urls import reverse_lazy
 from django.db.models import Sum
 from django.contrib import messages
-from django.core.files.base import ContentFile
-from django.conf import settings
-from django.template.loader import render_to_string
 
 from accounts.decorators import user_type_required
 from accounts.models import CustomUser
@@ -23,14 +19,13 @@ from teacher_shift.models import Salary
 from year_schedule.models import Event
 from .models import FixedShift, TeacherShift
 from .forms import FixedShiftCreateForm, SalaryForm
-from file.models import File
+from .batch import publish_salary_pdfs, get_salary_file_name
+from file.models import PdfJob
+from file.jobs import enqueue_job
 from utils.choices import TIME_CHOICES, DAY_CHOICES, SALARY_CHOICES, GRADE_CHOICES
 from utils.mixins import FiscalYearMixin
 from utils.helpers import generate_teacher_shifts, get_today, get_fiscal_year_boundaries
-from utils.constants import hourly_teaching_allowance, hourly_administrative_allowance
-
-from io import BytesIO
-from xhtml2pdf import pisa
+from utils.constants import hourly_administrative_allowance
 
 @method_decorator(user_type_required(), name='dispatch')
 class FixedShiftListView(FiscalYearMixin, ListView):
@@ -203,94 +198,35 @@ class SalaryPDFView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['teachers'] = CustomUser.objects.filter(is_teacher=True)
+        job_id = self.request.GET.get('job')
+        if job_id:
+            context['job'] = PdfJob.objects.filter(id=job_id, kind='salary').first()
         return context
     
     def post(self, request, *args, **kwargs):
         year = int(request.POST.get('year'))
         month = int(request.POST.get('month'))
         teacher_id = request.POST.get('teacher_id')
-        billing_date = request.POST.get('billing_date') or get_today()
+        billing_date = request.POST.get('billing_date') or None
         remarks = request.POST.get('remarks')
-        start_date_of_month = date(year, month, 1)
-        end_date_of_month = date(year, month, calendar.monthrange(year, month)[1])
-        
-        def publish_pdf(teacher_id):
-            teacher = CustomUser.objects.get(id=teacher_id)
-            _, end_date = get_fiscal_year_boundaries(start_date_of_month)
-
-            price = TeacherShift.objects.filter(teacher=teacher, date__gte=start_date_of_month, date__lte=end_date_of_month).count() * hourly_teaching_allowance
-
-            price = int(price)
-            salaries = []
-            total_salary = price
-            class_salary, _ = Salary.objects.get_or_create(
-                teacher=teacher,
-                cost_name=0,
-                date=end_date_of_month,
-            )
-            class_salary.price = price
-            class_salary.save()
-            salaries.append(class_salary)
-            other_salaries = Salary.objects.filter(
-                teacher=teacher,
-                date__year=year,
-                date__month=month,
-            ).exclude(cost_name=0)
-            for salary in other_salaries:
-                salaries.append(salary)
-                total_salary += salary.price
-
-            context = {
-                'year': year,
-                'month': month,
-                'teacher': teacher,
-                'billing_date': billing_date,
-                'salaries': salaries,
-                'total_salary': total_salary,
-                'remarks': remarks,
-            }
-
-            html_content = render_to_string('owner/salary_pdf.html', context)
-            
-            pdf_buffer = BytesIO()
-            pisa.CreatePDF(html_content, dest=pdf_buffer)
-            pdf_data = pdf_buffer.getvalue()
-            pdf_buffer.close()
-
-            file_name = f'{year}年{month}月_給与明細_{teacher.last_name}{teacher.first_name}様.pdf'
-            file_path = os.path.join(settings.MEDIA_ROOT, file_name)
-
-            # ファイルが存在する場合は削除
-            if os.path.exists(file_path):
-                os.remove(file_path)
-
-            file_obj, created = File.objects.get_or_create(file=file_name, date=date(year, month, 1))
-            file_obj.file.save(file_name, ContentFile(pdf_data), save=True)
-
-            if not created:
-                file_obj.created_at = get_today()
-                file_obj.save()
-
-            # アクセス可能なユーザーを追加
-            file_obj.accessible_users.add(teacher)
-
-            return pdf_data
 
         # 一人のみの作成
         if teacher_id:
-            pdf_data = publish_pdf(teacher_id)
             teacher = CustomUser.objects.get(id=teacher_id)
+            [(_, pdf_data)], _ = publish_salary_pdfs(year, month, billing_date or get_today(), remarks, [teacher], workers=1)
             response = HttpResponse(pdf_data, content_type='application/pdf')
-            response['Content-Disposition'] = f'inline; filename={year}年{month}月_給与明細_{teacher.last_name}{teacher.first_name}様.pdf'
+            response['Content-Disposition'] = f'inline; filename={get_salary_file_name(year, month, teacher)}'
             return response
 
-        # 全生徒の作成(休塾、退塾を除く)
+        # 全講師の作成はバックグラウンドで実行し、画面で進捗を表示する
         else:
-            teachers = CustomUser.objects.filter(is_teacher=True, teacher_profile__is_withdrawn=False)
-            for teacher in teachers:
-                publish_pdf(teacher.id)
-            messages.success(self.request, 'PDFの発行が完了しました。')
-            return HttpResponseRedirect(reverse_lazy('owner:salary_show'))
+            job = enqueue_job('salary', {
+                'year': year,
+                'month': month,
+                'billing_date': billing_date,
+                'remarks': remarks,
+            })
+            return HttpResponseRedirect(f"{reverse_lazy('owner:salary_show')}?job={job.id}")
 
 @method_decorator(user_type_required(), name='dispatch')
 class SalaryCreateView(FormView):
@@ -0,0 +1,209 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from dateutil.relativedelta import relativedelta
+from django.db import transaction
+from django.db.models import F
+
+from shift.models import SEAT_NUMBERS, ShiftTemplate, ShiftTemplateLessonRelation, ShiftTemplateSeat
+from shift.seats import create_seats
+from regular_lesson.models import RegularLessonAdmin, Lesson
+from teacher_shift.models import FixedShift, TeacherShift
+from students.models import Student, calculate_grade_fields
+from vocabulary_test.models import TestResult
+from utils.choices import DAY_CHOICES, ROOM_CHOICES, TIME_CHOICES
+from year_schedule.feeds import invalidate_calendar_feeds
+from year_schedule.month_schedule import invalidate_all_month_schedules
+from utils.helpers import get_fiscal_year_boundaries, get_weekly_dates, get_clousure_dates
+
+# 年度切り替えの各処理の件数と実行時間
+class RolloverReport:
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        # (処理名, 件数, 秒数)のリスト
+        self.steps = []
+
+    @contextmanager
+    def step(self, name):
+        result = {'rows': 0}
+        started = time.perf_counter()
+        yield result
+        self.steps.append((name, result['rows'], time.perf_counter() - started))
+
+    def lines(self):
+        lines = [f'{name}: {rows}件 {seconds:.3f}秒' for name, rows, seconds in self.steps]
+        lines.append(f'合計: {sum(seconds for _, _, seconds in self.steps):.3f}秒')
+        return lines
+
+# 来年度のシフトテンプレートを空の状態でまとめて作成する
+def create_next_year_templates():
+    keys = [(day[0], room[0], time[0]) for day in DAY_CHOICES for room in ROOM_CHOICES for time in TIME_CHOICES]
+    relations = ShiftTemplateLessonRelation.objects.bulk_create([ShiftTemplateLessonRelation() for _ in keys])
+    create_seats(ShiftTemplateSeat, relations)
+    return ShiftTemplate.objects.bulk_create([
+        ShiftTemplate(day=day, room=room, time=time, is_next_year=True, lessons=relation)
+        for (day, room, time), relation in zip(keys, relations)
+    ])
+
+def load_templates_by_slot(is_next_year):
+    templates = defaultdict(list)
+    for template in ShiftTemplate.objects.filter(is_next_year=is_next_year).select_related('lessons').order_by('room'):
+        templates[(template.day, template.time)].append(template)
+    return templates
+
+# 切り替えが完了していない昨年度の固定授業を継続し、今年度の授業とテンプレートの席を作成する
+def continue_regular_lessons(regular_lesson_admins, start_date, end_date, clousure_dates):
+    new_admins = RegularLessonAdmin.objects.bulk_create([
+        RegularLessonAdmin(
+            student_id=admin.student_id,
+            # 過年度生は13のまま処理する
+            grade=13 if admin.grade == 13 else admin.grade + 1,
+            subject=admin.subject,
+            day=admin.day,
+            time=admin.time,
+            start_date=start_date,
+            end_date=end_date,
+        )
+        for admin in regular_lesson_admins
+    ])
+
+    Lesson.objects.bulk_create([
+        Lesson(
+            regular=admin,
+            student_id=admin.student_id,
+            grade=admin.grade,
+            subject=admin.subject,
+            date=lesson_date,
+            time=admin.time,
+            is_regular=True,
+        )
+        for admin in new_admins
+        for lesson_date in get_weekly_dates(admin.day, start_date, end_date, clousure_dates)
+    ], batch_size=1000)
+    invalidate_calendar_feeds('student', [admin.student_id for admin in new_admins])
+    invalidate_all_month_schedules()
+
+    # 空いている最初の席に登録(空席を(曜日, 時間)ごとに教室順・席番号順で並べる)
+    free_seats = defaultdict(list)
+    for seat in ShiftTemplateSeat.objects.filter(relation__template_lessons__is_next_year=False, seat_no__in=SEAT_NUMBERS, lesson=None).annotate(
+        day=F('relation__template_lessons__day'), time=F('relation__template_lessons__time'),
+    ).order_by('relation__template_lessons__room', 'seat_no'):
+        free_seats[(seat.day, seat.time)].append(seat)
+
+    changed_seats = []
+    for admin in new_admins:
+        seats = free_seats[(admin.day, admin.time)]
+        if seats:
+            seat = seats.pop(0)
+            seat.lesson = admin
+            changed_seats.append(seat)
+    ShiftTemplateSeat.objects.bulk_update(changed_seats, ['lesson'])
+
+    return new_admins
+
+# 切り替えが完了していない昨年度の固定シフトを継続し、今年度の出勤日とテンプレートの講師を作成する
+def continue_fixed_shifts(fixed_shifts, start_date, end_date, clousure_dates):
+    new_fixed_shifts = FixedShift.objects.bulk_create([
+        FixedShift(
+            teacher_id=fixed_shift.teacher_id,
+            day=fixed_shift.day,
+            time=fixed_shift.time,
+            start_date=start_date,
+            end_date=end_date,
+        )
+        for fixed_shift in fixed_shifts
+    ])
+
+    TeacherShift.objects.bulk_create([
+        TeacherShift(
+            teacher_id=fixed_shift.teacher_id,
+            fixed_shift=fixed_shift,
+            date=shift_date,
+            time=fixed_shift.time,
+            is_fixed=True,
+        )
+        for fixed_shift in new_fixed_shifts
+        for shift_date in get_weekly_dates(fixed_shift.day, start_date, end_date, clousure_dates)
+    ], batch_size=1000)
+    invalidate_calendar_feeds('teacher', [fixed_shift.teacher_id for fixed_shift in new_fixed_shifts])
+
+    # 講師が空いている最初の教室に登録
+    changed_templates = []
+    templates = load_templates_by_slot(is_next_year=False)
+    for fixed_shift in new_fixed_shifts:
+        for template in templates[(fixed_shift.day, fixed_shift.time)]:
+            if template.fixed_shift_id is None:
+                template.fixed_shift = fixed_shift
+                changed_templates.append(template)
+                break
+    ShiftTemplate.objects.bulk_update(changed_templates, ['fixed_shift'])
+
+    return new_fixed_shifts
+
+# 誕生日から全生徒の学年をまとめて更新する
+def update_student_grades(today):
+    students = []
+    for student in Student.objects.exclude(birth_date=None).only('id', 'birth_date', 'grade', 'is_elementary_school', 'is_middle_school', 'is_high_school'):
+        fields = calculate_grade_fields(student.birth_date, today)
+        if fields and any(getattr(student, field) != value for field, value in fields.items()):
+            for field, value in fields.items():
+                setattr(student, field, value)
+            students.append(student)
+    Student.objects.bulk_update(students, ['grade', 'is_elementary_school', 'is_middle_school', 'is_high_school'], batch_size=500)
+    return len(students)
+
+# 年度切り替え(3月1日に実行)
+# continue_unupgraded: 切り替え画面で処理されなかった固定授業・固定シフトを継続する
+# dry_run: 全ての処理を実行した後にロールバックし、件数と実行時間のみを返す
+def rollover_fiscal_year(today, continue_unupgraded=False, dry_run=False):
+    report = RolloverReport(dry_run)
+    start_date, end_date = get_fiscal_year_boundaries(today)
+    _, end_date_of_last_fiscal_year = get_fiscal_year_boundaries(today - relativedelta(years=1))
+
+    with transaction.atomic():
+        # 昨年度のTemplateを削除
+        with report.step('昨年度のシフトテンプレートの削除') as result:
+            result['rows'], _ = ShiftTemplate.objects.filter(is_next_year=False).delete()
+
+        # 新年度のtemplateに切り替え
+        with report.step('新年度のシフトテンプレートへの切り替え') as result:
+            result['rows'] = ShiftTemplate.objects.filter(is_next_year=True).update(is_next_year=False)
+
+        # 来年度シフトテンプレートの作成
+        with report.step('来年度のシフトテンプレートの作成') as result:
+            result['rows'] = len(create_next_year_templates())
+
+        # 昨年度に切り替えが完了しているもののフラグを戻す
+        with report.step('切り替え済みの固定授業') as result:
+            result['rows'] = RegularLessonAdmin.objects.filter(end_date=end_date_of_last_fiscal_year, is_upgraded=True).update(is_upgraded=False)
+        with report.step('切り替え済みの固定シフト') as result:
+            result['rows'] = FixedShift.objects.filter(end_date=end_date_of_last_fiscal_year, is_upgraded=True).update(is_upgraded=False)
+
+        if continue_unupgraded:
+            clousure_dates = get_clousure_dates(start_date, end_date)
+            with report.step('固定授業の継続') as result:
+                regular_lesson_admins = RegularLessonAdmin.objects.filter(end_date=end_date_of_last_fiscal_year, is_upgraded=False)
+                result['rows'] = len(continue_regular_lessons(list(regular_lesson_admins), start_date, end_date, clousure_dates))
+            with report.step('固定シフトの継続') as result:
+                fixed_shifts = FixedShift.objects.filter(end_date=end_date_of_last_fiscal_year, is_upgraded=False)
+                result['rows'] = len(continue_fixed_shifts(list(fixed_shifts), start_date, end_date, clousure_dates))
+
+        # 退塾予定の生徒は退塾
+        with report.step('退塾') as result:
+            result['rows'] = Student.objects.filter(is_planning_to_withdraw=True).update(is_planning_to_withdraw=False, is_withdrawn=True)
+
+        # 全生徒の学年を更新する
+        with report.step('学年の更新') as result:
+            result['rows'] = update_student_grades(today)
+        with report.step('生徒の切り替えフラグ') as result:
+            result['rows'] = Student.objects.filter(is_upgraded=True).update(is_upgraded=False)
+
+        # 英単語テストの結果をリセット
+        with report.step('英単語テストの結果のリセット') as result:
+            result['rows'] = TestResult.objects.all().update(date=None, score=None, fullscore=None)
+
+        if dry_run:
+            transaction.set_rollback(True)
+
+    return report
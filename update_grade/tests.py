@@ -1,3 +1,75 @@
+from datetime import date
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from regular_lesson.models import RegularLessonAdmin, Lesson
+from shift.models import ShiftTemplate
+from students.models import Student
+from update_grade.rollover import rollover_fiscal_year, create_next_year_templates
+from utils.helpers import invalidate_clousure_dates
+
+TODAY = date(2025, 3, 1)
+
+class RolloverTests(TestCase):
+    def setUp(self):
+        invalidate_clousure_dates()
+        self.addCleanup(invalidate_clousure_dates)
+        create_next_year_templates()
+
+    def create_students(self, count):
+        return Student.objects.bulk_create([
+            # 2025年3月時点で中1
+            Student(last_name='生徒', first_name=f'{i}', birth_date=date(2012, 6, 1), grade=6, is_elementary_school=True)
+            for i in range(count)
+        ])
+
+    def test_dry_run_leaves_data_unchanged(self):
+        student = self.create_students(1)[0]
+        Student.objects.filter(id=student.id).update(is_planning_to_withdraw=True)
+
+        report = rollover_fiscal_year(TODAY, dry_run=True)
+
+        self.assertEqual(dict((name, rows) for name, rows, _ in report.steps)['来年度のシフトテンプレートの作成'], 150)
+        self.assertEqual(ShiftTemplate.objects.filter(is_next_year=True).count(), 150)
+        self.assertFalse(ShiftTemplate.objects.filter(is_next_year=False).exists())
+        student.refresh_from_db()
+        self.assertEqual((student.grade, student.is_withdrawn), (6, False))
+
+    def test_promote_templates_and_update_grades(self):
+        student = self.create_students(1)[0]
+
+        rollover_fiscal_year(TODAY)
+
+        self.assertEqual(ShiftTemplate.objects.filter(is_next_year=False).count(), 150)
+        self.assertEqual(ShiftTemplate.objects.filter(is_next_year=True).count(), 150)
+        student.refresh_from_db()
+        self.assertEqual((student.grade, student.is_elementary_school, student.is_middle_school), (7, False, True))
+
+    def test_continue_unupgraded_regular_lessons(self):
+        student = self.create_students(1)[0]
+        RegularLessonAdmin.objects.create(
+            student=student, grade=6, subject=1, day=1, time=2,
+            start_date=date(2024, 3, 1), end_date=date(2025, 2, 28),
+        )
+
+        rollover_fiscal_year(TODAY, continue_unupgraded=True)
+
+        admin = RegularLessonAdmin.objects.get(start_date=date(2025, 3, 1))
+        self.assertEqual((admin.grade, admin.end_date), (7, date(2026, 2, 28)))
+        self.assertEqual(Lesson.objects.filter(regular=admin).count(), 52)
+        template = ShiftTemplate.objects.get(is_next_year=False, day=1, time=2, room=1)
+        self.assertEqual(template.lessons.seat_lessons[0], admin)
+
+    def test_query_count_does_not_depend_on_students(self):
+        self.create_students(1)
+        with CaptureQueriesContext(connection) as queries:
+            rollover_fiscal_year(TODAY, dry_run=True)
+        single = len(queries)
+
+        self.create_students(20)
+        with CaptureQueriesContext(connection) as queries:
+            rollover_fiscal_year(TODAY, dry_run=True)
 
-# Create your tests here.
+        self.assertEqual(len(queries), single)
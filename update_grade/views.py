@@ -316,7 +316,7 @@ class UpdateShiftTemplateView(ListView):
     paginate_by = 30
 
     def get_queryset(self):
-        return ShiftTemplate.objects.filter(is_next_year=True)
+        return ShiftTemplate.objects.filter(is_next_year=True).select_related('lessons', 'fixed_shift__teacher').prefetch_related('lessons__seats__lesson__student')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
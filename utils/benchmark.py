@@ -0,0 +1,117 @@
+import random
+from collections import defaultdict
+
+from accounts.models import CustomUser, TeacherProfile
+from accounts.management.commands.createusers import create_owner
+from students.models import Student
+from shift.models import SEAT_NUMBERS, ShiftTemplate, Shift, ShiftLessonRelation, ShiftSeat
+from regular_lesson.models import RegularLessonAdmin, Lesson
+from teacher_shift.models import FixedShift, TeacherShift
+from utils.choices import DAY_CHOICES, TIME_CHOICES, SUBJECT_CHOICES
+from utils.helpers import get_today, get_fiscal_year_boundaries, generate_regular_lessons, generate_teacher_shifts
+
+# 一括作成導入前のgenerate_shiftsのテンプレート展開部分(比較用)
+def legacy_generate_shifts(date):
+    day = date.weekday() + 1
+    _, end_date = get_fiscal_year_boundaries(date)
+
+    if not Shift.objects.filter(date=date).exists():
+        if date <= end_date:
+            shift_templates = ShiftTemplate.objects.filter(day=day ,is_next_year=False)
+        else:
+            shift_templates = ShiftTemplate.objects.filter(day=day, is_next_year=True)
+
+        for shift_template in shift_templates:
+            fixed_shift = shift_template.fixed_shift
+            room = shift_template.room
+            time = shift_template.time
+
+            try:
+                teacher_shift = TeacherShift.objects.get(
+                    fixed_shift=fixed_shift,
+                    date=date,
+                    is_fixed=True,
+                )
+            except TeacherShift.DoesNotExist:
+                teacher_shift = None
+
+            lessons = []
+            for regulr_lesson_admin in shift_template.lessons.seat_lessons:
+                try:
+                    lesson = Lesson.objects.get(
+                        regular=regulr_lesson_admin,
+                        is_regular=True,
+                        date=date,
+                        is_rescheduled=False,
+                    )
+                except Lesson.DoesNotExist:
+                    lesson = None
+                lessons.append(lesson)
+
+            obj = Shift.objects.create(
+                date=date,
+                time=time,
+                room=room,
+            )
+
+            shift_lesson_relation = ShiftLessonRelation.objects.create()
+            for seat_no, lesson in zip(SEAT_NUMBERS, lessons):
+                ShiftSeat.objects.create(relation=shift_lesson_relation, seat_no=seat_no, lesson=lesson)
+
+            obj.lessons = shift_lesson_relation
+            obj.teacher_shift=teacher_shift
+            obj.save()
+
+# 合成した1年度分のデータを作成する(テンプレートが存在しない場合はcreateusersと同じ手順で作成)
+def seed_fiscal_year(student_count, teacher_count, lessons_per_student, seed=0):
+    rng = random.Random(seed)
+    start_date, end_date = get_fiscal_year_boundaries(get_today())
+
+    if not ShiftTemplate.objects.exists():
+        create_owner('benchmark-owner', '塾長', 'ベンチ')
+
+    day_choices = [day[0] for day in DAY_CHOICES]
+    time_choices = [time[0] for time in TIME_CHOICES]
+    subject_choices = [subject[0] for subject in SUBJECT_CHOICES]
+
+    for i in range(teacher_count):
+        teacher = CustomUser.objects.create(username=f'benchmark-teacher-{i}', last_name='講師', first_name=f'{i}', is_teacher=True)
+        TeacherProfile.objects.create(user=teacher)
+        for day, time in rng.sample([(day, time) for day in day_choices for time in time_choices], 3):
+            fixed_shift = FixedShift.objects.create(teacher=teacher, day=day, time=time, start_date=start_date, end_date=end_date)
+            generate_teacher_shifts(fixed_shift, day, time, start_date, end_date)
+
+    for i in range(student_count):
+        grade = rng.randint(1, 12)
+        student = Student.objects.create(last_name='生徒', first_name=f'{i}', grade=grade)
+        for day, time in rng.sample([(day, time) for day in day_choices for time in time_choices], lessons_per_student):
+            regular_lesson_admin = RegularLessonAdmin.objects.create(
+                student=student,
+                grade=grade,
+                subject=rng.choice(subject_choices),
+                day=day,
+                time=time,
+                start_date=start_date,
+                end_date=end_date,
+            )
+            generate_regular_lessons(regular_lesson_admin, day, time, start_date, end_date)
+
+    return start_date, end_date
+
+# 実行されたクエリ数を数える(CaptureQueriesContextは9000件で打ち切られるため)
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+def snapshot_shifts():
+    seats = defaultdict(dict)
+    for relation_id, seat_no, lesson_id in ShiftSeat.objects.values_list('relation_id', 'seat_no', 'lesson_id'):
+        seats[relation_id][seat_no] = lesson_id
+    return sorted(
+        (date, time, room, teacher_shift_id, *(seats[relation_id].get(seat_no) for seat_no in SEAT_NUMBERS))
+        for date, time, room, teacher_shift_id, relation_id in Shift.objects.values_list('date', 'time', 'room', 'teacher_shift_id', 'lessons_id')
+    )
@@ -1,14 +1,20 @@
 from datetime import timedelta
+from collections import defaultdict
 import datetime
 
+from django.db import transaction, IntegrityError
 from django.db.models import Case, When
 
 from accounts.models import CustomUser
-from shift.models import ShiftTemplate, Shift, ShiftLessonRelation
+from shift.models import ShiftTemplate, Shift, ShiftLessonRelation, ShiftSeat
+from shift.seats import create_seats, get_free_shift_seats, get_free_template_seats, fill_first_free_seat
 from regular_lesson.models import Lesson
-from special_lesson.models import SpecialLesson, SpecialLessonTeacherRequest
+from special_lesson.models import SpecialLesson
+from special_lesson.request_grid import provision_teacher_requests
 from teacher_shift.models import TeacherShift
 from year_schedule.models import Event
+from year_schedule.feeds import invalidate_calendar_feeds
+from year_schedule.month_schedule import invalidate_all_month_schedules
 from utils.choices import ROOM_CHOICES, TIME_CHOICES, SPECIAL_TIME_CHOICES
 
 def get_today():
@@ -16,210 +22,216 @@ def get_today():
     return datetime.date.today()
 
 
+# 開始日から終了日までの指定した曜日の日付を返す(休校日は除く)
+def get_weekly_dates(day, start_date, end_date, clousure_dates=()):
+    clousure_dates = set(clousure_dates)
+    # 月曜日が1に対応するため、dayから1を引く
+    first_date = start_date + timedelta(days=(int(day) - 1 - start_date.weekday()) % 7)
+    weeks = (end_date - first_date).days // 7 + 1 if first_date <= end_date else 0
+    return [
+        first_date + timedelta(weeks=i) for i in range(weeks)
+        if first_date + timedelta(weeks=i) not in clousure_dates
+    ]
+
+# 休校日を年度ごとにプロセス内でキャッシュする({年度の開始日: 休校日の集合})
+# Eventの保存・削除時にyear_schedule.signalsから破棄される
+_clousure_dates_cache = {}
+
+def get_fiscal_year_clousure_dates(input_date):
+    start_date, end_date = get_fiscal_year_boundaries(input_date)
+    clousure_dates = _clousure_dates_cache.get(start_date)
+    if clousure_dates is None:
+        clousure_dates = frozenset(Event.objects.filter(date__gte=start_date, date__lte=end_date, is_closure=True).values_list('date', flat=True))
+        _clousure_dates_cache[start_date] = clousure_dates
+    return clousure_dates
+
+def invalidate_clousure_dates():
+    _clousure_dates_cache.clear()
+
+def is_clousure_date(input_date):
+    return input_date in get_fiscal_year_clousure_dates(input_date)
+
+# 平日かつ休校日でない場合に授業がある
+def is_school_day(input_date):
+    return input_date.weekday() < 5 and not is_clousure_date(input_date)
+
+# 期間内の休校日
+def get_clousure_dates(start_date, end_date):
+    clousure_dates = set()
+    current_date = start_date
+    while current_date <= end_date:
+        _, fiscal_year_end = get_fiscal_year_boundaries(current_date)
+        clousure_dates.update(date for date in get_fiscal_year_clousure_dates(current_date) if start_date <= date <= end_date)
+        current_date = fiscal_year_end + timedelta(days=1)
+    return clousure_dates
+
+# 曜日と時間が一致するShiftTemplateを教室順に1クエリで取得する
+def get_shift_templates_for_slot(day, time, is_next_year):
+    room_choices = [room[0] for room in ROOM_CHOICES]
+    return list(
+        ShiftTemplate.objects.filter(
+            day=day,
+            time=time,
+            room__in=room_choices,
+            is_next_year=is_next_year,
+        ).select_related('lessons').order_by('room')
+    )
+
 # RegularLessonAdminに伴うLessonの作成及び、ShiftTemplateへの登録
 def generate_regular_lessons(regular_lesson_admin, day, time, start_date, end_date, is_next_year=False): # 来年度の場合のみTrue
-    clousure_dates = [obj.date for obj in Event.objects.filter(date__gte=start_date, date__lte=end_date, is_closure=True)]
-
     # gradeをLessonに反映
     grade = regular_lesson_admin.grade
 
-    current_date = start_date
-    # 曜日が一致した場合はその曜日しか作成しない
-    skip = False
-
-    while current_date <= end_date:
-        # 休校日の場合は授業を作成しない
-        if not current_date in clousure_dates:
-            # 曜日が一致する場合のみLessonインスタンスを作成
-            if current_date.weekday() == int(day) - 1:  # 月曜日が1に対応するため、dayから1を引きます
-                Lesson.objects.create(
-                    regular=regular_lesson_admin,
-                    student=regular_lesson_admin.student,
-                    grade=grade,
-                    subject=regular_lesson_admin.subject,
-                    date=current_date,
-                    time=time,
-                    is_regular=True,
-                )
-                # 7日進めてforloopを短縮
-                skip = True
-                current_date += timedelta(days=7)
-            else:
-                # 曜日が合わない場合は一日ずつ進める
-                current_date += timedelta(days=1)
-        else:
-            if skip:
-                current_date += timedelta(days=7)
-            else:
-                current_date += timedelta(days=1)
-
-    # ShiftTemplateに登録する処理
-    room_choices = [room[0] for room in ROOM_CHOICES]
-    regular_lesson_time_table_added = False
-    for room in room_choices:
-        obj = ShiftTemplate.objects.get(
-            day=day,
+    # 休校日を除いた授業日をまとめて作成
+    Lesson.objects.bulk_create([
+        Lesson(
+            regular=regular_lesson_admin,
+            student_id=regular_lesson_admin.student_id,
+            grade=grade,
+            subject=regular_lesson_admin.subject,
+            date=lesson_date,
             time=time,
-            room=room,
-            is_next_year=is_next_year
+            is_regular=True,
         )
-        if not regular_lesson_time_table_added:
-            for i in range(1, 5):
-                template_lesson = getattr(obj.lessons, f"template_lesson{i}")
-                if template_lesson is None:
-                    setattr(obj.lessons, f"template_lesson{i}", regular_lesson_admin)
-                    obj.lessons.save()
-                    regular_lesson_time_table_added = True
-                    break
-        else:
-            break
+        for lesson_date in get_weekly_dates(day, start_date, end_date, get_clousure_dates(start_date, end_date))
+    ])
+    invalidate_calendar_feeds('student', [regular_lesson_admin.student_id])
+    invalidate_all_month_schedules()
+
+    # ShiftTemplateに登録する処理(空いている最初の席に登録)
+    fill_first_free_seat(get_free_template_seats(day, time, is_next_year), regular_lesson_admin)
 
 # FixedShiftに伴うTeacherShiftの作成及び、ShiftTemplateへの登録
 def generate_teacher_shifts(fixed_shift, day, time, start_date, end_date, is_next_year=False):
-    clousure_dates = [obj.date for obj in Event.objects.filter(date__gte=start_date, date__lte=end_date, is_closure=True)]
-
-    current_date = start_date
-    # 曜日が一致した場合はその曜日しか作成しない
-    skip = False
-
-    while current_date <= end_date:
-        # 休校日の場合は授業を作成しない
-        if not current_date in clousure_dates:
-            # 曜日が一致する場合のみLessonインスタンスを作成
-            if current_date.weekday() == int(day) - 1:  # 月曜日が1に対応するため、dayから1を引きます
-                TeacherShift.objects.create(
-                    teacher=fixed_shift.teacher,
-                    fixed_shift=fixed_shift,
-                    date=current_date,
-                    time=time,
-                    is_fixed=True,
-                )
-                # 7日進めてforloopを短縮
-                skip = True
-                current_date += timedelta(days=7)
-            else:
-                # 曜日が合わない場合は一日ずつ進める
-                current_date += timedelta(days=1)
-        else:
-            if skip:
-                current_date += timedelta(days=7)
-            else:
-                current_date += timedelta(days=1)
-    
-    # ShiftTemplateを登録するための処理
-    room_choices = [room[0] for room in ROOM_CHOICES]
-    teacher_time_table_added = False
-    for room in room_choices:
-        obj = ShiftTemplate.objects.get(
-            day=day,
+    # 休校日を除いた出勤日をまとめて作成
+    TeacherShift.objects.bulk_create([
+        TeacherShift(
+            teacher_id=fixed_shift.teacher_id,
+            fixed_shift=fixed_shift,
+            date=shift_date,
             time=time,
-            room=room,
-            is_next_year=is_next_year,
+            is_fixed=True,
         )
-        if not teacher_time_table_added:
-            template_teacher = obj.fixed_shift
-            if template_teacher is None:
-                obj.fixed_shift = fixed_shift
-                obj.save()
-                teacher_time_table_added = True
-                break
-        else:
-            break
+        for shift_date in get_weekly_dates(day, start_date, end_date, get_clousure_dates(start_date, end_date))
+    ])
+    invalidate_calendar_feeds('teacher', [fixed_shift.teacher_id])
+
+    # ShiftTemplateを登録するための処理(講師が空いている最初の教室に登録)
+    for obj in get_shift_templates_for_slot(day, time, is_next_year):
+        if obj.fixed_shift_id is None:
+            obj.fixed_shift = fixed_shift
+            obj.save(update_fields=['fixed_shift'])
+            return
+
+# シフトテンプレートから複数日分のシフトを一括作成し、作成した日付を返す(シフトが既に存在する日付は対象外)
+# 授業と固定シフトはテーブルごとに1クエリで取得し、メモリ上で対応付けてbulk_createで保存する
+def bulk_create_shifts_from_templates(dates):
+    dates = sorted(set(dates))
+    existing_dates = set(Shift.objects.filter(date__in=dates).values_list('date', flat=True))
+    target_dates = [date for date in dates if date not in existing_dates]
+    if not target_dates:
+        return []
+
+    # 日付ごとに使用するテンプレートの(曜日, 来年度か)を決定
+    template_keys = {}
+    for date in target_dates:
+        # 年度末より前の場合は今年のテンプレート、それ以降の場合は来年度のテンプレートを使用
+        _, end_date = get_fiscal_year_boundaries(date)
+        template_keys[date] = (date.weekday() + 1, date > end_date)
+
+    shift_templates = defaultdict(list)
+    for shift_template in ShiftTemplate.objects.filter(
+        day__in={key[0] for key in template_keys.values()},
+        is_next_year__in={key[1] for key in template_keys.values()},
+    ).select_related('lessons').prefetch_related('lessons__seats').order_by('id'):
+        shift_templates[(shift_template.day, shift_template.is_next_year)].append(shift_template)
+
+    # 固定シフトを(固定シフトID, 日付)で引けるようにする
+    teacher_shifts = {}
+    for teacher_shift_id, fixed_shift_id, date in TeacherShift.objects.filter(
+        date__in=target_dates,
+        is_fixed=True,
+        fixed_shift__isnull=False,
+    ).order_by('id').values_list('id', 'fixed_shift_id', 'date'):
+        teacher_shifts.setdefault((fixed_shift_id, date), teacher_shift_id)
+
+    # 通常授業を(RegularLessonAdminのID, 日付)で引けるようにする
+    lessons = {}
+    for lesson_id, regular_id, date in Lesson.objects.filter(
+        date__in=target_dates,
+        is_regular=True,
+        is_rescheduled=False,
+        regular__isnull=False,
+    ).order_by('id').values_list('id', 'regular_id', 'date'):
+        lessons.setdefault((regular_id, date), lesson_id)
+
+    # 作成するシフトの(日付, 時間, 教室, 固定シフトID, {席番号: 授業ID})
+    rows = []
+    for date in target_dates:
+        for shift_template in shift_templates[template_keys[date]]:
+            template_seats = shift_template.lessons.seats.all() if shift_template.lessons else []
+            teacher_shift_id = teacher_shifts.get((shift_template.fixed_shift_id, date)) if shift_template.fixed_shift_id else None
+            rows.append((date, shift_template.time, shift_template.room, teacher_shift_id, {
+                seat.seat_no: lessons.get((seat.lesson_id, date))
+                for seat in template_seats
+                if seat.lesson_id
+            }))
+
+    # 同じ日付を同時に作成された場合は一意制約で失敗するため、授業・席ごと取り消し、
+    # 他のリクエストが作成した日付を除いて作り直す(作成できた日付を返す)
+    while target_dates:
+        try:
+            insert_shift_rows([row for row in rows if row[0] in target_dates])
+            return target_dates
+        except IntegrityError:
+            existing_dates = set(Shift.objects.filter(date__in=target_dates).values_list('date', flat=True))
+            if not existing_dates:
+                raise
+            target_dates = [date for date in target_dates if date not in existing_dates]
+    return []
+
+def insert_shift_rows(rows):
+    shift_lesson_relations = [ShiftLessonRelation() for _ in rows]
+    with transaction.atomic():
+        ShiftLessonRelation.objects.bulk_create(shift_lesson_relations)
+        create_seats(ShiftSeat, shift_lesson_relations, [seat_lessons for *_, seat_lessons in rows])
+        Shift.objects.bulk_create([
+            Shift(date=date, time=time, room=room, teacher_shift_id=teacher_shift_id, lessons=shift_lesson_relation)
+            for (date, time, room, teacher_shift_id, _), shift_lesson_relation in zip(rows, shift_lesson_relations)
+        ])
+
+# 複数日分のシフトを作成する(generate_shiftsの一括版)
+def generate_shifts_bulk(dates):
+    dates = sorted(set(dates))
+    # テンプレート外の授業・講師は作成した日付のみ復元する(既存のシフトに二重に登録しない)
+    for date in bulk_create_shifts_from_templates(dates):
+        restore_shifts(date)
+    for date in dates:
+        extend_special_shifts(date)
+    provision_special_lesson_teacher_requests(dates)
+
+# 講習期間に含まれる日付の全講師の希望調査をまとめて作成する
+def provision_special_lesson_teacher_requests(dates):
+    if not dates:
+        return
+    teacher_ids = list(CustomUser.objects.filter(is_teacher=True).values_list('id', flat=True))
+    for special_lesson in SpecialLesson.objects.filter(start_date__lte=dates[-1], end_date__gte=dates[0]):
+        session_dates = [date for date in dates if special_lesson.start_date <= date <= special_lesson.end_date]
+        if session_dates:
+            provision_teacher_requests(special_lesson, teacher_ids, session_dates)
 
 # 日付からその日のシフトオブジェクトを作成する(休校日の判別は含まない)(シフトが存在するかどうかの判別は含む)
 def generate_shifts(date):
+    generate_shifts_bulk([date])
 
-    # 月曜日を1として曜日を取得
-    day = date.weekday() + 1
-    
-    # 年度末を取得する
-    _, end_date = get_fiscal_year_boundaries(date)
-
-    # シフトが存在しない場合は作成
-    if not Shift.objects.filter(date=date).exists():
-
-        # 年度末より前の場合は今年のテンプレート、それ以降の場合は来年度のテンプレートを使用
-        if date <= end_date:
-            shift_templates = ShiftTemplate.objects.filter(day=day ,is_next_year=False)
-        else:
-            shift_templates = ShiftTemplate.objects.filter(day=day, is_next_year=True)
-
-        # シフトテンプレートからシフトを作成
-        for shift_template in shift_templates:
-            fixed_shift = shift_template.fixed_shift
-            room = shift_template.room
-            time = shift_template.time
-
-            # 固定シフトを取得
-            try:
-                teacher_shift = TeacherShift.objects.get(
-                    fixed_shift=fixed_shift,
-                    date=date,
-                    is_fixed=True,
-                )
-
-            except TeacherShift.DoesNotExist:
-                teacher_shift = None
-            
-            # 通常授業を取得
-            lessons = []
-            for i in range(1, 5):
-                regulr_lesson_admin = getattr(shift_template.lessons, f"template_lesson{i}")
-                try:
-                    lesson = Lesson.objects.get(
-                        regular=regulr_lesson_admin,
-                        is_regular=True,
-                        date=date,
-                        is_rescheduled=False,
-                    )
-                except Lesson.DoesNotExist:
-                    lesson = None
-                lessons.append(lesson)
-
-            # それを元にShiftオブジェクトを作成
-            obj = Shift.objects.create(
-                date=date,
-                time=time,
-                room=room,
-            )
-
-            # 中間モデルを作成
-            shift_lesson_relation = ShiftLessonRelation.objects.create(
-                lesson1=lessons[0],
-                lesson2=lessons[1],
-                lesson3=lessons[2],
-                lesson4=lessons[3],
-            )
-
-            obj.lessons = shift_lesson_relation
-            obj.teacher_shift=teacher_shift
-            obj.lessons=shift_lesson_relation
-            obj.save()
+# テンプレート外の授業・講師の復元
+def restore_shifts(date):
 
     # 削除した時に復元
     if Lesson.objects.filter(date=date, is_regular=False).exists():
         lessons = Lesson.objects.filter(date=date, is_regular=False)
         for lesson in lessons:
-            unregisterd_lesson = lesson
-            time = lesson.time
-            room_choices = [room[0] for room in ROOM_CHOICES]
-            lesson_added = False
-            for room in room_choices:
-                obj = Shift.objects.get(
-                    date=date,
-                    time=time,
-                    room=room,
-                )
-                if not lesson_added:
-                    for i in range(1, 5):
-                        lesson = getattr(obj.lessons, f"lesson{i}")
-                        if lesson is None:
-                            setattr(obj.lessons, f"lesson{i}", unregisterd_lesson)
-                            obj.lessons.save()
-                            lesson_added = True
-                            break
-                else:
-                    break
+            fill_first_free_seat(get_free_shift_seats(date, lesson.time), lesson)
     # 削除した時に復元    
     if TeacherShift.objects.filter(date=date, is_fixed=False).exists():
         teacher_shifts = TeacherShift.objects.filter(date=date, is_fixed=False)
@@ -244,10 +256,10 @@ def generate_shifts(date):
                 else:
                     break
 
-    # 講習授業の対象日の場合
+# 講習授業の対象日で拡張が有効な場合に講習用の時間のシフトを作成する(作成済みの場合は何もしない)
+def extend_special_shifts(date):
     if SpecialLesson.objects.filter(start_date__lte=date, end_date__gte=date).exists():
         special_lesson = SpecialLesson.objects.get(start_date__lte=date, end_date__gte=date)
-        teachers = CustomUser.objects.filter(is_teacher=True)
 
         # 授業の拡張が有効でそれらのまだ授業が存在していない場合に授業を作成
         if special_lesson.is_extend and len(Shift.objects.filter(date=date)) == len(ROOM_CHOICES) * len(TIME_CHOICES):
@@ -262,28 +274,10 @@ def generate_shifts(date):
                         time=time,
                     )
                     shift_lesson_relation = ShiftLessonRelation.objects.create()
+                    create_seats(ShiftSeat, [shift_lesson_relation])
                     obj.lessons = shift_lesson_relation
                     obj.save()
 
-        for teacher in teachers:
-
-            # 講師の希望オブジェクトが存在しない場合に新規作成(SpecialLessonモデルにのみ依存するため、存在の確認のみで良い)
-            if not SpecialLessonTeacherRequest.objects.filter(teacher=teacher, date=date, special_lesson=special_lesson).exists():
-
-                # 拡張の場合
-                if special_lesson.is_extend:
-                    time_choices = [time[0] for time in TIME_CHOICES] + [time[0] for time in SPECIAL_TIME_CHOICES]
-                else:
-                    time_choices = [time[0] for time in TIME_CHOICES]
-
-                for time in time_choices:
-                    SpecialLessonTeacherRequest.objects.create(
-                        teacher=teacher,
-                        special_lesson=special_lesson,
-                        date=date,
-                        time=time
-                    )
-
 # Mixinからheplaer関数に移動
 def get_fiscal_year_boundaries(input_date):
     year = input_date.year
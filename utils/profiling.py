@@ -0,0 +1,125 @@
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# IN句のプレースホルダの数が異なるだけのSQLは同じSQLとして扱う
+IN_PLACEHOLDERS = re.compile(r'IN \((?:%s, )*%s\)')
+# ログと集計に残すSQLの長さ
+SQL_DISPLAY_LENGTH = 500
+
+def normalize_sql(sql):
+    return IN_PLACEHOLDERS.sub('IN (...)', sql)
+
+# 1リクエスト内で実行されたSQLの件数と時間
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.db_seconds = 0
+        self.slowest_sql = ''
+        self.slowest_seconds = 0
+        # {正規化したSQL: 実行回数}
+        self.templates = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - started
+            self.count += 1
+            self.db_seconds += seconds
+            self.templates[normalize_sql(sql)] += 1
+            if seconds > self.slowest_seconds:
+                self.slowest_seconds = seconds
+                self.slowest_sql = sql
+
+    # 同じSQLがthreshold回を超えて実行されたもの(N+1の疑い)
+    def repeated_queries(self, threshold):
+        return [(sql, count) for sql, count in self.templates.most_common() if count > threshold]
+
+# view_nameごとの集計(プロセス内で保持し、再起動でリセットされる)
+_view_stats = {}
+_view_stats_lock = threading.Lock()
+
+def record_view_stats(view_name, profile):
+    with _view_stats_lock:
+        stats = _view_stats.setdefault(view_name, {
+            'view_name': view_name,
+            'requests': 0,
+            'wall_ms': 0,
+            'max_wall_ms': 0,
+            'queries': 0,
+            'max_queries': 0,
+            'db_ms': 0,
+            'n_plus_one': 0,
+            'slowest_sql': '',
+            'slowest_sql_ms': 0,
+        })
+        stats['requests'] += 1
+        stats['wall_ms'] += profile['wall_ms']
+        stats['max_wall_ms'] = max(stats['max_wall_ms'], profile['wall_ms'])
+        stats['queries'] += profile['queries']
+        stats['max_queries'] = max(stats['max_queries'], profile['queries'])
+        stats['db_ms'] += profile['db_ms']
+        if profile['repeated_queries']:
+            stats['n_plus_one'] += 1
+        if profile['slowest_sql_ms'] > stats['slowest_sql_ms']:
+            stats['slowest_sql'] = profile['slowest_sql']
+            stats['slowest_sql_ms'] = profile['slowest_sql_ms']
+
+# 合計時間の長い順に平均値を付けて返す
+def get_view_stats():
+    with _view_stats_lock:
+        rows = [dict(stats) for stats in _view_stats.values()]
+    for row in rows:
+        row['avg_wall_ms'] = row['wall_ms'] / row['requests']
+        row['avg_queries'] = row['queries'] / row['requests']
+        row['avg_db_ms'] = row['db_ms'] / row['requests']
+    return sorted(rows, key=lambda row: row['wall_ms'], reverse=True)
+
+def reset_view_stats():
+    with _view_stats_lock:
+        _view_stats.clear()
+
+# PROFILING_SAMPLE_RATEの割合のリクエストについてSQLの件数・DB時間・最も遅いSQL・処理時間を記録する
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        wall_seconds = time.perf_counter() - started
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        view_name = resolver_match.view_name if resolver_match else '(unresolved)'
+        repeated = recorder.repeated_queries(settings.PROFILING_N_PLUS_ONE_THRESHOLD)
+        profile = {
+            'view_name': view_name,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'wall_ms': round(wall_seconds * 1000, 2),
+            'queries': recorder.count,
+            'db_ms': round(recorder.db_seconds * 1000, 2),
+            'slowest_sql_ms': round(recorder.slowest_seconds * 1000, 2),
+            'slowest_sql': recorder.slowest_sql[:SQL_DISPLAY_LENGTH],
+            'repeated_queries': [{'sql': sql[:SQL_DISPLAY_LENGTH], 'count': count} for sql, count in repeated[:3]],
+        }
+        record_view_stats(view_name, profile)
+        logger.log(logging.WARNING if repeated else logging.INFO, json.dumps(profile, ensure_ascii=False))
+        return response
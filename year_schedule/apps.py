@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class YearScheduleConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'year_schedule'
+
+    def ready(self):
+        from . import signals
@@ -0,0 +1,109 @@
+import hashlib
+import json
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+
+from .models import Event
+from regular_lesson.models import Lesson
+from teacher_shift.models import TeacherShift
+from utils.choices import SPECIAL_TIME_CHOICES, TIME_CHOICES, SUBJECT_CHOICES
+
+# 生徒・講師ごとの年間カレンダーのイベント(FullCalendar形式のJSON)を年度ごとにキャッシュする
+# Lesson・TeacherShiftの変更は本人のバージョン、Eventの変更は全体のバージョンを上げて破棄する
+CALENDAR_FEED_CACHE_TIMEOUT = 60 * 60 * 24
+EVENT_VERSION_KEY = 'calendar_feed:event_version'
+
+TIME_DISPLAY = dict(SPECIAL_TIME_CHOICES + TIME_CHOICES)
+SUBJECT_DISPLAY = dict(SUBJECT_CHOICES)
+
+def get_owner_version_key(kind, owner_id):
+    return f'calendar_feed:{kind}:{owner_id}:version'
+
+def get_calendar_feed_cache_key(kind, owner_id, start_date, event_version, owner_version):
+    return f'calendar_feed:{kind}:{owner_id}:{start_date.isoformat()}:{event_version}:{owner_version}'
+
+def get_events(start_date, end_date):
+    return Event.objects.filter(date__gte=start_date, date__lte=end_date).order_by('date', 'id')
+
+def serialize_event(event):
+    start = datetime.combine(event.date, time.min).isoformat()
+    end = (datetime.combine(event.date, time.min) + timedelta(minutes=1)).isoformat()
+    return {
+        'title': event.title,
+        'start': start,
+        'end': end,
+        'allDay': 'true',
+        'color': 'red',
+    }
+
+# 生徒の年間予定(非表示の予定を除く)と授業
+def build_student_feed(student_id, start_date, end_date):
+    events = [
+        serialize_event(event)
+        for event in get_events(start_date, end_date).exclude(hidden=student_id).only('title', 'date')
+    ]
+
+    lessons = Lesson.objects.filter(date__gte=start_date, date__lte=end_date, student_id=student_id).exclude(time=None).order_by('date', 'time')
+    for lesson_date, lesson_time, subject in lessons.values_list('date', 'time', 'subject'):
+        start_time, end_time = TIME_DISPLAY[lesson_time].split('-')
+        events.append({
+            'title': f'{start_time}-{end_time} {SUBJECT_DISPLAY.get(subject, "")}',
+            'start': f'{lesson_date}T{start_time}',
+            'end': f'{lesson_date}T{end_time}',
+            'allDay': 'false',
+            'backgroundColor': 'transparent',
+            'borderColor': 'transparent',
+        })
+    return events
+
+# 講師の年間予定と出勤
+def build_teacher_feed(teacher_id, start_date, end_date):
+    events = [serialize_event(event) for event in get_events(start_date, end_date).only('title', 'date')]
+
+    teacher_shifts = TeacherShift.objects.filter(date__gte=start_date, date__lte=end_date, teacher_id=teacher_id).exclude(time=None).order_by('date', 'time')
+    for shift_date, shift_time in teacher_shifts.values_list('date', 'time'):
+        start_time, end_time = TIME_DISPLAY[shift_time].split('-')
+        events.append({
+            'title': f'{start_time}-{end_time}',
+            'start': f'{shift_date}T{start_time}:00',
+            'end': f'{shift_date}T{end_time}:00',
+            'allDay': 'false',
+            'backgroundColor': 'transparent',
+            'borderColor': 'transparent',
+        })
+    return events
+
+FEED_BUILDERS = {
+    'student': build_student_feed,
+    'teacher': build_teacher_feed,
+}
+
+# (ETag, JSON文字列)を返す
+def get_calendar_feed(kind, owner_id, start_date, end_date):
+    owner_version_key = get_owner_version_key(kind, owner_id)
+    versions = cache.get_many([EVENT_VERSION_KEY, owner_version_key])
+    key = get_calendar_feed_cache_key(kind, owner_id, start_date, versions.get(EVENT_VERSION_KEY, 0), versions.get(owner_version_key, 0))
+
+    feed = cache.get(key)
+    if feed is None:
+        body = json.dumps(FEED_BUILDERS[kind](owner_id, start_date, end_date), ensure_ascii=False)
+        feed = (f'"{hashlib.md5(body.encode()).hexdigest()}"', body)
+        cache.set(key, feed, CALENDAR_FEED_CACHE_TIMEOUT)
+    return feed
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+# 生徒('student')・講師('teacher')のキャッシュを破棄する(bulk_createなどシグナルが送られない処理から呼ぶ)
+def invalidate_calendar_feeds(kind, owner_ids):
+    for owner_id in set(owner_ids):
+        if owner_id is not None:
+            bump_version(get_owner_version_key(kind, owner_id))
+
+# 全員のキャッシュを破棄する
+def invalidate_all_calendar_feeds():
+    bump_version(EVENT_VERSION_KEY)
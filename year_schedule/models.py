@@ -13,4 +13,10 @@ class Event(models.Model):
 
     def __str__(self):
         return f'{self.date} - {self.title}'
+
+    class Meta:
+        indexes = [
+            # 休校日の取得(件数が少ないため部分インデックス)
+            models.Index(fields=['date'], condition=models.Q(is_closure=True), name='event_closure_date_idx'),
+        ]
         
\ No newline at end of file
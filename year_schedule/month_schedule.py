@@ -0,0 +1,94 @@
+import calendar
+import json
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+
+from django.core.cache import cache
+
+from .feeds import TIME_DISPLAY, SUBJECT_DISPLAY, bump_version
+from .models import Event
+from regular_lesson.models import Lesson
+from students.models import Student
+
+# 全生徒の月間予定表(印刷用)のJSONを(年, 月)ごとにキャッシュする
+# 授業・予定の変更はその月のバージョン、生徒の変更やbulk_createは全体のバージョンを上げて破棄する
+MONTH_SCHEDULE_CACHE_TIMEOUT = 60 * 60 * 24
+MONTH_SCHEDULE_VERSION_KEY = 'month_schedule:version'
+
+def get_month_version_key(year, month):
+    return f'month_schedule:{year}:{month}:version'
+
+def get_month_schedule_cache_key(year, month, version, month_version):
+    return f'month_schedule:{year}:{month}:{version}:{month_version}'
+
+def get_month_boundaries(year, month):
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+# 生徒ごとのJSONを順番に返す(全生徒分の辞書をまとめて作らない)
+def iter_month_schedule_json(year, month):
+    start_date_of_month, end_date_of_month = get_month_boundaries(year, month)
+    students = Student.objects.filter(is_on_leave=False, is_withdrawn=False).order_by('id').values_list('id', 'last_name', 'first_name')
+
+    # 全体イベントは非表示の生徒と合わせて1回で取得
+    events = []
+    for event in Event.objects.filter(date__gte=start_date_of_month, date__lte=end_date_of_month).order_by('date', 'id').prefetch_related('hidden'):
+        start = datetime.combine(event.date, time.min).isoformat()
+        end = (datetime.combine(event.date, time.min) + timedelta(minutes=1)).isoformat()
+        events.append(({student.id for student in event.hidden.all()}, {
+            'title': event.title,
+            'start': start,
+            'end': end,
+            'allDay': 'false',
+            'backgroundColor': 'transparent',
+            'borderColor': 'transparent',
+            'textColor': 'red',
+        }))
+
+    # 全生徒の授業を1回で取得して生徒ごとにまとめる
+    lessons = defaultdict(list)
+    lesson_rows = (
+        Lesson.objects.filter(date__gte=start_date_of_month, date__lte=end_date_of_month, student__isnull=False)
+        .exclude(time=None).order_by('date', 'time').values_list('student_id', 'date', 'time', 'subject')
+    )
+    for student_id, lesson_date, lesson_time, subject in lesson_rows:
+        start_time, end_time = TIME_DISPLAY[lesson_time].split('-')
+        lessons[student_id].append({
+            'title': f'{start_time}-{end_time} {SUBJECT_DISPLAY.get(subject, "")}',
+            'start': f'{lesson_date}T{start_time}:00',
+            'end': f'{lesson_date}T{end_time}:00',
+            'allDay': 'false',
+            'backgroundColor': 'transparent',
+            'borderColor': 'transparent',
+            'textColor': 'black',
+        })
+
+    yield '['
+    for i, (student_id, last_name, first_name) in enumerate(students):
+        obj = {
+            'student': f'{last_name} {first_name}',
+            'events': [event for hidden, event in events if student_id not in hidden] + lessons[student_id],
+        }
+        yield (', ' if i else '') + json.dumps(obj)
+    yield ']'
+
+def compile_month_schedule(year, month):
+    versions = cache.get_many([MONTH_SCHEDULE_VERSION_KEY, get_month_version_key(year, month)])
+    key = get_month_schedule_cache_key(year, month, versions.get(MONTH_SCHEDULE_VERSION_KEY, 0), versions.get(get_month_version_key(year, month), 0))
+
+    json_str = cache.get(key)
+    if json_str is None:
+        json_str = ''.join(iter_month_schedule_json(year, month))
+        cache.set(key, json_str, MONTH_SCHEDULE_CACHE_TIMEOUT)
+    return json_str
+
+# 日付を含む月のキャッシュを破棄する
+def invalidate_month_schedule(target_date):
+    # 保存直後のインスタンスは日付が文字列のままの場合がある
+    if isinstance(target_date, str):
+        target_date = date.fromisoformat(target_date)
+    if target_date is not None:
+        bump_version(get_month_version_key(target_date.year, target_date.month))
+
+# 全ての月のキャッシュを破棄する
+def invalidate_all_month_schedules():
+    bump_version(MONTH_SCHEDULE_VERSION_KEY)
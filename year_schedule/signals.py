@@ -0,0 +1,49 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import Event
+from .feeds import invalidate_calendar_feeds, invalidate_all_calendar_feeds
+from .month_schedule import invalidate_month_schedule, invalidate_all_month_schedules
+from regular_lesson.models import Lesson
+from students.models import Student
+from teacher_shift.models import TeacherShift
+from utils.helpers import invalidate_clousure_dates
+
+# 予定が変更された場合は休校日のキャッシュを破棄する
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def clear_clousure_dates(sender, **kwargs):
+    invalidate_clousure_dates()
+
+# 予定(非表示の生徒を含む)が変更された場合は全員の年間カレンダーのキャッシュを破棄する
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(m2m_changed, sender=Event.hidden.through)
+def clear_all_calendar_feeds(sender, **kwargs):
+    invalidate_all_calendar_feeds()
+
+# 授業・出勤が変更された場合は本人の年間カレンダーのキャッシュを破棄する
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def clear_student_calendar_feed(sender, instance, **kwargs):
+    invalidate_calendar_feeds('student', [instance.student_id])
+
+@receiver(post_save, sender=TeacherShift)
+@receiver(post_delete, sender=TeacherShift)
+def clear_teacher_calendar_feed(sender, instance, **kwargs):
+    invalidate_calendar_feeds('teacher', [instance.teacher_id])
+
+# 授業・予定が変更された場合はその月の月間予定表のキャッシュを破棄する
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def clear_month_schedule(sender, instance, **kwargs):
+    invalidate_month_schedule(instance.date)
+
+# 生徒や予定の非表示が変更された場合は全ての月のキャッシュを破棄する
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+@receiver(m2m_changed, sender=Event.hidden.through)
+def clear_all_month_schedules(sender, **kwargs):
+    invalidate_all_month_schedules()
@@ -1,3 +1,129 @@
+import json
+from datetime import date
+
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.management.commands.createusers import create_owner
+from accounts.models import CustomUser, ParentProfile
+from regular_lesson.models import Lesson
+from students.models import Student
+from year_schedule.models import Event
+from year_schedule.month_schedule import compile_month_schedule
+from utils.helpers import get_clousure_dates, invalidate_clousure_dates, is_clousure_date, is_school_day, get_fiscal_year_boundaries, get_today
+
+class ClousureDatesTests(TestCase):
+    def setUp(self):
+        invalidate_clousure_dates()
+        self.addCleanup(invalidate_clousure_dates)
+        create_owner('owner', '塾長', '太郎')
+        self.owner = CustomUser.objects.get(is_owner=True)
+        Event.objects.create(title='休校', date=date(2024, 5, 1), is_closure=True)
+        Event.objects.create(title='休校', date=date(2025, 3, 3), is_closure=True)
+
+    def test_cached_per_fiscal_year(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(is_clousure_date(date(2024, 5, 1)))
+            self.assertFalse(is_school_day(date(2024, 5, 1)))
+            self.assertTrue(is_school_day(date(2024, 5, 2)))
+            # 土曜日
+            self.assertFalse(is_school_day(date(2024, 5, 4)))
+        self.assertEqual(len(queries), 1)
+
+        # 年度をまたぐ期間
+        self.assertEqual(get_clousure_dates(date(2024, 4, 1), date(2025, 3, 31)), {date(2024, 5, 1), date(2025, 3, 3)})
+
+    def test_invalidated_by_event_views(self):
+        self.assertTrue(is_school_day(date(2024, 5, 2)))
+        self.client.force_login(self.owner)
+
+        json_data = {'dates': ['2024-05-02'], 'title': '休校', 'is_closure': True}
+        self.client.post(reverse('owner:year_schedule_add'), {'json_data': json.dumps(json_data)})
+        self.assertFalse(is_school_day(date(2024, 5, 2)))
+
+        event = Event.objects.get(date=date(2024, 5, 2))
+        self.client.post(reverse('owner:year_schedule_delete'), {'event_id': event.id})
+        self.assertTrue(is_school_day(date(2024, 5, 2)))
+
+class CalendarFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.start_date, _ = get_fiscal_year_boundaries(get_today())
+        self.student = Student.objects.create(last_name='生徒', first_name='一郎')
+        self.parent = CustomUser.objects.create(username='parent', is_parent=True)
+        ParentProfile.objects.create(user=self.parent, current_student=self.student).student.add(self.student)
+        Lesson.objects.create(student=self.student, subject=2, date=self.start_date, time=1)
+        self.url = reverse('parent:calendar_feed', kwargs={'pk': self.student.id})
+        self.client.force_login(self.parent)
+
+    def test_feed_is_cached_and_supports_etag(self):
+        self.assertContains(self.client.get(reverse('parent:dashboard', kwargs={'pk': self.student.id})), self.url)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.json(), [{
+            'title': '16:30-17:30 数学',
+            'start': f'{self.start_date}T16:30',
+            'end': f'{self.start_date}T17:30',
+            'allDay': 'false',
+            'backgroundColor': 'transparent',
+            'borderColor': 'transparent',
+        }])
+
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertFalse([query for query in queries if 'regular_lesson_lesson' in query['sql']])
+
+    def test_invalidated_by_lesson_and_event(self):
+        etag = self.client.get(self.url)['ETag']
+
+        Lesson.objects.create(student=self.student, subject=3, date=self.start_date, time=2)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, len(response.json())), (200, 2))
+
+        event = Event.objects.create(title='夏祭り', date=self.start_date)
+        self.assertEqual(len(self.client.get(self.url).json()), 3)
+
+        event.hidden.add(self.student)
+        self.assertEqual(len(self.client.get(self.url).json()), 2)
+
+class MonthScheduleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def create_student(self, i):
+        student = Student.objects.create(last_name='生徒', first_name=f'{i}')
+        Lesson.objects.create(student=student, subject=1, date=date(2024, 6, 3), time=1)
+        return student
+
+    def test_events_and_lessons_per_student(self):
+        students = [self.create_student(i) for i in range(2)]
+        Event.objects.create(title='夏祭り', date=date(2024, 6, 10)).hidden.add(students[1])
+        # 別の月の予定は含めない
+        Event.objects.create(title='休校', date=date(2024, 7, 1), is_closure=True)
+
+        schedule = json.loads(compile_month_schedule(2024, 6))
+
+        self.assertEqual([obj['student'] for obj in schedule], ['生徒 0', '生徒 1'])
+        self.assertEqual([event['title'] for event in schedule[0]['events']], ['夏祭り', '16:30-17:30 国語'])
+        self.assertEqual([event['title'] for event in schedule[1]['events']], ['16:30-17:30 国語'])
+
+    def test_query_count_does_not_depend_on_students_and_cached(self):
+        self.create_student(0)
+        Event.objects.create(title='夏祭り', date=date(2024, 6, 10))
+        with CaptureQueriesContext(connection) as queries:
+            compile_month_schedule(2024, 6)
+        single = len(queries)
+
+        for i in range(1, 6):
+            self.create_student(i)
+        with CaptureQueriesContext(connection) as queries:
+            compile_month_schedule(2024, 6)
+        self.assertEqual(len(queries), single)
 
-# Create your tests here.
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(json.loads(compile_month_schedule(2024, 6))), 6)
+        self.assertEqual(len(queries), 0)
@@ -1,23 +1,22 @@
-from datetime import date, time, timedelta, datetime
-import calendar
+from datetime import timedelta
 import json
 
 from django.utils.decorators import method_decorator
 from django.views.generic import View, TemplateView
 from django.utils.dateparse import parse_datetime
-from django.http import JsonResponse, HttpResponseRedirect
-from django.urls import reverse_lazy
+from django.http import JsonResponse, HttpResponse, HttpResponseNotModified, HttpResponseRedirect
+from django.urls import reverse, reverse_lazy
 from django.contrib import messages
 
 from accounts.decorators import user_type_required
 from .models import Event
+from .feeds import get_calendar_feed
+from .month_schedule import compile_month_schedule, get_month_boundaries
 from .forms import PrintMonthScheduleForm
-from students.models import Student
 from regular_lesson.models import Lesson, RegularLessonAdmin
 from special_lesson.models import SpecialLessonAdmin, SpecialLesson
-from teacher_shift.models import TemporalyShift, TeacherShift
+from teacher_shift.models import TemporalyShift
 from shift.models import Shift
-from utils.mixins import FiscalYearMixin
 from utils.helpers import get_today, generate_shifts, get_fiscal_year_boundaries
 
 @method_decorator(user_type_required(), name='dispatch')
@@ -62,81 +61,47 @@ class TeacherYearScheduleView(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        teacher = self.request.user
-
-        today = get_today()
-        start_date, end_date = get_fiscal_year_boundaries(today)
-        teacher_shifts = TeacherShift.objects.filter(date__gte=start_date, date__lte=end_date, teacher=teacher)
-
-        events = []
-        for event in Event.objects.filter(date__gte=start_date, date__lte=end_date):
-            start = datetime.combine(event.date, time.min).isoformat()
-            end = (datetime.combine(event.date, time.min) + timedelta(minutes=1)).isoformat()
-            events.append({
-                'title': event.title,
-                'start': start,
-                'end': end,
-                'allDay': 'true',
-                'color': 'red',
-            })
-            
-        for teacher_shift in teacher_shifts:
-            shift_time = teacher_shift.get_time_display()
-            start_time, end_time = shift_time.split('-')
-            start = f"{teacher_shift.date}T{start_time}:00"
-            end = f"{teacher_shift.date}T{end_time}:00"
-            title = f'{start_time}-{end_time}'
-            events.append({
-                'title': title,
-                'start': start,
-                'end': end,
-                'allDay': 'false',
-                'backgroundColor': 'transparent',
-                'borderColor': 'transparent',
-            })
-
-        context['events'] = events
+        context['feed_url'] = reverse('teacher:calendar_feed')
         return context
 
 @method_decorator(user_type_required(), name='dispatch')
-class ParentYearScheduleView(FiscalYearMixin, TemplateView):
+class ParentYearScheduleView(TemplateView):
     template_name = 'parent/schedule_calendar.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        pk = self.kwargs['pk']
-        today = get_today()
-        start_date, end_date = get_fiscal_year_boundaries(today)
-        student = Student.objects.get(pk=self.request.user.parent_profile.current_student.pk)
-        lessons = Lesson.objects.filter(date__gte=start_date, date__lte=end_date, student=student)
-        
-        events = []
-        for event in Event.objects.exclude(hidden=student):
-            start = datetime.combine(event.date, time.min).isoformat()
-            end = (datetime.combine(event.date, time.min) + timedelta(minutes=1)).isoformat()
-            events.append({
-                'title': event.title,
-                'start': start,
-                'end': end,
-                'allDay': 'true',
-                'color': 'red',
-            })
+        context['feed_url'] = reverse('parent:calendar_feed', kwargs={'pk': self.kwargs['pk']})
+        return context
 
-        for lesson in lessons:
-            start_time, end_time = lesson.get_time_display().split('-')
-            start_datetime = f"{lesson.date}T{start_time}"
-            end_datetime = f"{lesson.date}T{end_time}"
-            events.append({
-                'title': f'{start_time}-{end_time} {lesson.get_subject_display()}',
-                'start': start_datetime,
-                'end': end_datetime,
-                'allDay': 'false',
-                'backgroundColor': 'transparent',
-                'borderColor': 'transparent',
-            })
+# 今年度の年間カレンダーのイベントをキャッシュから返す(If-None-Matchが一致する場合は304)
+# owner_kwargを指定しない場合はログイン中のユーザーのカレンダー
+class CalendarFeedView(View):
+    kind = None
+    owner_kwarg = None
+
+    def get(self, request, *args, **kwargs):
+        start_date, end_date = get_fiscal_year_boundaries(get_today())
+        owner_id = self.kwargs[self.owner_kwarg] if self.owner_kwarg else request.user.id
+        etag, body = get_calendar_feed(self.kind, owner_id, start_date, end_date)
+
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        # ブラウザには毎回ETagで確認させる
+        response['Cache-Control'] = 'private, no-cache'
+        return response
 
-        context['events'] = events
-        return context
+@method_decorator(user_type_required(), name='dispatch')
+class TeacherCalendarFeedView(CalendarFeedView):
+    kind = 'teacher'
+
+@method_decorator(user_type_required(), name='dispatch')
+class ParentCalendarFeedView(CalendarFeedView):
+    kind = 'student'
+    # user_type_requiredで現在の生徒と一致することを確認済み
+    owner_kwarg = 'pk'
 
 @method_decorator(user_type_required(), name='dispatch')
 class EventCreateView(View):
@@ -220,50 +185,9 @@ class PrintMonthScheduleView(TemplateView):
         context = super().get_context_data(**kwargs)
         year = self.kwargs['year']
         month = self.kwargs['month']
-        start_date_of_month = date(year, month, 1)
-        end_date_of_month = date(year, month, calendar.monthrange(year, month)[1])
-        students = Student.objects.filter(is_on_leave=False, is_withdrawn=False)
-        all_events = []
-        for student in students:
-            lessons = Lesson.objects.filter(date__gte=start_date_of_month, date__lte=end_date_of_month, student=student)
-            obj = {}
-            events = []
-
-            # 全体イベント
-            for event in Event.objects.exclude(hidden=student):
-                start = datetime.combine(event.date, time.min).isoformat()
-                end = (datetime.combine(event.date, time.min) + timedelta(minutes=1)).isoformat()
-                print(start, end)
-                events.append({
-                    'title': event.title,
-                    'start': start,
-                    'end': end,
-                    'allDay': 'false',
-                    'backgroundColor': 'transparent',
-                    'borderColor': 'transparent',
-                    'textColor': 'red',
-                })
-
-            for lesson in lessons:
-                start_time, end_time = lesson.get_time_display().split('-')
-                start = f"{lesson.date}T{start_time}:00"
-                end = f"{lesson.date}T{end_time}:00"
-                print(start, end)
-                events.append({
-                    'title': f'{start_time}-{end_time} {lesson.get_subject_display()}',
-                    'start': start,
-                    'end': end,
-                    'allDay': 'false',
-                    'backgroundColor': 'transparent',
-                    'borderColor': 'transparent',
-                    'textColor': 'black',
-                })
-
-            obj['student'] = f'{student.last_name} {student.first_name}'
-            obj['events'] = events
-            all_events.append(obj)
-            
-        context['json_str'] = json.dumps(all_events)
+        start_date_of_month, end_date_of_month = get_month_boundaries(year, month)
+        # 全生徒分をまとめて作成し、(年, 月)ごとにキャッシュする
+        context['json_str'] = compile_month_schedule(year, month)
         context['year'] = year
         context['month'] = month
         context['start_date'] = start_date_of_month.strftime('%Y-%m-%d')